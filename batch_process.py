@@ -0,0 +1,103 @@
+import argparse
+from src.pipeline.batch_runner import available_cores, expand_video_paths, process_videos
+from src.pipeline.segment_runner import process_video_segmented
+from src.data.storage import BACKENDS, close_shared_storage
+
+
+def parse_size(value):
+    """Converte "960x540" in (960, 540)."""
+    try:
+        width, height = value.lower().split("x")
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Dimensione non valida: {value} (formato LARGHEZZAxALTEZZA)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SafeDrive headless: elabora uno o più video senza GUI.")
+    parser.add_argument("videos", nargs="+", help="File video o pattern glob (es. 'assets/*.mp4')")
+    parser.add_argument("-o", "--output-dir", default="output", help="Cartella per i log JSONL e i riepiloghi")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help=f"Processi in parallelo (default: core disponibili = {available_cores()})")
+    parser.add_argument("--model", default="yolov8s.pt", help="Modello YOLO")
+    parser.add_argument("--stride", type=int, default=1, help="Elabora un frame ogni N")
+    parser.add_argument("--target-size", type=parse_size, default=None, help="Riduce i frame, es. 960x540")
+    parser.add_argument("--no-ocr", action="store_true", help="Disattiva il riconoscimento targhe")
+    parser.add_argument("--no-prefetch", action="store_true", help="Decodifica sincrona nel loop principale")
+    parser.add_argument("--max-frames-lost", type=int, default=15,
+                        help="Frame senza detection prima di considerare persa una traccia (default: 15)")
+    parser.add_argument("--ocr-workers", type=int, default=0,
+                        help="Processi OCR per ogni video (default: 0 = un thread nel processo del video)")
+    parser.add_argument("--plate-localizer", choices=("none", "contour", "dnn"), default="none",
+                        help="Localizzazione della targa prima dell'OCR (default: none = intero veicolo)")
+    parser.add_argument("--plate-model", default=None, help="Modello ONNX per --plate-localizer dnn")
+    parser.add_argument("--storage", choices=BACKENDS, default="auto",
+                        help="Dove salvare le targhe: auto = MongoDB se raggiungibile, altrimenti SQLite")
+    parser.add_argument("--sqlite-path", default="tracking.db", help="File SQLite (default: tracking.db)")
+    parser.add_argument("--journal", action="store_true",
+                        help="Salva traiettorie per frame ed eventi in <output>/<nome>.journal (analisi senza YOLO)")
+    parser.add_argument("--record", choices=("continuous", "clips"), default=None,
+                        help="Salva il video annotato in <output>/<nome>.annotated.mp4 (clips: solo attorno ai DANGER)")
+    parser.add_argument("--record-every", type=int, default=1, help="Registra un frame ogni N (default: 1)")
+    parser.add_argument("--record-size", type=parse_size, default=(1280, 720),
+                        help="Dimensione del video registrato (default: 1280x720)")
+    parser.add_argument("--segments", type=int, default=None,
+                        help="Divide OGNI video in N segmenti elaborati in parallelo (video lunghi)")
+    parser.add_argument("--overlap", type=float, default=2.0,
+                        help="Secondi di sovrapposizione tra segmenti per ricucire gli ID (default: 2)")
+    args = parser.parse_args()
+    if args.plate_localizer == "dnn" and not args.plate_model:
+        parser.error("--plate-localizer dnn richiede --plate-model")
+    if args.journal and args.segments:
+        parser.error("--journal non è supportato con --segments")
+    if args.record and args.segments:
+        parser.error("--record non è supportato con --segments")
+
+    video_paths = expand_video_paths(args.videos)
+    if not video_paths:
+        parser.error("Nessun video trovato")
+
+    options = dict(
+        model_name=args.model,
+        enable_ocr=not args.no_ocr,
+        frame_stride=args.stride,
+        target_size=args.target_size,
+        prefetch=not args.no_prefetch,
+        max_frames_lost=args.max_frames_lost,
+        ocr_workers=args.ocr_workers,
+        plate_localizer=args.plate_localizer,
+        plate_model=args.plate_model,
+        storage_backend=args.storage,
+        sqlite_path=args.sqlite_path,
+    )
+    if args.journal:
+        options["journal"] = True
+    if args.record:
+        options.update(record=args.record, record_every=args.record_every, record_size=args.record_size)
+
+    if args.segments:
+        # Un file alla volta, ma ciascuno diviso in segmenti paralleli
+        summaries = []
+        for path in video_paths:
+            try:
+                summaries.append(process_video_segmented(path, args.output_dir, segments=args.segments,
+                                                         overlap_seconds=args.overlap,
+                                                         workers=args.workers, **options))
+            except Exception as e:
+                print(f"Errore durante l'elaborazione di {path}: {e}")
+                summaries.append({"video": str(path), "error": str(e)})
+        # Le targhe ricucite sono state scritte da questo processo
+        close_shared_storage()
+    else:
+        summaries = process_videos(video_paths, args.output_dir, workers=args.workers, **options)
+
+    for summary in summaries:
+        if "error" in summary:
+            print(f"{summary['video']}: ERRORE {summary['error']}")
+        else:
+            print(f"{summary['video']}: {summary['frames']} frame in {summary['processing_seconds']:.1f} s "
+                  f"({summary['throughput_fps']:.1f} FPS) -> {summary['events_file']}")
+
+
+if __name__ == "__main__":
+    main()
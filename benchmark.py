@@ -0,0 +1,476 @@
+"""
+Benchmark riproducibile della pipeline sui video in assets/, con confronto rispetto a una baseline.
+
+Casi (ognuno in un processo separato, così il picco di memoria è solo suo):
+    full      pipeline completa (decodifica, YOLO + re-ID, rischio, OCR)
+    detector  solo decodifica e ObjectDetector; registra le detection in benchmarks/detections/
+    replay    tutto quello che viene DOPO il detector, che riproduce le detection registrate
+    micro     VisualMemory.find_match, TrackedObject.update, PlateRecognizer._recognize_from_crop
+
+Il risultato (JSON) contiene per ogni caso frame/s, latenze per stadio (ms) e picco di RSS (MB).
+Con --baseline il risultato viene confrontato con quello salvato: frame/s più bassi, micro-benchmark
+più lenti o memoria più alta oltre la tolleranza contano come regressione (codice di uscita 1).
+
+Esempi:
+    python benchmark.py --save-baseline                    # crea benchmarks/baseline.json
+    python benchmark.py                                     # confronta con la baseline
+    python benchmark.py --cases replay,micro --frames 200 --tolerance 0.05
+"""
+import argparse
+import contextlib
+import datetime
+import importlib.metadata
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import cv2
+import numpy as np
+from src.data.metrics import LatencyHistogram, METRICS
+from src.input_ouput.video_facade import VideoInputFacade
+from src.processing.detection_batch import DetectionBatch, DETECTION_DTYPE
+
+DEFAULT_VIDEOS = ("assets/video6.mp4", "assets/video10.mp4")
+CASES = ("full", "detector", "replay", "micro")
+DETECTIONS_DIR = os.path.join("benchmarks", "detections")
+SEED = 1234
+
+# Chiamate misurate (dopo MICRO_WARMUP a vuoto) per ogni micro-benchmark
+MICRO_ITERATIONS = {"find_match": 5000, "tracked_object_update": 20000, "recognize_from_crop": 30}
+MICRO_WARMUP = {"find_match": 100, "tracked_object_update": 500, "recognize_from_crop": 2}
+
+
+def peak_rss_mb():
+    """Picco di memoria residente del processo (None dove resource non esiste, es. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo riporta in KB, macOS in byte
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def detections_path(video_path):
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(DETECTIONS_DIR, f"{stem}.npz")
+
+
+def save_detections(path, batches, model_name):
+    """Le detection di tutti i frame in un unico array strutturato, più l'inizio di ogni frame."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    offsets = np.zeros(len(batches) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(batch) for batch in batches])
+    data = np.concatenate([batch.data for batch in batches]) if batches else np.empty(0, dtype=DETECTION_DTYPE)
+    np.savez(path, data=data, offsets=offsets, model=np.array(model_name))
+
+
+class ReplayDetector:
+    """
+    Sostituto di ObjectDetector: restituisce, frame dopo frame, le detection registrate dal caso
+    detector (ID già re-identificati), così la parte dopo YOLO si misura senza il costo del modello.
+    Finite le detection registrate restituisce batch vuoti.
+    """
+    def __init__(self, path):
+        with np.load(path) as npz:
+            self.data = npz["data"]
+            self.offsets = npz["offsets"]
+            self.model_name = str(npz["model"])
+        self.frame_number = 0
+        self.memory = None  # Nessun re-ID: gli ID registrati sono già quelli finali
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def detect_and_track(self, frame):
+        index = self.frame_number
+        self.frame_number += 1
+        if index >= len(self):
+            return DetectionBatch.empty()
+        # Copia: ogni frame ha il suo batch, come con il detector vero
+        return DetectionBatch(self.data[self.offsets[index]:self.offsets[index + 1]].copy())
+
+
+def _stage_summary():
+    return {stage: {"mean_ms": s["mean_ms"], "p50_ms": s["p50_ms"], "p95_ms": s["p95_ms"], "count": s["count"]}
+            for stage, s in sorted(METRICS.summary().items())}
+
+
+def _run_frames(video_path, step, max_frames, warmup):
+    """
+    Ciclo comune ai casi sui video: step(frame, width, height, fps) per ogni frame decodificato.
+    I primi warmup frame non vengono misurati (caricamento pigro dei modelli, cache fredde).
+    Decodifica sincrona (niente prefetch): il risultato non dipende dalla concorrenza col decoder.
+    """
+    video_loader = VideoInputFacade(video_path, prefetch=False)
+    width, height, fps = video_loader.get_video_info()
+    frames = 0
+    start = None
+    try:
+        while max_frames is None or frames < warmup + max_frames:
+            if frames == warmup:
+                METRICS.reset()
+                start = time.perf_counter()
+            frame = video_loader.get_frame()
+            if frame is None:
+                break
+            step(frame, width, height, fps)
+            frames += 1
+    finally:
+        video_loader.release()
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    measured = max(0, frames - warmup)
+    return {
+        "frames": measured,
+        "warmup_frames": min(frames, warmup),
+        "seconds": round(elapsed, 3),
+        "fps": round(measured / elapsed, 2) if elapsed > 0 else 0.0,
+        "stages": _stage_summary(),
+    }
+
+
+def run_video_case(case, video_path, max_frames, warmup, model_name, enable_ocr):
+    """Un caso su un video, nel processo corrente. Restituisce il risultato (dict)."""
+    # Importati qui: servono ultralytics (e per l'OCR easyocr), che i micro-benchmark non richiedono
+    from src.data.storage import create_storage
+
+    if case == "detector":
+        from src.processing.detector import ObjectDetector
+        detector = ObjectDetector(model_name=model_name)
+        batches = []
+        result = _run_frames(video_path, lambda frame, w, h, fps: batches.append(detector.detect_and_track(frame)),
+                             max_frames, warmup)
+        # Registrate anche le detection del warmup: il replay parte dallo stesso frame
+        save_detections(detections_path(video_path), batches, model_name)
+        result["detections_file"] = detections_path(video_path)
+        result["peak_rss_mb"] = peak_rss_mb()
+        return result
+
+    detector = None
+    if case == "replay":
+        path = detections_path(video_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} non esiste: esegui prima il caso detector")
+        detector = ReplayDetector(path)
+
+    from src.pipeline.video_pipeline import VideoPipeline
+    # Database in memoria: niente file né server, e nessuna differenza tra una macchina e l'altra
+    storage = create_storage("sqlite", sqlite_path=":memory:") if enable_ocr else None
+    pipeline = VideoPipeline(model_name=model_name, enable_ocr=enable_ocr, storage=storage, detector=detector)
+    try:
+        result = _run_frames(video_path, pipeline.process_frame, max_frames, warmup)
+        # L'OCR arretrato non entra nei frame/s (come processing_seconds in batch_runner)
+        result["ocr_drained"] = pipeline.close()
+        result["ocr"] = pipeline.ocr_stats()
+        if detector is not None:
+            # Oltre i frame registrati il replay restituisce batch vuoti: frame/s non confrontabili
+            result["recorded_frames"] = len(detector)
+            if len(detector) < result["warmup_frames"] + result["frames"]:
+                print(f"Attenzione: solo {len(detector)} frame registrati in {detections_path(video_path)}")
+    finally:
+        if storage is not None:
+            storage.close()
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def _time_calls(name, call, count):
+    """Esegue call(i) per MICRO_WARMUP + count volte; misura solo le ultime count."""
+    for i in range(MICRO_WARMUP[name]):
+        call(i)
+    histogram = LatencyHistogram()
+    start = time.perf_counter_ns()
+    for i in range(count):
+        call_start = time.perf_counter_ns()
+        call(i)
+        histogram.record(time.perf_counter_ns() - call_start)
+    elapsed_ns = time.perf_counter_ns() - start
+    return {
+        "iterations": count,
+        "mean_us": round(histogram.total_ns / count / 1000, 3),
+        "p50_us": round(histogram.percentile(50) / 1000, 3),
+        "p95_us": round(histogram.percentile(95) / 1000, 3),
+        "ops_per_sec": round(count / (elapsed_ns / 1e9), 1),
+    }
+
+
+def micro_find_match(rng, iterations):
+    """Ricerca di un oggetto perso tra 64 in memoria, con candidati vicini e colori casuali."""
+    from src.processing.tracker_memory import VisualMemory, HIST_BINS, normalize_minmax
+
+    def random_hist():
+        return normalize_minmax(rng.random(HIST_BINS, dtype=np.float32))
+
+    memory = VisualMemory()
+    crop = np.zeros((8, 8, 3), dtype=np.uint8)  # Basta che non sia vuoto: l'istogramma è passato a parte
+    for obj_id in range(64):
+        center = (int(rng.integers(0, 1280)), int(rng.integers(0, 720)))
+        memory.update_memory(obj_id, crop, center, hist=random_hist())
+    # Tutti "persi" da un frame: sono candidati al recupero
+    memory.increment_lost_counters()
+
+    queries = [((int(rng.integers(0, 1280)), int(rng.integers(0, 720))), random_hist()) for _ in range(256)]
+
+    def call(i):
+        center, hist = queries[i % len(queries)]
+        memory.find_match(crop, center, hist=hist)
+
+    # find_match stampa i recuperi: la stampa resta nel tempo misurato ma non sulla console
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return _time_calls("find_match", call, iterations)
+
+
+def micro_tracked_object_update(rng, iterations):
+    """Aggiornamento di stato e TTC di un veicolo che si avvicina (box che cresce con rumore)."""
+    from src.behavior.state_machine import TrackedObject
+
+    infos = []
+    for step in range(512):
+        size = 80 + step % 256 + int(rng.integers(-3, 4))
+        x1, y1 = 600 - size // 2, 400 - size // 2
+        infos.append({"bbox": (x1, y1, x1 + size, y1 + size), "center": (600, 400)})
+    track = TrackedObject(1, dict(infos[0]))
+    return _time_calls("tracked_object_update",
+                       lambda i: track.update(infos[i % len(infos)], 1280, 720, 30.0), iterations)
+
+
+def _vehicle_crops(video_path, count, min_width=80):
+    """Ritagli di veicoli reali: box delle detection registrate (se ci sono) o il centro del frame."""
+    path = detections_path(video_path)
+    replay = ReplayDetector(path) if os.path.exists(path) else None
+    video_loader = VideoInputFacade(video_path, prefetch=False, use_pool=False)
+    crops = []
+    try:
+        while len(crops) < count:
+            frame = video_loader.get_frame()
+            if frame is None:
+                break
+            h, w = frame.shape[:2]
+            boxes = replay.detect_and_track(frame).bboxes.tolist() if replay is not None \
+                else [(w // 3, h // 3, 2 * w // 3, 2 * h // 3)]
+            for x1, y1, x2, y2 in boxes:
+                if x2 - x1 > min_width and len(crops) < count:
+                    crops.append(frame[max(0, y1):min(h, y2), max(0, x1):min(w, x2)].copy())
+    finally:
+        video_loader.release()
+    return crops
+
+
+def micro_recognize_from_crop(video_path, iterations):
+    """OCR (localizzazione + EasyOCR) di un ritaglio di veicolo, senza coda né thread."""
+    from src.data.storage import create_storage
+    from src.processing.plate_recognizer import PlateRecognizer
+
+    crops = _vehicle_crops(video_path, 16)
+    if not crops:
+        return {"skipped": f"nessun veicolo abbastanza grande in {video_path}"}
+    storage = create_storage("sqlite", sqlite_path=":memory:")
+    recognizer = PlateRecognizer(num_workers=0, storage=storage)
+    try:
+        if not recognizer.ocr_available:
+            return {"skipped": "EasyOCR non disponibile"}
+        return _time_calls("recognize_from_crop",
+                           lambda i: recognizer._recognize_from_crop(crops[i % len(crops)]), iterations)
+    finally:
+        recognizer.close()
+        storage.close()
+
+
+def run_micro_case(name, video_path):
+    rng = np.random.default_rng(SEED)
+    iterations = MICRO_ITERATIONS[name]
+    if name == "find_match":
+        result = micro_find_match(rng, iterations)
+    elif name == "tracked_object_update":
+        result = micro_tracked_object_update(rng, iterations)
+    else:
+        try:
+            result = micro_recognize_from_crop(video_path, iterations)
+        except ImportError as e:
+            result = {"skipped": f"dipendenza mancante: {e}"}
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def _isolated(function, *args):
+    """Esegue function in un processo nuovo (spawn): memoria e stato globale non passano da un caso all'altro."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(function, *args).result()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Dove è stato misurato il risultato: i confronti hanno senso solo sulla stessa macchina."""
+    versions = {"python": platform.python_version(), "numpy": np.__version__, "opencv": cv2.__version__}
+    # Dai metadati dei pacchetti: importare torch e ultralytics qui costerebbe secondi
+    for package in ("torch", "ultralytics", "easyocr"):
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "versions": versions,
+    }
+
+
+def run_benchmarks(video_paths, cases, max_frames, warmup, model_name, enable_ocr):
+    results = {}
+    # detector prima di replay: registra le detection che replay riproduce
+    for case in [c for c in CASES if c in cases and c != "micro"]:
+        for video_path in video_paths:
+            key = f"{case}/{os.path.splitext(os.path.basename(video_path))[0]}"
+            print(f"[{key}] ...", flush=True)
+            try:
+                results[key] = _isolated(run_video_case, case, video_path, max_frames, warmup, model_name, enable_ocr)
+                print(f"[{key}] {results[key]['fps']:.2f} frame/s, picco RSS {results[key]['peak_rss_mb']} MB")
+            except Exception as e:
+                print(f"[{key}] errore: {e}")
+                results[key] = {"error": str(e)}
+
+    if "micro" in cases:
+        for name in MICRO_ITERATIONS:
+            key = f"micro/{name}"
+            print(f"[{key}] ...", flush=True)
+            try:
+                results[key] = _isolated(run_micro_case, name, video_paths[0])
+            except Exception as e:
+                results[key] = {"error": str(e)}
+            result = results[key]
+            if "mean_us" in result:
+                print(f"[{key}] {result['mean_us']:.1f} us/chiamata (p95 {result['p95_us']:.1f} us)")
+            else:
+                print(f"[{key}] saltato: {result.get('skipped') or result.get('error')}")
+    return results
+
+
+def compare(current, baseline, tolerance, rss_tolerance):
+    """
+    Confronta i casi presenti in entrambi i risultati. Un caso fallito (error) o un caso della
+    baseline che manca nei risultati attuali conta sempre come regressione.
+    :return: lista di (caso, metrica, baseline, attuale, variazione, regressione)
+    """
+    rows = []
+    for key, result in current["cases"].items():
+        if "error" in result:
+            rows.append((key, "errore", None, None, None, True))
+            continue
+        base = baseline["cases"].get(key)
+        # Casi saltati o nuovi: non c'è niente da confrontare
+        if base is None or "skipped" in result:
+            continue
+        # (metrica, True se più alto è meglio, tolleranza)
+        checks = [("fps", True, tolerance), ("mean_us", False, tolerance), ("peak_rss_mb", False, rss_tolerance)]
+        for metric, higher_is_better, tol in checks:
+            old, new = base.get(metric), result.get(metric)
+            if old is None or new is None or old <= 0:
+                continue
+            change = (new - old) / old
+            regression = change < -tol if higher_is_better else change > tol
+            rows.append((key, metric, old, new, change, regression))
+    for key in baseline["cases"]:
+        if key not in current["cases"]:
+            rows.append((key, "mancante", None, None, None, True))
+    return rows
+
+
+def print_comparison(rows):
+    print(f"\n{'caso':<34}{'metrica':<13}{'baseline':>12}{'attuale':>12}{'var.':>9}  esito")
+    for key, metric, old, new, change, regression in rows:
+        status = "REGRESSIONE" if regression else "ok"
+        # Righe di errore o caso mancante: nessun valore da mostrare
+        old = "-" if old is None else f"{old:.2f}"
+        new = "-" if new is None else f"{new:.2f}"
+        change = "-" if change is None else f"{change:+.1%}"
+        print(f"{key:<34}{metric:<13}{old:>12}{new:>12}{change:>9}  {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della pipeline con confronto rispetto a una baseline")
+    parser.add_argument("--videos", nargs="+", default=list(DEFAULT_VIDEOS), help="Video su cui misurare")
+    parser.add_argument("--cases", default=",".join(CASES),
+                        help=f"Casi da eseguire, separati da virgola (default: {','.join(CASES)})")
+    parser.add_argument("--frames", type=int, default=None, help="Frame misurati per video (default: tutti)")
+    parser.add_argument("--warmup", type=int, default=10, help="Frame iniziali non misurati (default: 10)")
+    parser.add_argument("--model", default="yolov8s.pt", help="Modello YOLO")
+    parser.add_argument("--no-ocr", action="store_true", help="Casi full e replay senza OCR")
+    parser.add_argument("-o", "--output", default=os.path.join("benchmarks", "results.json"),
+                        help="File JSON dei risultati (default: benchmarks/results.json)")
+    parser.add_argument("--baseline", default=os.path.join("benchmarks", "baseline.json"),
+                        help="Baseline con cui confrontare (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Salva i risultati come nuova baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Peggioramento ammesso di frame/s e micro-benchmark (default: 0.10 = 10%%)")
+    parser.add_argument("--rss-tolerance", type=float, default=0.20,
+                        help="Aumento ammesso del picco di memoria (default: 0.20 = 20%%)")
+    args = parser.parse_args()
+
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"Casi sconosciuti: {', '.join(unknown)} (disponibili: {', '.join(CASES)})")
+    missing = [path for path in args.videos if not os.path.exists(path)]
+    if missing:
+        parser.error(f"Video non trovati: {', '.join(missing)}")
+
+    results = {
+        "meta": environment(),
+        "config": {"videos": args.videos, "frames": args.frames, "warmup": args.warmup, "model": args.model,
+                   "ocr": not args.no_ocr, "seed": SEED},
+        "cases": run_benchmarks(args.videos, cases, args.frames, args.warmup, args.model, not args.no_ocr),
+    }
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Risultati salvati in {args.output}")
+
+    if args.save_baseline:
+        baseline_dir = os.path.dirname(args.baseline)
+        if baseline_dir:
+            os.makedirs(baseline_dir, exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline salvata in {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Nessuna baseline in {args.baseline}: crearla con --save-baseline")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != results["config"]:
+        print("Attenzione: la baseline è stata misurata con una configurazione diversa")
+    base_meta = baseline.get("meta", {})
+    if (base_meta.get("machine"), base_meta.get("cpus")) != (results["meta"]["machine"], results["meta"]["cpus"]):
+        print("Attenzione: la baseline è stata misurata su un'altra macchina")
+
+    rows = compare(results, baseline, args.tolerance, args.rss_tolerance)
+    print_comparison(rows)
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f"\n{len(regressions)} regressioni rispetto alla baseline ({baseline['meta'].get('git_commit')})")
+        return 1
+    print("\nNessuna regressione rispetto alla baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Misura accuratezza e tempo dell'OCR targhe con e senza localizzazione su un piccolo set etichettato.
+
+Il set è una cartella con immagini di veicoli (ritagli come quelli passati all'OCR) e un labels.csv:
+    image,plate
+    auto_001.jpg,AB123CD
+    ...
+
+Esempio:
+    python evaluate_plates.py dataset/plates
+    python evaluate_plates.py dataset/plates --plate-model models/plate_yolov8n.onnx --json risultati.json
+"""
+import argparse
+import csv
+import json
+import os
+import time
+import cv2
+import easyocr
+from src.processing.ocr_pool import read_crops, best_plate_text
+from src.processing.plate_localizer import create_plate_localizer
+
+
+def load_labelled_set(dataset_dir):
+    """Legge labels.csv e restituisce [(percorso immagine, targa attesa)]."""
+    samples = []
+    with open(os.path.join(dataset_dir, "labels.csv"), newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            plate = ''.join(c for c in row["plate"] if c.isalnum()).upper()
+            samples.append((os.path.join(dataset_dir, row["image"]), plate))
+    return samples
+
+
+def evaluate(reader, samples, localizer):
+    """OCR di ogni immagine con il localizzatore dato (None = intero veicolo)."""
+    correct = 0
+    found = 0
+    elapsed = 0.0
+    errors = []
+    for path, expected in samples:
+        image = cv2.imread(path)
+        if image is None:
+            errors.append({"image": path, "error": "immagine non leggibile"})
+            continue
+
+        if localizer is not None:
+            found += bool(localizer.locate(image))
+        start = time.perf_counter()
+        text = best_plate_text(read_crops(reader, [image], localizer)[0])
+        elapsed += time.perf_counter() - start
+
+        if text == expected:
+            correct += 1
+        else:
+            errors.append({"image": path, "expected": expected, "read": text})
+
+    total = len(samples)
+    return {
+        "samples": total,
+        "accuracy": round(correct / total, 3) if total else 0.0,
+        "localized": round(found / total, 3) if total and localizer is not None else None,
+        "ms_per_crop": round(elapsed / total * 1000, 1) if total else 0.0,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valutazione OCR targhe con/senza localizzazione")
+    parser.add_argument("dataset", help="Cartella con le immagini e labels.csv")
+    parser.add_argument("--plate-model", default=None, help="Modello ONNX: valuta anche il localizzatore dnn")
+    parser.add_argument("--json", default=None, help="Salva i risultati completi (con gli errori) in questo file")
+    args = parser.parse_args()
+
+    samples = load_labelled_set(args.dataset)
+    if not samples:
+        parser.error("labels.csv non contiene immagini")
+
+    print("Initializing EasyOCR...")
+    reader = easyocr.Reader(['en'], gpu=False)
+
+    methods = {"none": None, "contour": create_plate_localizer("contour")}
+    if args.plate_model:
+        methods["dnn"] = create_plate_localizer("dnn", model_path=args.plate_model)
+
+    results = {}
+    for name, localizer in methods.items():
+        # Un'immagine a vuoto per non contare il caricamento pigro dei modelli
+        read_crops(reader, [cv2.imread(samples[0][0])], localizer)
+        results[name] = evaluate(reader, samples, localizer)
+
+    print(f"{'metodo':<10}{'accuratezza':>12}{'localizzate':>13}{'ms/crop':>10}")
+    for name, result in results.items():
+        localized = "-" if result["localized"] is None else f"{result['localized']:.1%}"
+        print(f"{name:<10}{result['accuracy']:>12.1%}{localized:>13}{result['ms_per_crop']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Risultati salvati in {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,212 +1,154 @@
-import cv2
 import traceback
-import time
+from time import perf_counter_ns
 from src.input_ouput.video_facade import VideoInputFacade
-from src.processing.detector import ObjectDetector
-# Importiamo il Manager e l'Observer invece delle singole classi logiche
-from src.behavior.risk_observer import TrackManager, ConsoleAlertObserver
-from src.data.db_manager import DBManager
-from src.processing.plate_recognizer import PlateRecognizer
-from src.behavior.state_machine import TrackedObject
-
-def draw_hud(frame, tracks):
-    """.
-    Disegna box e testi sul frame.
-    """
-    for obj in tracks:
-        # Nota: il detector restituisce 'bbox', assicuriamoci che l'oggetto lo abbia aggiornato
-        x1, y1, x2, y2 = obj.info['bbox']
-        
-        #  chiediamo il colore allo stato corrente dell'oggetto
-        color = obj.state.color
-        state_name = obj.state.name
-        
-        # Disegno del box
-        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-        
-        # Etichetta sfondo nero per leggibilità
-        label = f"ID:{obj.id} [{state_name}]"
-        (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-        cv2.rectangle(frame, (x1, y1 - 20), (x1 + w, y1), color, -1)
-        cv2.putText(frame, label, (x1, y1 - 5), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+from src.input_ouput.hud_renderer import HudRenderer
+from src.input_ouput.video_recorder import VideoRecorder
+# Importiamo l'Observer; il Manager (unico registro delle tracce) vive dentro la pipeline
+from src.behavior.risk_observer import ConsoleAlertObserver
+from src.data.storage import open_shared_storage, close_shared_storage
+from src.data.trajectory_journal import TrajectoryJournal
+from src.data.metrics import METRICS, MetricsExporter
+from src.pipeline.video_pipeline import VideoPipeline
 
 def main():
     # CONFIGURAZIONE
     video_path = "assets/video4.mp4"  # Sostituisci con 0 per la webcam
     model_name = "yolov8s.pt"
+    frame_stride = 1      # 1 = tutti i frame, 2 = uno ogni due (il TTC usa l'FPS effettivo)
+    target_size = None    # Es. (960, 540) per ridurre i frame subito dopo la decodifica
+    max_frames_lost = 15  # Frame di tolleranza prima di considerare persa una traccia
+    ocr_workers = 2       # Processi OCR (0 = un solo thread nel processo principale)
+    # "none" (OCR sull'intero veicolo), "contour" o "dnn" (serve plate_model). Il default resta "none"
+    # finché evaluate_plates.py su un set etichettato non mostra che la localizzazione migliora l'accuratezza
+    plate_localizer = "none"
+    plate_model = None    # Es. "models/plate_yolov8n.onnx" per plate_localizer = "dnn"
+    storage_backend = "auto"  # "auto" (MongoDB se raggiungibile, altrimenti SQLite), "mongo" o "sqlite"
+    render = True         # False: nessuna finestra (solo elaborazione, es. su un server)
+    record_path = None    # Es. "output/video4_annotato.mp4" per salvare il video con l'HUD
+    record_mode = "continuous"  # "continuous" (tutto) o "clips" (solo i secondi attorno ai DANGER)
+    journal_path = None   # Es. "output/video4.journal" per salvare traiettorie ed eventi (TrajectoryReader)
+    metrics_json = None   # Es. "output/metrics.json": latenze per stadio riscritte ogni 5 secondi
+    metrics_port = None   # Es. 9108: endpoint Prometheus su http://127.0.0.1:9108/metrics
     
     try:
         # 1. INIZIALIZZAZIONE COMPONENTI
-        video_loader = VideoInputFacade(video_path)
+        # Prefetch: la decodifica avviene su un thread separato mentre YOLO lavora
+        video_loader = VideoInputFacade(video_path, prefetch=True,
+                                        frame_stride=frame_stride, target_size=target_size)
         video_width, video_height, fps = video_loader.get_video_info()
         # Otteniamo le dimensioni del video per i calcoli di rischi
+        # (valori effettivi: con frame_stride l'FPS è ridotto e il TTC resta corretto)
         w, h, fps = video_loader.get_video_info()
-        detector = ObjectDetector(model_name=model_name)
+        _, _, source_fps = video_loader.get_source_info()  # Per il tempo dei frame nel journal
 
-        # NUOVO: MEMORIA DEGLI OGGETTI 
-        # Questo dizionario collegherà l'ID (es. 42) all'oggetto TrackedObject
-        
-        tracked_objects_memory = {} 
-        
         # 2. INIZIALIZZAZIONE LOGICA COMPORTAMENTALE
-        manager = TrackManager()            # Il "Cervello" che gestisce le tracce
         alert_system = ConsoleAlertObserver() # La "Voce" che urla in caso di pericolo
-        
-        # Colleghiamo l'observer al manager
-        manager.attach(alert_system)
 
         # 3. INIZIALIZZAZIONE DB E OCR
+        # Un solo storage per processo, condiviso con l'OCR (che lo prende da get_shared_storage)
         print("Connessione al database in corso...")
         try:
-            db_manager = DBManager()
-            print("Connessione al database stabilita con successo.")
+            storage = open_shared_storage(backend=storage_backend)
+            print(f"Database pronto: {type(storage).__name__}")
         except Exception as e:
-            print(f"ERRORE CRITICO: Impossibile connettersi al database: {e}")
-            # Non ritorniamo, continuiamo senza DB se necessario, o ritorniamo se è bloccante.
-            # return 
+            # L'OCR continua comunque: le targhe vengono confermate ma non salvate
+            print(f"ERRORE: Impossibile aprire il database: {e}")
+
+        # Journal delle traiettorie (opzionale), scritto da un thread in background
+        journal = TrajectoryJournal(journal_path) if journal_path else None
 
-        plate_recognizer = PlateRecognizer()
+        # Detector, TrackManager (il "Cervello", unico registro delle tracce) e OCR.
+        # Colleghiamo l'observer al manager
+        pipeline = VideoPipeline(model_name=model_name,
+                                 max_frames_lost=max_frames_lost, ocr_workers=ocr_workers,
+                                 plate_localizer=plate_localizer, plate_model=plate_model, journal=journal,
+                                 source=str(video_path))
+        manager = pipeline.manager
+        # La console riceve gli eventi dal suo thread: i DANGER che lampeggiano vengono fusi
+        # e al massimo 20 messaggi al secondo, così la stampa non rallenta il loop dei frame
+        manager.subscribe(alert_system, rate_limit=20)
+
+        # Latenze per stadio (decode, detect, reid, risk, OCR, DB, render...): export opzionale
+        exporter = MetricsExporter(json_path=metrics_json, prometheus_port=metrics_port) \
+            if metrics_json or metrics_port else None
+
+        # Una sola finestra 1280x720, disegnata da un thread separato
+        # ('q' per uscire, 'm' per mostrare/nascondere le latenze per stadio)
+        renderer = HudRenderer(window_name="SafeDrive", display_size=(1280, 720), enabled=render)
+
+        # Registrazione del video annotato (opzionale), codificata da un thread separato
+        recorder = None
+        if record_path:
+            recorder = VideoRecorder(record_path, fps, mode=record_mode)
+            manager.attach(recorder)  # I DANGER aprono le clip
 
         print(f"Avvio sistema... Video: {video_width}x{video_height} a {fps:.1f} FPS")
 
-        frame_count = 0
         while True:
             # A. INPUT
             # MISURAZIONE TEMPO INIZIALE DEL FRAME (PER CALCOLO FPS)
-            frame_start_time = time.time()
+            frame_start = perf_counter_ns()
 
             frame = video_loader.get_frame()
             if frame is None: break 
+            if journal is not None:
+                journal.set_frame(video_loader.frame_index,
+                                  video_loader.frame_index / source_fps if source_fps > 0 else 0.0)
             
-            frame_count += 1
-
-            # B. PROCESSING (YOLO) 
-            detections = detector.detect_and_track(frame)
-            current_frame_ids = set()
-            
-            # C. LOGIC (Observer + State Pattern)
-            # Passiamo tutto al manager. Lui aggiorna gli stati e notifica se serve.
-            manager.update_tracks(detections, w, h)
-
-            # D. OCR (Riconoscimento Targhe)
-            for det in detections:
-                obj_id = det['id']
-                current_frame_ids.add(obj_id)
-                bbox = det['bbox']
-                bbox_w = bbox[2] - bbox[0]
-
-                # Se è un oggetto nuovo, lo creiamo
-                if obj_id not in tracked_objects_memory:
-                    tracked_objects_memory[obj_id] = TrackedObject(obj_id, det)
-
-                # Recuperiamo l'oggetto dalla memoria
-                tracked_obj = tracked_objects_memory[obj_id]
-                
-                # AGGIORNIAMO LO STATO
-                # L'oggetto ricalcola se è Safe, Warning o Danger
-                tracked_obj.update(det, video_width, video_height, fps)                                                    
-                
-                # ASYNC OCR: Aggiungiamo alla coda di elaborazione
-                # Eseguiamo ogni 5 frame e solo se l'oggetto è abbastanza grande
-                if frame_count % 5 == 0 and bbox_w > 80:
-                    plate_recognizer.add_to_queue(frame, obj_id, bbox)
-
-            # D.2. GESTIONE OGGETTI PERSI
-            # Iteriamo su TUTTA la memoria per trovare gli oggetti che non sono in questo frame
-            for obj_id, tracked_obj in list(tracked_objects_memory.items()):
-                if obj_id not in current_frame_ids:                    
-                    # Se non è presente, incrementiamo il contatore dei frame persi
-                    tracked_obj.frames_lost += 1
-                    
-                    # Logica di Eliminazione
-                    # Se è stato perso per più di 15 frame, lo cancelliamo dalla memoria
-                    if tracked_obj.frames_lost > 15: 
-                        del tracked_objects_memory[obj_id]
-                        print(f"Eliminato Veicolo {obj_id} per perdita di traccia.")                    
-
-            # E. RENDERING
-            # Chiediamo al manager la lista degli oggetti correnti per disegnarli
-            current_objects = manager.get_tracks()
-            draw_hud(frame, current_objects)
-
-            # --- CALCOLO DEL RISCHIO AGGREGATO ---
-            RISK_LEVELS = {'DANGER': 3, 'WARNING': 2, 'SAFE': 1}
-            max_risk = 'SAFE'
-            max_risk_level = 1
-            
-            for obj_id, tracked_obj in tracked_objects_memory.items():
-                if obj_id in current_frame_ids:
-                    current_level = RISK_LEVELS.get(tracked_obj.state.name, 1)
-                    if current_level > max_risk_level:
-                        max_risk_level = current_level
-                        max_risk = tracked_obj.state.name
-
-            # F. VISUALIZZAZIONE (DISEGNO)
-            # Disegniamo solo gli oggetti presenti in QUESTO frame
-            for obj_id in current_frame_ids:
-                tracked_obj = tracked_objects_memory[obj_id]
-                x1, y1, x2, y2 = tracked_obj.info['bbox']
-                
-                # PRENDIAMO I DATI DAL CONTEXT
-                color = tracked_obj.state.color 
-                state_name = tracked_obj.state.name
-                
-                # Recupero delle metriche calcolate
-                ttc = tracked_obj.info.get('TTC', float('inf'))
-                avg_v_proxy = tracked_obj.info.get('avg_velocity_proxy', 0)
-                
-                # Formattazione TTC e Velocità per la visualizzazione
-                ttc_str = f"TTC: {ttc:.2f} s" if ttc < float('inf') else "TTC: Inf"
-                v_str = f"V. PROXY: {avg_v_proxy:.0f}"
-                
-                # Disegna il rettangolo con il colore dello stato
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 3)
-                
-                # --- Linea 1: ID e STATO ---
-                label_state = f"ID:{obj_id} [{state_name}]"
-                cv2.putText(frame, label_state, (x1, y1 - 25), 
-                                 cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                                 
-                # --- Linea 2: TTC ---
-                cv2.putText(frame, ttc_str, (x1, y1 - 8), 
-                                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-
-                # --- Linea 3: Velocità Proxy ---
-                # Per chiarezza, la mettiamo sopra il box
-                cv2.putText(frame, v_str, (x1, y1 + 10), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            # B-D. YOLO, aggiornamento degli stati nel manager (con notifiche) e coda OCR
+            pipeline.process_frame(frame, w, h, fps)
 
             # --- MISURAZIONE TEMPO FINALE DEL FRAME ---
-            frame_end_time = time.time()
-            fps_actual = 1 / (frame_end_time - frame_start_time)
-
-            # --- DASHBOARD DI SISTEMA (IN ALTO A SINISTRA) ---
-            global_color = (0, 255, 0) # Verde
-            if max_risk == 'WARNING': global_color = (0, 255, 255) # Giallo
-            if max_risk == 'DANGER': global_color = (0, 0, 255) # Rosso
-
-            # Linea 1: Rischio Aggregato (colore globale)
-            cv2.putText(frame, f"RISCHIO AGGREGATO: {max_risk}", (10, 30), 
-                             cv2.FONT_HERSHEY_SIMPLEX, 0.8, global_color, 2)
-
-            # Linea 2: Statistiche di Sistema (bianco)
-            cv2.putText(frame, f"FPS: {fps_actual:.1f} | Tracciati: {len(current_frame_ids)}", (10, 60), 
-                             cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-            
-            # FINESTRA DI OUTPUT 
-            # Ridimensioniamo per fluidità se il video è grande
-            display_frame = cv2.resize(frame, (1280, 720))
-            cv2.imshow("SafeDrive - State Machine Test", display_frame)            
-
-            # Display
-            display_frame = cv2.resize(frame, (1280, 720))
-            cv2.imshow("SafeDrive", display_frame)
-            
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            frame_ns = perf_counter_ns() - frame_start
+            METRICS.record_ns("frame", frame_ns)
+            fps_actual = 1e9 / frame_ns
+
+            # E-F. RENDERING: il frame ridotto e una copia degli stati delle tracce visibili passano
+            # al thread di rendering, che disegna e mostra la finestra mentre qui si elabora il frame successivo
+            renderer.submit(frame, manager.tracks, manager.visible_slots, fps_actual)
+            if recorder is not None:
+                recorder.submit(frame, manager.tracks, manager.visible_slots, fps_actual)
+            if renderer.quit_requested:
                 break
-                
+
+        renderer.close()
+        if render:
+            render_stats = renderer.stats()
+            print(f"Rendering: {render_stats['rendered']} frame mostrati, {render_stats['dropped_stale']} saltati, "
+                  f"disegno medio {render_stats['avg_draw_ms']} ms")
+        if recorder is not None:
+            recorder.close()
+            record_stats = recorder.stats()
+            print(f"Registrazione: {record_stats['written']} frame scritti, {record_stats['dropped']} persi "
+                  f"(coda piena), {record_stats['clips']} clip")
+        buffer_stats = video_loader.get_buffer_stats()
+        if buffer_stats is not None:
+            print(f"Prefetch: {buffer_stats['queued']} frame decodificati, {buffer_stats['dropped']} scartati")
+        ocr_stats = pipeline.ocr_stats()
+        if ocr_stats is not None:
+            print(f"OCR: {ocr_stats['completed']} letture, {ocr_stats['replaced']} sostituite, "
+                  f"{ocr_stats['dropped_full'] + ocr_stats['dropped_discarded']} scartate, "
+                  f"attesa media {ocr_stats['avg_wait_ms']} ms")
+            if ocr_stats['cache'] is not None:
+                print(f"Cache OCR: {ocr_stats['cache']['hits']} crop duplicati saltati, "
+                      f"{ocr_stats['cache']['misses']} nuovi")
+        event_stats = manager.event_stats()
+        if event_stats is not None:
+            for sink, stats in event_stats.items():
+                print(f"Eventi {sink}: {stats['delivered']} consegnati, {stats['coalesced']} fusi, "
+                      f"{stats['dropped']} scartati, ritardo medio {stats['avg_lag_ms']} ms")
+        for stage, latency in METRICS.summary().items():
+            print(f"Latenza {stage}: p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, "
+                  f"p99 {latency['p99_ms']} ms ({latency['count']} misure)")
+        # Ferma l'OCR (i processi worker e la memoria condivisa dei crop) senza aspettare la coda
+        pipeline.close(ocr_timeout=0)
         video_loader.release()
+        if journal is not None:
+            journal.close()
+        # Scrive le targhe ancora nel buffer e chiude il database
+        close_shared_storage()
+        if exporter is not None:
+            exporter.close()
         
     except Exception as e:
         print(f"Errore critico: {e}")
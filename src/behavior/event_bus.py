@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import deque
+
+# Eventi "di stato" che possono essere fusi: per uno stesso veicolo conta solo l'ultimo ancora
+# in coda (es. DANGER che lampeggia, STATE_CHANGE ripetuti). Nascita e perdita di una traccia
+# o una targa confermata non vengono mai fusi.
+COALESCED_EVENTS = frozenset({"STATE_CHANGE", "DANGER"})
+
+
+class _PendingEvent:
+    __slots__ = ('event_type', 'track_id', 'message', 'published_at')
+
+    def __init__(self, event_type, track_id, message, published_at):
+        self.event_type = event_type
+        self.track_id = track_id
+        self.message = message
+        self.published_at = published_at
+
+
+class Subscription:
+    """
+    Un observer iscritto all'EventBus, con la SUA coda limitata e il SUO thread di consegna:
+    un observer lento accumula ritardo solo nella propria coda, mai nel loop dei frame.
+    - max_queue: eventi in attesa al massimo; a coda piena il nuovo evento viene scartato (e contato).
+    - coalesce: gli eventi di COALESCED_EVENTS ancora in coda per lo stesso veicolo vengono sostituiti
+      dal più recente (resta la posizione del primo, conta il messaggio dell'ultimo).
+    - rate_limit: eventi al secondo consegnati al massimo (token bucket con burst); gli eventi in
+      eccesso aspettano in coda, dove possono essere fusi.
+    """
+    def __init__(self, observer, name=None, max_queue=256, coalesce=True, rate_limit=None, burst=None):
+        if max_queue < 1:
+            raise ValueError("max_queue deve essere almeno 1")
+        self.observer = observer
+        self.name = name or type(observer).__name__
+        self.max_queue = max_queue
+        self.coalesce = coalesce
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else max(1.0, rate_limit or 1.0)
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+
+        self._queue = deque()   # _PendingEvent in ordine di pubblicazione
+        self._latest = {}       # {(event_type, track_id): _PendingEvent in coda}, per la fusione
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._delivering = False
+        self._closed = False
+
+        # Contatori per il monitoraggio
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lag_total = 0.0  # Secondi tra pubblicazione e consegna
+        self.lag_max = 0.0
+
+        self._thread = threading.Thread(target=self._deliver, daemon=True, name=f"event-sink-{self.name}")
+        self._thread.start()
+
+    def put(self, event_type, track_id, message, published_at):
+        """Chiamato dal thread che pubblica: non blocca mai."""
+        with self._lock:
+            if self._closed:
+                return
+            self.published += 1
+            key = (event_type, track_id)
+            pending = self._latest.get(key) if self.coalesce and event_type in COALESCED_EVENTS else None
+            if pending is not None:
+                pending.message = message
+                self.coalesced += 1
+                return
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return
+            pending = _PendingEvent(event_type, track_id, message, published_at)
+            self._queue.append(pending)
+            if self.coalesce and event_type in COALESCED_EVENTS:
+                self._latest[key] = pending
+            self._not_empty.notify()
+
+    def _take_token(self):
+        """Rate limit: attende (senza lock, gli eventi intanto si accodano e si fondono) un token."""
+        if self.rate_limit is None:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_limit)
+            self._refilled_at = now
+            # In chiusura la coda viene svuotata senza rispettare il limite
+            if self._tokens >= 1.0 or self._closed:
+                self._tokens = max(0.0, self._tokens - 1.0)
+                return
+            time.sleep((1.0 - self._tokens) / self.rate_limit)
+
+    def _deliver(self):
+        while True:
+            self._take_token()
+            with self._lock:
+                self._not_empty.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    self._idle.notify_all()
+                    return
+                pending = self._queue.popleft()
+                key = (pending.event_type, pending.track_id)
+                if self._latest.get(key) is pending:
+                    del self._latest[key]
+                self._delivering = True
+
+            lag = time.monotonic() - pending.published_at
+            try:
+                self.observer.update(pending.event_type, pending.track_id, pending.message)
+            except Exception as e:
+                # Un sink che fallisce non deve fermare la consegna degli altri eventi
+                self.errors += 1
+                print(f"EventBus: errore nel sink {self.name}: {e}")
+
+            with self._lock:
+                self._delivering = False
+                self.delivered += 1
+                self.lag_total += lag
+                self.lag_max = max(self.lag_max, lag)
+                if not self._queue:
+                    self._idle.notify_all()
+
+    def wait_until_idle(self, timeout=None):
+        """Aspetta che la coda sia stata consegnata. Ritorna True se è vuota."""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._queue and not self._delivering, timeout=timeout)
+
+    def close(self, timeout=5.0):
+        """Consegna quello che resta in coda (al massimo timeout secondi) e ferma il thread."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            oldest = time.monotonic() - self._queue[0].published_at if self._queue else 0.0
+            return {
+                "depth": len(self._queue),
+                "published": self.published,
+                "delivered": self.delivered,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "avg_lag_ms": round(self.lag_total / self.delivered * 1000, 2) if self.delivered else 0.0,
+                "max_lag_ms": round(self.lag_max * 1000, 2),
+                "current_lag_ms": round(oldest * 1000, 2),  # Età dell'evento più vecchio ancora in coda
+            }
+
+
+class EventBus:
+    """
+    Consegna asincrona degli eventi (stessa interfaccia degli Observer: update(event_type, track_id, message)).
+    publish() mette l'evento nella coda di ogni sottoscrizione e ritorna subito: il costo per il
+    chiamante è un append per sink, qualunque sia la velocità dei sink.
+    """
+    def __init__(self):
+        self.subscriptions = []
+
+    def subscribe(self, observer, **options):
+        """Iscrive un observer con la sua coda e il suo thread (opzioni: vedi Subscription)."""
+        subscription = Subscription(observer, **options)
+        names = {s.name for s in self.subscriptions}
+        if subscription.name in names:
+            # Nomi unici nelle statistiche (es. due ConsoleAlertObserver): primo suffisso libero
+            base, suffix = subscription.name, 2
+            while f"{base}#{suffix}" in names:
+                suffix += 1
+            subscription.name = f"{base}#{suffix}"
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def publish(self, event_type, track_id, message=""):
+        published_at = time.monotonic()
+        for subscription in self.subscriptions:
+            subscription.put(event_type, track_id, message, published_at)
+
+    def wait_until_idle(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for subscription in self.subscriptions:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not subscription.wait_until_idle(remaining):
+                return False
+        return True
+
+    def close(self, timeout=5.0):
+        for subscription in self.subscriptions:
+            subscription.close(timeout)
+
+    def stats(self):
+        """Statistiche per sink ({nome: {...}}): profondità, fusi, scartati e ritardo di consegna."""
+        return {subscription.name: subscription.stats() for subscription in self.subscriptions}
@@ -1,7 +1,12 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import perf_counter_ns
 # Assicurati che l'import sia corretto in base alla tua struttura
-from src.behavior.state_machine import TrackedObject, DangerState
-from src.behavior.state_machine import SafeState, WarningState
+from src.behavior.state_machine import STATES, STATE_SAFE, STATE_DANGER
+from src.behavior.track_table import TrackTable
+from src.behavior.event_bus import EventBus
+from src.processing.detection_batch import DetectionBatch
+from src.data.metrics import METRICS
 
 class Observer(ABC):
     @abstractmethod
@@ -21,55 +26,122 @@ class ConsoleAlertObserver(Observer):
 class TrackManager:
     """
     SOGGETTO (Subject). Gestisce gli oggetti e notifica gli Observer.
+    È l'UNICO registro delle tracce: renderer e OCR leggono da qui invece di tenere una copia.
+    Gli observer di attach() sono chiamati subito, dentro update_tracks (solo sink veloci che
+    devono vedere l'evento nel frame in cui accade, es. OCR e log con il numero di frame);
+    quelli di subscribe() ricevono gli eventi da un EventBus, ciascuno dal proprio thread.
     """
-    def __init__(self):
+    def __init__(self, max_frames_lost=0):
         self.observers = [] #Lista di chi sta ascoltando (es. la Console)
-        self.tracks = {} # Memoria delle auto (Dizionario ID -> Oggetto)
+        self.tracks = TrackTable() # Memoria delle auto (tabella ID -> slot con colonne NumPy)
+
+        # Per quanti frame una traccia non vista resta nel registro prima di LOST_TRACK
+        # (0 = eliminata subito al primo frame in cui manca)
+        self.max_frames_lost = max_frames_lost
+        self.frame_number = 0
+        # Coda ordinata per ultimo avvistamento (la più vecchia in testa): per trovare le tracce
+        # scadute basta guardare la testa, senza scorrere tutto il registro a ogni frame
+        self._last_seen_queue = OrderedDict()
+        self.visible_ids = [] # ID visti nel frame corrente
+        self.visible_slots = [] # Slot della tabella di quegli ID (per leggere le colonne in blocco)
+        self.bus = None # EventBus, creato alla prima subscribe()
 
     def attach(self, observer):
         self.observers.append(observer) # Aggiunge un nuovo ascoltatore alla lista
 
+    def subscribe(self, observer, **options):
+        """
+        Iscrive un observer con consegna asincrona (coda e thread propri, eventi fusi e rate limit:
+        vedi event_bus.Subscription). Un observer lento non rallenta più il loop dei frame.
+        """
+        if self.bus is None:
+            self.bus = EventBus()
+        return self.bus.subscribe(observer, **options)
+
     def notify(self, event_type, track_id, message=""):   #Quando succede qualcosa, il Manager non fa print(). Chiama il metodo notify. Questo metodo dice: "Per tutti quelli che mi stanno ascoltando (observers), ecco l'aggiornamento!"
         for observer in self.observers:
             observer.update(event_type, track_id, message)
+        if self.bus is not None:
+            self.bus.publish(event_type, track_id, message)
 
-    def update_tracks(self, detections, frame_w, frame_h):
-        active_ids = []
+    def update_tracks(self, detections, frame_w, frame_h, fps):
+        # fps è quello EFFETTIVO (es. con frame_stride=2 è la metà di quello del video), serve al TTC
+        start = perf_counter_ns()
+        self.frame_number += 1
+        self.tracks.current_frame = self.frame_number
+        self.visible_ids = []
 
+        new_ids = set()
+        slots = []
         for det in detections:
             obj_id = det["id"]           
-            active_ids.append(obj_id)   #prende id e lo mette nella lista degli attivi
+            self.visible_ids.append(obj_id)   #prende id e lo mette nella lista degli attivi
 
-            # 1. È una NUOVA traccia?
-            if obj_id not in self.tracks:
-                # l'oggetto new_obj che contiene tutta la logica del file state_machine.py
-                new_obj = TrackedObject(obj_id, det) # Crea nuovo oggetto
-                new_obj.update(det, frame_w, frame_h) # aggiunge l'oggetto
-                
-                self.tracks[obj_id] = new_obj # Memorizza la traccia
-                 #Notifica tutti gli observer che c'è una nuova traccia
+            # Spostiamo la traccia in fondo alla coda: è la più recente
+            self._last_seen_queue[obj_id] = self.frame_number
+            self._last_seen_queue.move_to_end(obj_id)
+
+            # 1. È una NUOVA traccia? Nuovo slot nella tabella (riutilizza quelli delle tracce perse)
+            slot = self.tracks.slot_of(obj_id)
+            if slot is None:
+                slot = self.tracks.add(obj_id, det)
+                new_ids.add(obj_id)
+            slots.append(slot)
+        self.visible_slots = slots
+
+        # 2. Rischio di TUTTE le tracce in un'unica passata vettoriale
+        # (stessa logica di state_machine.py). Un ID ripetuto nello stesso frame
+        # va invece aggiornato in sequenza, come faceva il ciclo per oggetto.
+        if isinstance(detections, DetectionBatch) and len(set(slots)) == len(slots):
+            old_codes, new_codes = self.tracks.update_batch(
+                slots, detections.bboxes, detections.centers, detections.data['class_id'], frame_w, frame_h, fps)
+            transitions = zip(old_codes.tolist(), new_codes.tolist())
+        else:
+            transitions = [self.tracks.update(slot, det, frame_w, frame_h, fps)
+                           for slot, det in zip(slots, detections)]
+
+        # 3. Notifiche, nell'ordine delle detection
+        for obj_id, (old_code, new_code) in zip(self.visible_ids, transitions):
+            if obj_id in new_ids:
+                #Notifica tutti gli observer che c'è una nuova traccia
+                new_ids.discard(obj_id)
                 self.notify("NEW_TRACK", obj_id)
-            else:
-                # 2. Aggiorna traccia ESISTENTE
-                current_obj = self.tracks[obj_id]
-                old_state_name = current_obj.state.name
-                
-                 #Qui il flusso di esecuzione SALTA dal file risk_observer.py al file state_machine.py. Dentro state_machine.py, il metodo update fa i calcoli matematici (Area, Centro). Sempre dentro state_machine.py, l'oggetto decide se cambiare il suo stato interno (es. self.state = DangerState()). Finito il calcolo, il flusso torna al Manager.
-                current_obj.update(det, frame_w, frame_h)
-                
-                new_state_name = current_obj.state.name # Il Manager sbircia dentro l'oggetto per vedere lo stato corrente
-
-                # 3. Controllo cambio stato -> PERICOLO
-                # Se passa a DANGER e prima non lo era, notifica!
-                if new_state_name == "DANGER" and old_state_name != "DANGER":
-                    self.notify("DANGER", obj_id, "COLLISIONE IMMINENTE!")
-
-        # 4. Gestione tracce PERSE
-        current_track_ids = list(self.tracks.keys())
-        for track_id in current_track_ids:
-            if track_id not in active_ids:
-                del self.tracks[track_id]
-                self.notify("LOST_TRACK", track_id)
+                if new_code != STATE_SAFE:
+                    self.notify("STATE_CHANGE", obj_id, f"SAFE -> {STATES[new_code].name}")
+                continue
+
+            if new_code != old_code:
+                self.notify("STATE_CHANGE", obj_id, f"{STATES[old_code].name} -> {STATES[new_code].name}")
+
+            # Controllo cambio stato -> PERICOLO
+            # Se passa a DANGER e prima non lo era, notifica!
+            if new_code == STATE_DANGER and old_code != STATE_DANGER:
+                self.notify("DANGER", obj_id, "COLLISIONE IMMINENTE!")
+
+        # 4. Gestione tracce PERSE: solo quelle in testa alla coda possono essere scadute
+        expire_before = self.frame_number - self.max_frames_lost
+        while self._last_seen_queue:
+            track_id, last_seen = next(iter(self._last_seen_queue.items()))
+            if last_seen >= expire_before:
+                break
+            del self._last_seen_queue[track_id]
+            self.tracks.remove(track_id)
+            self.notify("LOST_TRACK", track_id)
+        METRICS.observe("risk", start)
                 
+    def event_stats(self):
+        """Statistiche per sink dell'EventBus (None senza observer asincroni)."""
+        return self.bus.stats() if self.bus is not None else None
+
+    def close(self, timeout=5.0):
+        """Consegna gli eventi ancora in coda agli observer asincroni e ne ferma i thread."""
+        if self.bus is not None:
+            self.bus.close(timeout)
+
     def get_tracks(self):
-        return self.tracks.values()
\ No newline at end of file
+        """Tutte le tracce nel registro, comprese quelle non viste ma ancora entro max_frames_lost."""
+        return list(self.tracks)
+
+    def get_visible_tracks(self):
+        """Solo le tracce viste nel frame corrente (quelle da disegnare)."""
+        return [self.tracks.get(obj_id) for obj_id in self.visible_ids]
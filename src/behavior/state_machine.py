@@ -1,4 +1,23 @@
 from abc import ABC, abstractmethod
+from collections import deque
+import numpy as np
+
+# Codici interi degli stati (usati dalla TrackTable al posto degli oggetti)
+STATE_SAFE = 0
+STATE_WARNING = 1
+STATE_DANGER = 2
+
+# Soglie della logica di rischio
+TTC_CRITICO = 3.0  # Meno di 3 secondi è altissimo rischio
+TTC_ATTENZIONE = 6.0 # Meno di 6 secondi richiede attenzione
+VELOCITA_ALTA = 100  # Variazione media d'area per frame oltre cui "si avvicina velocemente"
+AREA_VICINO = 0.10   # Frazione del frame oltre cui l'oggetto è "molto vicino"
+AREA_MEDIA = 0.05    # Frazione del frame per la "media distanza"
+CORSIA = (0.3, 0.7)  # La nostra corsia: fascia centrale del frame (in frazione della larghezza)
+VELOCITY_WINDOW = 5  # Misurazioni usate per la velocità media
+# Stampa ogni cambio di stato (solo per debug: nel loop dei frame il print costa, e il cambio
+# arriva comunque agli observer come evento STATE_CHANGE)
+DEBUG_STATE_CHANGES = False
 
 # --- 1. INTERFACCIA STATE (L'astrazione) ---
 class VehicleState(ABC):
@@ -16,6 +35,11 @@ class VehicleState(ABC):
     def name(self):
         pass
 
+    @property
+    @abstractmethod
+    def code(self):
+        pass
+
 # --- 2. STATI CONCRETI (Le implementazioni) ---
 class SafeState(VehicleState):
     """Stato: Lontano o non in traiettoria. Colore: Verde."""
@@ -27,6 +51,10 @@ class SafeState(VehicleState):
     def name(self):
         return "SAFE"
 
+    @property
+    def code(self):
+        return STATE_SAFE
+
 class WarningState(VehicleState):
     """Stato: Si sta avvicinando o è a media distanza. Colore: Giallo."""
     @property
@@ -37,6 +65,10 @@ class WarningState(VehicleState):
     def name(self):
         return "WARNING"
 
+    @property
+    def code(self):
+        return STATE_WARNING
+
 class DangerState(VehicleState):
     """Stato: Vicino e in traiettoria di collisione. Colore: Rosso."""
     @property
@@ -47,6 +79,56 @@ class DangerState(VehicleState):
     def name(self):
         return "DANGER"
 
+    @property
+    def code(self):
+        return STATE_DANGER
+
+# Gli stati non hanno dati propri: basta un'unica istanza per tipo
+SAFE_STATE = SafeState()
+WARNING_STATE = WarningState()
+DANGER_STATE = DangerState()
+STATES = (SAFE_STATE, WARNING_STATE, DANGER_STATE)  # STATES[codice] -> stato
+
+
+def classify_risk(ttc, is_in_lane, is_approaching_fast, is_close, area_ratio):
+    """
+    Tabella di decisione del rischio (la parte "intelligente").
+    :return: codice dello stato (STATE_SAFE, STATE_WARNING, STATE_DANGER)
+    """
+    if ttc < TTC_CRITICO and is_in_lane:
+        # Rischio massimo: Collisione prevista entro 3 secondi ed è in traiettoria!
+        return STATE_DANGER
+    if is_in_lane and is_approaching_fast and is_close:
+        # Condizione 1: In corsia, si avvicina velocemente ed è vicino
+        return STATE_DANGER
+    if ttc < TTC_ATTENZIONE and is_in_lane:
+        # Alto rischio: Collisione prevista entro 6 secondi
+        return STATE_WARNING
+    if is_in_lane and is_approaching_fast:
+        # Condizione 2: In corsia e si sta avvicinando velocemente
+        return STATE_WARNING
+    if is_close and not is_in_lane:
+        # Condizione 3: È molto vicino, ma non in corsia (es. ci sta sorpassando o è a lato)
+        return STATE_WARNING
+    if is_in_lane and area_ratio > AREA_MEDIA:
+        # Condizione 4: In corsia, non veloce, ma a media distanza
+        return STATE_WARNING
+    # Condizione 5: Tutto è sicuro
+    return STATE_SAFE
+
+
+def classify_risk_batch(ttc, is_in_lane, is_approaching_fast, is_close, area_ratio):
+    """
+    Stessa tabella di decisione di classify_risk, ma su array (una riga per traccia).
+    Le condizioni di DANGER hanno la precedenza su quelle di WARNING, come nella cascata di if.
+    :return: array int8 con i codici degli stati
+    """
+    danger = is_in_lane & ((ttc < TTC_CRITICO) | (is_approaching_fast & is_close))
+    warning = (is_in_lane & ((ttc < TTC_ATTENZIONE) | is_approaching_fast | (area_ratio > AREA_MEDIA))) \
+        | (is_close & ~is_in_lane)
+    return np.select([danger, warning], [STATE_DANGER, STATE_WARNING], STATE_SAFE).astype(np.int8)
+
+
 # 3. CONTEXT (L'oggetto tracciato) 
 class TrackedObject:
     """
@@ -55,17 +137,18 @@ class TrackedObject:
     def __init__(self, obj_id, initial_info):
         self.id = obj_id
         self.info = initial_info
-        self.state = SafeState()  # Stato iniziale di default
+        self.state = SAFE_STATE  # Stato iniziale di default
         self.frames_seen = 1
         self.frames_lost = 0 # Contatore per la perdita di traccia
-        self.area_history = [] # Storico delle aree per capire se si avvicina (non usato in questa versione base ma utile)
         self.previous_info = None  # Info del frame precedente
-        self.velocity_history = [] # Cronologia delle velocità (utile per media)
-        self.distance_history = [] # Cronologia delle distanze (utile per Time-to-Collision)
+        # Cronologia delle velocità (utile per media): buffer circolare, le più vecchie escono da sole
+        self.velocity_history = deque(maxlen=VELOCITY_WINDOW)
 
     def update(self, new_info, frame_width, frame_height, fps):
         """
         Aggiorna i dati dell'oggetto e ricalcola lo stato.
+        fps è quello effettivo dei frame elaborati: se si salta un frame ogni N,
+        la variazione d'area è "per frame elaborato" e il TTC va convertito con fps / N.
         """
         self.info = new_info
         bbox = new_info['bbox']
@@ -75,8 +158,8 @@ class TrackedObject:
         area_ratio = max(area / video_area, 1e-6)
 
         center_x = new_info['center'][0]
-        lane_start = frame_width * 0.3
-        lane_end = frame_width * 0.7
+        lane_start = frame_width * CORSIA[0]
+        lane_end = frame_width * CORSIA[1]
         is_in_lane = lane_start < center_x < lane_end
 
         avg_velocity_proxy = 0
@@ -94,11 +177,9 @@ class TrackedObject:
             area_change = current_area - previous_area
             
             velocity_proxy = area_change
+            # Le 5 misurazioni per la velocità media (il deque scarta da solo la più vecchia)
             self.velocity_history.append(velocity_proxy)
 
-            # Le 5 misurazioni per la velocità media
-            self.velocity_history = self.velocity_history[-5:] 
-
             # Calcolo della V_media (media della variazione di area negli ultimi 5 frame)
             avg_velocity_proxy = sum(self.velocity_history) / len(self.velocity_history) if self.velocity_history else 0
             
@@ -108,7 +189,7 @@ class TrackedObject:
             DISTANCE_PROXY = 1 / area_ratio
 
             # La Velocità Relativa (proxy) è la variazione media di area.
-            VELOCITY_PROXY = self.info.get('avg_velocity_proxy', 0)
+            VELOCITY_PROXY = avg_velocity_proxy
 
             ttc = float('inf') # Inizializza a infinito (nessun rischio)
 
@@ -118,58 +199,30 @@ class TrackedObject:
                 ttc_in_frames = DISTANCE_PROXY / VELOCITY_PROXY 
                 # Converti i frame in secondi
                 ttc = ttc_in_frames / fps 
-            
-            self.info['TTC'] = ttc
-            self.info['avg_velocity_proxy'] = avg_velocity_proxy
-            self.previous_info = new_info
+
+        self.info['TTC'] = ttc
+        self.info['avg_velocity_proxy'] = avg_velocity_proxy
+        self.previous_info = new_info
 
 
         # --- LOGICA DI TRANSIZIONE DI STATO ---
         # Questa è la parte "intelligente" che decide il rischio
         
         # Condizione: L'oggetto si sta avvicinando velocemente (alta variazione di area)
-        IS_APPROACHING_FAST = self.info.get('avg_velocity_proxy', 0) > 100 
+        IS_APPROACHING_FAST = self.info.get('avg_velocity_proxy', 0) > VELOCITA_ALTA 
         
         # Condizione: L'oggetto è molto vicino (grande area)
-        IS_CLOSE = area_ratio > 0.10
+        IS_CLOSE = area_ratio > AREA_VICINO
         
         # Condizione: L'oggetto è in traiettoria
         IS_IN_LANE = lane_start < center_x < lane_end
 
-        TTC_CRITICO = 3.0  # Meno di 3 secondi è altissimo rischio
-        TTC_ATTENZIONE = 6.0 # Meno di 6 secondi richiede attenzione
-        
-        
-        if self.info['TTC'] < TTC_CRITICO and IS_IN_LANE:
-            # Rischio massimo: Collisione prevista entro 3 secondi ed è in traiettoria!
-            self.set_state(DangerState())
-        
-        elif IS_IN_LANE and IS_APPROACHING_FAST and IS_CLOSE: 
-            # Condizione 1: In corsia, si avvicina velocemente ed è vicino
-            self.set_state(DangerState())
-
-        elif self.info['TTC'] < TTC_ATTENZIONE and IS_IN_LANE:
-            # Alto rischio: Collisione prevista entro 6 secondi
-            self.set_state(WarningState())    
-                   
-        elif IS_IN_LANE and IS_APPROACHING_FAST:
-            # Condizione 2: In corsia e si sta avvicinando velocemente
-            self.set_state(WarningState())
-            
-        elif IS_CLOSE and not IS_IN_LANE:
-            # Condizione 3: È molto vicino, ma non in corsia (es. ci sta sorpassando o è a lato)
-            self.set_state(WarningState())
-            
-        elif IS_IN_LANE and area_ratio > 0.05:
-            # Condizione 4: In corsia, non veloce, ma a media distanza
-            self.set_state(WarningState())
-            
-        else:
-            # Condizione 5: Tutto è sicuro
-            self.set_state(SafeState())
+        code = classify_risk(self.info['TTC'], IS_IN_LANE, IS_APPROACHING_FAST, IS_CLOSE, area_ratio)
+        self.set_state(STATES[code])
 
     def set_state(self, new_state):
         """Cambia lo stato corrente."""
-        if type(self.state) != type(new_state):
-            print(f"Veicolo {self.id}: {self.state.name} -> {new_state.name}") # Debug opzionale
-            self.state = new_state
\ No newline at end of file
+        if self.state is not new_state:
+            if DEBUG_STATE_CHANGES:
+                print(f"Veicolo {self.id}: {self.state.name} -> {new_state.name}")
+            self.state = new_state
@@ -0,0 +1,316 @@
+from collections.abc import Mapping
+import numpy as np
+from src.behavior import state_machine
+from src.behavior.state_machine import (
+    STATES, STATE_SAFE, CORSIA, VELOCITA_ALTA, AREA_VICINO, VELOCITY_WINDOW, classify_risk, classify_risk_batch,
+)
+
+
+class TrackTable:
+    """
+    Tabella delle tracce "struct-of-arrays": invece di un oggetto Python per veicolo,
+    ogni campo è una colonna NumPy e ogni traccia occupa uno slot (riga).
+    Lo storico di aree e velocità è un buffer circolare di dimensione fissa per slot,
+    lo stato è un codice intero (STATES[codice] dà colore e nome) e gli slot delle tracce
+    rimosse vengono riutilizzati: la memoria per traccia è costante.
+    """
+    def __init__(self, capacity=64, history_len=VELOCITY_WINDOW):
+        self.history_len = history_len
+        self.capacity = 0
+
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.bbox = np.zeros((0, 4), dtype=np.int32)
+        self.center = np.zeros((0, 2), dtype=np.int32)
+        self.class_id = np.zeros(0, dtype=np.int32)
+        # Buffer circolari: area per frame e variazione d'area (velocità proxy)
+        self.area_history = np.zeros((0, history_len), dtype=np.float64)
+        self.velocity_history = np.zeros((0, history_len), dtype=np.float64)
+        self.history_head = np.zeros(0, dtype=np.int32)     # Prossima posizione da scrivere
+        self.area_count = np.zeros(0, dtype=np.int32)       # Aree valide nel buffer
+        self.velocity_count = np.zeros(0, dtype=np.int32)   # Velocità valide nel buffer
+        self.state = np.zeros(0, dtype=np.int8)
+        self.ttc = np.zeros(0, dtype=np.float64)
+        self.avg_velocity = np.zeros(0, dtype=np.float64)
+        self.frames_seen = np.zeros(0, dtype=np.int32)
+        self.last_seen = np.zeros(0, dtype=np.int64)   # Ultimo frame in cui la traccia è stata vista
+        self.active = np.zeros(0, dtype=bool)
+
+        # Frame corrente (lo imposta il TrackManager): frames_lost = current_frame - last_seen
+        self.current_frame = 0
+        self.id_to_slot = {}
+        self.free_slots = []
+        self._grow(capacity)
+
+    def _grow(self, new_capacity):
+        """Raddoppia la capacità quando non ci sono slot liberi."""
+        extra = new_capacity - self.capacity
+
+        def extend(array, fill=0):
+            shape = (extra,) + array.shape[1:]
+            return np.concatenate([array, np.full(shape, fill, dtype=array.dtype)])
+
+        self.ids = extend(self.ids)
+        self.bbox = extend(self.bbox)
+        self.center = extend(self.center)
+        self.class_id = extend(self.class_id)
+        self.area_history = extend(self.area_history)
+        self.velocity_history = extend(self.velocity_history)
+        self.history_head = extend(self.history_head)
+        self.area_count = extend(self.area_count)
+        self.velocity_count = extend(self.velocity_count)
+        self.state = extend(self.state)
+        self.ttc = extend(self.ttc, np.inf)
+        self.avg_velocity = extend(self.avg_velocity)
+        self.frames_seen = extend(self.frames_seen)
+        self.last_seen = extend(self.last_seen)
+        self.active = extend(self.active, False)
+
+        self.free_slots.extend(range(new_capacity - 1, self.capacity - 1, -1))
+        self.capacity = new_capacity
+
+    def __len__(self):
+        return len(self.id_to_slot)
+
+    def __contains__(self, obj_id):
+        return obj_id in self.id_to_slot
+
+    def slot_of(self, obj_id):
+        return self.id_to_slot.get(obj_id)
+
+    def add(self, obj_id, det):
+        """Crea la traccia in uno slot libero (stato iniziale SAFE). Ritorna lo slot."""
+        if not self.free_slots:
+            self._grow(max(1, self.capacity * 2))
+        slot = self.free_slots.pop()
+        self.id_to_slot[obj_id] = slot
+
+        self.ids[slot] = obj_id
+        self.bbox[slot] = det['bbox']
+        self.center[slot] = det['center']
+        self.class_id[slot] = det['class_id']
+        self.history_head[slot] = 0
+        self.area_count[slot] = 0
+        self.velocity_count[slot] = 0
+        self.state[slot] = STATE_SAFE
+        self.ttc[slot] = np.inf
+        self.avg_velocity[slot] = 0.0
+        self.frames_seen[slot] = 0
+        self.last_seen[slot] = self.current_frame
+        self.active[slot] = True
+        return slot
+
+    def remove(self, obj_id):
+        """Libera lo slot della traccia, che verrà riutilizzato."""
+        slot = self.id_to_slot.pop(obj_id)
+        self.active[slot] = False
+        self.free_slots.append(slot)
+
+    def update(self, slot, det, frame_width, frame_height, fps):
+        """
+        Aggiorna lo slot con la nuova detection e ricalcola TTC e stato
+        (stessa logica di TrackedObject.update).
+        :return: (codice_stato_precedente, codice_stato_nuovo)
+        """
+        x1, y1, x2, y2 = det['bbox']
+        center_x, center_y = det['center']
+        self.bbox[slot] = (x1, y1, x2, y2)
+        self.center[slot] = (center_x, center_y)
+        self.class_id[slot] = det['class_id']
+        self.frames_seen[slot] += 1
+        self.last_seen[slot] = self.current_frame
+
+        area = (x2 - x1) * (y2 - y1)
+        area_ratio = max(area / (frame_width * frame_height), 1e-6)
+
+        head = int(self.history_head[slot])
+        avg_velocity_proxy = 0.0
+        ttc = float('inf')
+
+        # --- CALCOLO VELOCITÀ E DISTANZA ---
+        if self.area_count[slot] > 0:
+            previous_area = self.area_history[slot, head - 1]
+            self.velocity_history[slot, head] = area - previous_area
+            count = min(int(self.velocity_count[slot]) + 1, self.history_len)
+            self.velocity_count[slot] = count
+            # Media della variazione di area nelle ultime misurazioni (il buffer circolare contiene solo quelle)
+            if count == self.history_len:
+                velocity_sum = self.velocity_history[slot].sum()
+            else:
+                velocity_sum = self.velocity_history[slot, _ring_indices(head, count, self.history_len)].sum()
+            avg_velocity_proxy = float(velocity_sum) / count
+
+            if avg_velocity_proxy > 0.0:
+                # Distanza (proxy) = 1 / area_ratio, in frame e poi in secondi con l'FPS effettivo
+                ttc = (1 / area_ratio) / avg_velocity_proxy / fps
+
+        self.area_history[slot, head] = area
+        self.area_count[slot] = min(int(self.area_count[slot]) + 1, self.history_len)
+        self.history_head[slot] = (head + 1) % self.history_len
+        self.ttc[slot] = ttc
+        self.avg_velocity[slot] = avg_velocity_proxy
+
+        # --- LOGICA DI TRANSIZIONE DI STATO ---
+        is_in_lane = frame_width * CORSIA[0] < center_x < frame_width * CORSIA[1]
+        code = classify_risk(ttc, is_in_lane, avg_velocity_proxy > VELOCITA_ALTA,
+                             area_ratio > AREA_VICINO, area_ratio)
+        old_code = int(self.state[slot])
+        if code != old_code:
+            if state_machine.DEBUG_STATE_CHANGES:
+                print(f"Veicolo {obj_label(self.ids[slot])}: {STATES[old_code].name} -> {STATES[code].name}")
+            self.state[slot] = code
+        return old_code, code
+
+    def update_batch(self, slots, bboxes, centers, class_ids, frame_width, frame_height, fps):
+        """
+        Versione vettoriale di update: aggiorna tutti gli slot indicati in un'unica passata NumPy
+        (aree, velocità dai buffer circolari, TTC, corsia e tabella di decisione).
+        Gli slot devono essere distinti. I risultati coincidono con update chiamato slot per slot.
+        :param slots: array di slot, uno per detection
+        :param bboxes: array Nx4 (x1, y1, x2, y2); centers: Nx2; class_ids: N
+        :return: (codici_stato_precedenti, codici_stato_nuovi), array allineati a slots
+        """
+        slots = np.asarray(slots, dtype=np.intp)
+        bboxes = np.asarray(bboxes)
+        centers = np.asarray(centers)
+        size = self.history_len
+
+        self.bbox[slots] = bboxes
+        self.center[slots] = centers
+        self.class_id[slots] = class_ids
+        self.frames_seen[slots] += 1
+        self.last_seen[slots] = self.current_frame
+
+        xyxy = bboxes.astype(np.int64)
+        area = ((xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])).astype(np.float64)
+        area_ratio = np.maximum(area / (frame_width * frame_height), 1e-6)
+
+        head = self.history_head[slots].astype(np.intp)
+        has_previous = self.area_count[slots] > 0
+
+        # --- CALCOLO VELOCITÀ E DISTANZA ---
+        # Variazione d'area rispetto all'ultima area del buffer (solo per chi ne ha una)
+        previous_area = self.area_history[slots, head - 1]
+        moving = slots[has_previous]
+        self.velocity_history[moving, head[has_previous]] = (area - previous_area)[has_previous]
+        count = np.where(has_previous, np.minimum(self.velocity_count[slots] + 1, size), self.velocity_count[slots])
+        self.velocity_count[slots] = count
+
+        # Media delle ultime count velocità: posizioni head, head-1, ... del buffer circolare
+        offsets = np.arange(size)
+        ring = (head[:, None] - offsets[None, :]) % size
+        valid = offsets[None, :] < count[:, None]
+        velocity_sum = np.where(valid, self.velocity_history[slots[:, None], ring], 0.0).sum(axis=1)
+        avg_velocity_proxy = np.where(has_previous, velocity_sum / np.maximum(count, 1), 0.0)
+
+        # TTC solo per chi si avvicina (velocità positiva), altrimenti infinito
+        approaching = has_previous & (avg_velocity_proxy > 0.0)
+        safe_velocity = np.where(approaching, avg_velocity_proxy, 1.0)
+        ttc = np.where(approaching, (1 / area_ratio) / safe_velocity / fps, np.inf)
+
+        self.area_history[slots, head] = area
+        self.area_count[slots] = np.minimum(self.area_count[slots] + 1, size)
+        self.history_head[slots] = (head + 1) % size
+        self.ttc[slots] = ttc
+        self.avg_velocity[slots] = avg_velocity_proxy
+
+        # --- LOGICA DI TRANSIZIONE DI STATO ---
+        center_x = centers[:, 0]
+        is_in_lane = (frame_width * CORSIA[0] < center_x) & (center_x < frame_width * CORSIA[1])
+        new_codes = classify_risk_batch(ttc, is_in_lane, avg_velocity_proxy > VELOCITA_ALTA,
+                                        area_ratio > AREA_VICINO, area_ratio)
+        old_codes = self.state[slots].copy()
+        if state_machine.DEBUG_STATE_CHANGES:
+            changed = old_codes != new_codes
+            for slot, old_code, code in zip(slots[changed].tolist(), old_codes[changed].tolist(),
+                                            new_codes[changed].tolist()):
+                print(f"Veicolo {obj_label(self.ids[slot])}: {STATES[old_code].name} -> {STATES[code].name}")
+        self.state[slots] = new_codes
+        return old_codes, new_codes
+
+    def get(self, obj_id):
+        """Vista sulla traccia obj_id (None se non esiste)."""
+        slot = self.id_to_slot.get(obj_id)
+        return TrackRecord(self, slot) if slot is not None else None
+
+    def __iter__(self):
+        for slot in self.id_to_slot.values():
+            yield TrackRecord(self, slot)
+
+
+def _ring_indices(head, count, size):
+    """Indici delle ultime count posizioni scritte, terminando in head (inclusa)."""
+    return [(head - i) % size for i in range(count)]
+
+
+def obj_label(obj_id):
+    return obj_id.item() if hasattr(obj_id, 'item') else obj_id
+
+
+class TrackRecord:
+    """
+    Vista su una riga della TrackTable con la stessa interfaccia di TrackedObject
+    (id, state, info), così il disegno e gli observer non cambiano.
+    """
+    __slots__ = ('table', 'slot')
+
+    def __init__(self, table, slot):
+        self.table = table
+        self.slot = slot
+
+    @property
+    def id(self):
+        return obj_label(self.table.ids[self.slot])
+
+    @property
+    def state(self):
+        return STATES[self.table.state[self.slot]]
+
+    @property
+    def frames_seen(self):
+        return int(self.table.frames_seen[self.slot])
+
+    @property
+    def frames_lost(self):
+        return int(self.table.current_frame - self.table.last_seen[self.slot])
+
+    @property
+    def is_visible(self):
+        """True se la traccia è stata vista nel frame corrente."""
+        return self.table.last_seen[self.slot] == self.table.current_frame
+
+    @property
+    def info(self):
+        return TrackInfo(self.table, self.slot)
+
+
+class TrackInfo(Mapping):
+    """Dizionario in sola lettura con gli ultimi dati della traccia (come TrackedObject.info)."""
+    __slots__ = ('table', 'slot')
+
+    KEYS = ('id', 'bbox', 'center', 'class_id', 'TTC', 'avg_velocity_proxy')
+
+    def __init__(self, table, slot):
+        self.table = table
+        self.slot = slot
+
+    def __getitem__(self, key):
+        table, slot = self.table, self.slot
+        if key == 'bbox':
+            return tuple(table.bbox[slot].tolist())
+        if key == 'center':
+            return tuple(table.center[slot].tolist())
+        if key == 'id':
+            return obj_label(table.ids[slot])
+        if key == 'class_id':
+            return int(table.class_id[slot])
+        if key == 'TTC':
+            return float(table.ttc[slot])
+        if key == 'avg_velocity_proxy':
+            return float(table.avg_velocity[slot])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
@@ -1,39 +1,69 @@
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import MongoClient, UpdateOne, InsertOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from src.data.storage import WriteBehindStorage
 
-class DBManager:
-    def __init__(self, uri="mongodb://localhost:27017/", db_name="idTracking_db", collection_name="tracked_objects"):
+class DBManager(WriteBehindStorage):
+    """
+    MongoDB backend. The writes go through the write-behind buffer of WriteBehindStorage
+    and reach the server as one unordered bulk_write per batch.
+    """
+    transient_errors = (PyMongoError,)
+
+    def __init__(self, uri="mongodb://localhost:27017/", db_name="idTracking_db", collection_name="tracked_objects",
+                 **options):
+        super().__init__(**options)
+        self.uri = uri
         self.client = MongoClient(uri)
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
+        self._indexes_ready = False
         print(f"Connected to MongoDB: {db_name}.{collection_name}")
+        self._start_writer()
+
+    def ping(self, timeout=2.0):
+        """Raises if the server does not answer within timeout seconds."""
+        # Separate probe client: maxTimeMS only limits the command on the server, while reaching
+        # the server is bounded by serverSelectionTimeoutMS (30 s by default)
+        probe = MongoClient(self.uri, serverSelectionTimeoutMS=int(timeout * 1000),
+                            connectTimeoutMS=int(timeout * 1000))
+        try:
+            probe.admin.command('ping', maxTimeMS=int(timeout * 1000))
+        finally:
+            probe.close()
+
+    def _ensure_indexes(self):
+        """Indexes on (source, track_id) (the upserts do not scan the collection) and on plate (lookups)."""
+        if self._indexes_ready:
+            return
+        self.collection.create_index([("source", 1), ("track_id", 1)])
+        self.collection.create_index("plate")
+        self._indexes_ready = True
+
+    def _write_batch(self, upserts, inserts):
+        # Created before the first write, in the writer thread: startup does not block if Mongo is down
+        self._ensure_indexes()
+        # source None also matches the documents written before sources existed (no source field)
+        operations = [UpdateOne({"source": source, "track_id": track_id}, update, upsert=True)
+                      for (source, track_id), update in upserts]
+        operations.extend(InsertOne(document) for document in inserts)
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Rejected by the server (e.g. validation): retrying would not help
+            errors = e.details.get("writeErrors", [])
+            print(f"DB ERROR: {len(errors)} writes rejected: {errors[:1]}")
+            return len(errors)
+        return 0
+
+    def find_by_track(self, track_id, source=None):
+        # The raw detections (save_detection) share the collection: only the object documents have created_at
+        return self.collection.find_one({"source": source, "track_id": track_id, "created_at": {"$exists": True}},
+                                        {"_id": 0})
+
+    def find_by_plate(self, plate_text):
+        return list(self.collection.find({"plate": plate_text, "created_at": {"$exists": True}}, {"_id": 0}))
 
-    def update_object_plate(self, obj_id, plate_text):
-        """
-        Updates the document for the given object ID with the detected license plate.
-        If the document doesn't exist, it creates one.
-        """
-        # Convert numpy types to native Python types for MongoDB
-        if hasattr(obj_id, 'item'):
-            obj_id = obj_id.item()
-
-        filter_query = {"track_id": obj_id}
-        update_query = {
-            "$set": {
-                "plate": plate_text,
-                "last_updated": datetime.now()
-            },
-            "$setOnInsert": {
-                "created_at": datetime.now()
-            }
-        }
-        self.collection.update_one(filter_query, update_query, upsert=True)
-        print(f"DB: Updated object {obj_id} with plate '{plate_text}'")
-        print(f"DB: Updated object {obj_id} with plate '{plate_text}'")
-
-    def save_detection(self, obj_data):
-        """
-        Saves a raw detection record (optional, if we want a history of all detections).
-        """
-        obj_data["timestamp"] = datetime.now()
-        self.collection.insert_one(obj_data)
+    def close(self, timeout=10.0):
+        """Flushes the buffer (at most timeout seconds) and closes the connection."""
+        self._stop_writer(timeout)
+        self.client.close()
@@ -0,0 +1,69 @@
+import json
+import threading
+from src.behavior.risk_observer import Observer
+
+
+class EventRecorder(Observer):
+    """
+    Observer that turns every event into a record (frame, time, event, track_id, message)
+    and keeps them in memory. It can be attached both to the TrackManager (track lifecycle,
+    state changes) and to the PlateRecognizer (confirmed plates, notified from the OCR thread).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frame_index = 0
+        self.timestamp = 0.0
+        self.event_counts = {}
+        self.records = []
+
+    def set_frame(self, frame_index, timestamp):
+        """Frame (index in the source video) and time in seconds attached to the next events."""
+        self.frame_index = frame_index
+        self.timestamp = timestamp
+
+    def update(self, event_type, track_id, message=""):
+        # Convert numpy types to native Python types for JSON
+        if hasattr(track_id, 'item'):
+            track_id = track_id.item()
+
+        record = {
+            "frame": self.frame_index,
+            "time": round(self.timestamp, 3),
+            "event": event_type,
+            "track_id": track_id,
+        }
+        if message:
+            record["message"] = message
+
+        with self.lock:
+            self._emit(record)
+            self.event_counts[event_type] = self.event_counts.get(event_type, 0) + 1
+
+    def _emit(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+
+class EventLogWriter(EventRecorder):
+    """EventRecorder that appends every record to a JSONL file (one JSON object per line)."""
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8")
+
+    def _emit(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+def write_event_log(path, records):
+    """Writes already collected records in the same JSONL format as EventLogWriter."""
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
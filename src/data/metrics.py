@@ -0,0 +1,205 @@
+import bisect
+import json
+import os
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter_ns
+
+# Fixed bucket bounds (ns), shared by every histogram: 8 log-spaced buckets per octave from 1 us
+# to ~137 s, so a percentile is off by at most ~9% and recording is a bisect plus an increment.
+BUCKETS_PER_OCTAVE = 8
+BUCKET_BOUNDS_NS = [int(1000 * 2 ** (i / BUCKETS_PER_OCTAVE)) for i in range(37 * BUCKETS_PER_OCTAVE + 1)]
+
+# Pipeline stages instrumented in the hot path
+STAGES = (
+    "frame",           # Whole main-loop iteration
+    "decode",          # VideoInputFacade.get_frame (includes waiting for the prefetch thread)
+    "detect",          # YOLO model.track
+    "reid",            # VisualMemory re-identification
+    "risk",            # TrackManager.update_tracks
+    "ocr_enqueue",     # Cropping and queueing plates on the main thread
+    "ocr_queue_wait",  # Time a crop waits in the OCRScheduler
+    "ocr",             # OCR worker latency per crop
+    "db_write",        # One storage batch
+    "render",          # HUD drawing and imshow on the render thread
+    "record",          # HUD drawing and encoding on the recorder thread
+)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (nanoseconds) with approximate percentiles."""
+    __slots__ = ('counts', 'count', 'total_ns', 'max_ns', '_lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_NS) + 1)  # Last bucket: above the highest bound
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self._lock = threading.Lock()  # Stages are recorded from several threads
+
+    def record(self, ns):
+        index = bisect.bisect_left(BUCKET_BOUNDS_NS, ns)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ns += ns
+            if ns > self.max_ns:
+                self.max_ns = ns
+
+    def percentile(self, q):
+        """Upper bound (ns) of the bucket holding the q-th percentile (0 < q <= 100)."""
+        with self._lock:
+            counts, count, max_ns = list(self.counts), self.count, self.max_ns
+        if not count:
+            return 0
+        target = count * q / 100.0
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= target:
+                # Never report more than the slowest sample actually seen
+                return min(BUCKET_BOUNDS_NS[index], max_ns) if index < len(BUCKET_BOUNDS_NS) else max_ns
+        return max_ns
+
+    def summary(self):
+        count = self.count
+        return {
+            "count": count,
+            "mean_ms": round(self.total_ns / count / 1e6, 3) if count else 0.0,
+            "p50_ms": round(self.percentile(50) / 1e6, 3),
+            "p95_ms": round(self.percentile(95) / 1e6, 3),
+            "p99_ms": round(self.percentile(99) / 1e6, 3),
+            "max_ms": round(self.max_ns / 1e6, 3),
+        }
+
+
+class MetricsRegistry:
+    """Per-stage latency histograms of this process."""
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        return histogram
+
+    def record_ns(self, stage, ns):
+        self.histogram(stage).record(ns)
+
+    def observe(self, stage, start_ns):
+        """Records the time since start_ns (a perf_counter_ns() value) for stage."""
+        self.histogram(stage).record(perf_counter_ns() - start_ns)
+
+    def record_seconds(self, stage, seconds):
+        """For durations measured elsewhere (e.g. by an OCR worker process)."""
+        self.histogram(stage).record(int(seconds * 1e9))
+
+    @contextmanager
+    def timed(self, stage):
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe(stage, start)
+
+    def summary(self):
+        """{stage: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}} for the stages recorded so far."""
+        return {stage: histogram.summary() for stage, histogram in list(self.histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def write_json(self, path):
+        """Writes the summary atomically (readers never see a half-written file)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def to_prometheus(self, prefix="safedrive"):
+        """Prometheus text exposition format: one histogram per stage (buckets in seconds)."""
+        name = f"{prefix}_stage_latency_seconds"
+        lines = [f"# HELP {name} Latency of each pipeline stage.", f"# TYPE {name} histogram"]
+        for stage, histogram in sorted(self.histograms.items()):
+            with histogram._lock:
+                counts, count, total_ns = list(histogram.counts), histogram.count, histogram.total_ns
+            cumulative = 0
+            # A bucket every octave is plenty for dashboards and keeps the scrape small
+            for index in range(0, len(BUCKET_BOUNDS_NS), BUCKETS_PER_OCTAVE):
+                cumulative += sum(counts[max(0, index - BUCKETS_PER_OCTAVE + 1):index + 1])
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{BUCKET_BOUNDS_NS[index] / 1e9:.9g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total_ns / 1e9:.9f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+# Registry of this process: the instrumented modules record here
+METRICS = MetricsRegistry()
+
+
+class MetricsExporter:
+    """
+    Periodic export of a registry:
+    - json_path: the summary is rewritten every interval seconds (and on close);
+    - prometheus_port: text-format endpoint on http://<host>:<port>/metrics (localhost by default).
+    """
+    def __init__(self, registry=METRICS, json_path=None, interval=5.0, prometheus_port=None, host="127.0.0.1"):
+        self.registry = registry
+        self.json_path = json_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.server = None
+
+        if prometheus_port is not None:
+            self.server = ThreadingHTTPServer((host, prometheus_port), _metrics_handler(registry))
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics-http").start()
+            print(f"Metrics: http://{host}:{self.server.server_address[1]}/metrics")
+        if json_path is not None:
+            self._thread = threading.Thread(target=self._export_loop, daemon=True, name="metrics-json")
+            self._thread.start()
+
+    def _export_loop(self):
+        while not self._stop.wait(self.interval):
+            self._write_json()
+
+    def _write_json(self):
+        try:
+            self.registry.write_json(self.json_path)
+        except OSError as e:
+            print(f"Metrics: could not write {self.json_path}: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._write_json()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def _metrics_handler(registry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # No access log on the console
+
+    return MetricsHandler
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from src.data.storage import WriteBehindStorage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracked_objects (
+    source       TEXT NOT NULL DEFAULT '',
+    track_id     INTEGER NOT NULL,
+    plate        TEXT,
+    created_at   TEXT NOT NULL,
+    last_updated TEXT NOT NULL,
+    PRIMARY KEY (source, track_id)
+);
+CREATE INDEX IF NOT EXISTS idx_tracked_objects_plate ON tracked_objects (plate);
+
+CREATE TABLE IF NOT EXISTS detections (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    track_id  INTEGER,
+    timestamp TEXT NOT NULL,
+    data      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_detections_track_id ON detections (track_id);
+"""
+
+# Databases created before tracks were keyed by source: the rows are kept with source ''
+MIGRATE_SQL = """
+ALTER TABLE tracked_objects RENAME TO tracked_objects_old;
+{schema}
+INSERT INTO tracked_objects (source, track_id, plate, created_at, last_updated)
+    SELECT '', track_id, plate, created_at, last_updated FROM tracked_objects_old;
+DROP TABLE tracked_objects_old;
+"""
+
+# Upsert: $set overwrites plate and last_updated, created_at ($setOnInsert) only on the first insert
+UPSERT_SQL = """
+INSERT INTO tracked_objects (source, track_id, plate, created_at, last_updated) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (source, track_id) DO UPDATE SET plate = excluded.plate, last_updated = excluded.last_updated
+"""
+OBJECT_COLUMNS = "source, track_id, plate, created_at, last_updated"
+INSERT_SQL = "INSERT INTO detections (track_id, timestamp, data) VALUES (?, ?, ?)"
+
+
+def _to_text(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+class SQLiteStorage(WriteBehindStorage):
+    """
+    Embedded backend for machines without MongoDB: a single SQLite file in WAL mode
+    (readers do not block the writer). Every batch of the write-behind buffer is one transaction;
+    tracks and plates are indexed for the lookups.
+    Writes happen on the writer thread's connection, lookups on a separate read connection.
+    """
+    transient_errors = (sqlite3.OperationalError,)  # e.g. "database is locked" with another process
+
+    def __init__(self, path="tracking.db", busy_timeout=5.0, **options):
+        super().__init__(**options)
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+        # Schema and WAL are set up once; the write connection is then used by the writer thread
+        # (or, with write_behind=False, by whichever thread writes, one at a time)
+        self._write_conn = self._connect()
+        self._migrate()
+        self._write_conn.executescript(SCHEMA)
+        self._write_lock = threading.Lock()
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+        print(f"Using SQLite storage: {path}")
+        self._start_writer()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL is durable across application crashes and much cheaper than FULL
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _migrate(self):
+        columns = [row[1] for row in self._write_conn.execute("PRAGMA table_info(tracked_objects)")]
+        if columns and "source" not in columns:
+            self._write_conn.executescript(f"BEGIN IMMEDIATE;\n{MIGRATE_SQL.format(schema=SCHEMA)}\nCOMMIT;")
+
+    def _write_batch(self, upserts, inserts):
+        with self._write_lock:
+            return self._write_transaction(upserts, inserts)
+
+    def _write_transaction(self, upserts, inserts):
+        conn = self._write_conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(UPSERT_SQL, [
+                (source or "", track_id, update["$set"].get("plate"),
+                 _to_text(update["$setOnInsert"].get("created_at", update["$set"].get("last_updated"))),
+                 _to_text(update["$set"].get("last_updated")))
+                for (source, track_id), update in upserts
+            ])
+            conn.executemany(INSERT_SQL, [
+                (document.get("track_id"), _to_text(document["timestamp"]),
+                 json.dumps(document, default=_json_default))
+                for document in inserts
+            ])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return 0
+
+    def _query(self, sql, params):
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def find_by_track(self, track_id, source=None):
+        rows = self._query(f"SELECT {OBJECT_COLUMNS} FROM tracked_objects WHERE source = ? AND track_id = ?",
+                           (source or "", track_id))
+        return _object_document(rows[0]) if rows else None
+
+    def find_by_plate(self, plate_text):
+        rows = self._query(f"SELECT {OBJECT_COLUMNS} FROM tracked_objects WHERE plate = ?", (plate_text,))
+        return [_object_document(row) for row in rows]
+
+    def find_detections(self, track_id):
+        """Raw detections saved for a track, oldest first."""
+        rows = self._query("SELECT data FROM detections WHERE track_id = ? ORDER BY id", (track_id,))
+        return [json.loads(data) for (data,) in rows]
+
+    def close(self, timeout=10.0):
+        """Flushes the buffer (at most timeout seconds) and closes the database."""
+        self._stop_writer(timeout)
+        if self._writer_thread is None or not self._writer_thread.is_alive():
+            with self._write_lock:
+                self._write_conn.close()
+        with self._read_lock:
+            self._read_conn.close()
+
+
+def _object_document(row):
+    source, track_id, plate, created_at, last_updated = row
+    return {
+        "source": source or None,
+        "track_id": track_id,
+        "plate": plate,
+        "created_at": datetime.fromisoformat(created_at),
+        "last_updated": datetime.fromisoformat(last_updated),
+    }
@@ -0,0 +1,336 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from src.data.metrics import METRICS
+
+
+class Storage(ABC):
+    """
+    Persistence interface for the tracked objects (plate per track) and the raw detections.
+    Backends: DBManager (MongoDB) and SQLiteStorage (embedded, for machines without Mongo).
+    Track IDs restart with every video, so a tracked object is keyed by (source, track_id):
+    source names the video (or camera) the track belongs to.
+    """
+    @abstractmethod
+    def update_object_plate(self, obj_id, plate_text, source=None):
+        pass
+
+    @abstractmethod
+    def save_detection(self, obj_data):
+        pass
+
+    @abstractmethod
+    def find_by_track(self, track_id, source=None):
+        """Document of the track ({"source", "track_id", "plate", "created_at", "last_updated"}) or None."""
+        pass
+
+    @abstractmethod
+    def find_by_plate(self, plate_text):
+        """Documents of every track that was assigned this plate."""
+        pass
+
+    def flush(self, timeout=None):
+        return True
+
+    def close(self, timeout=10.0):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class WriteBehindStorage(Storage):
+    """
+    Write-behind buffer shared by the backends: the callers only queue the changes, a background
+    thread writes them in one batch (_write_batch) when flush_size operations are buffered or
+    every flush_interval seconds.
+    - Upserts of the same (source, track_id) are coalesced (only the latest values are written).
+    - If the store is slow or unavailable (the backend's transient_errors) the batch is retried with
+      exponential backoff; meanwhile the buffer fills up to max_buffered operations, then the callers
+      wait (up to backpressure_timeout seconds, after which the operation is dropped and counted).
+    - close() flushes whatever is left.
+    With write_behind=False every call is written synchronously.
+    """
+    transient_errors = ()  # Exceptions worth retrying (connection lost, database locked, ...)
+
+    def __init__(self, write_behind=True, flush_size=100, flush_interval=1.0, max_buffered=10000,
+                 backpressure_timeout=5.0, max_retries=5, retry_backoff=0.5):
+        self.write_behind = write_behind
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.backpressure_timeout = backpressure_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._upserts = OrderedDict()   # {(source, track_id): {"$set": {...}, "$setOnInsert": {...}}}
+        self._inserts = []              # Raw documents (save_detection)
+        self._in_flight = 0             # Operations taken by the writer and not yet written
+        self._lock = threading.Lock()
+        self._has_work = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._flushed = threading.Condition(self._lock)
+        self._flush_requested = False
+        self._closed = False
+        self._writer_thread = None
+
+        # Counters exposed for monitoring
+        self.queued = 0       # Operations accepted
+        self.coalesced = 0    # Upserts merged into one already buffered for the same track
+        self.written = 0      # Operations written successfully
+        self.write_errors = 0 # Operations rejected by the store (not retried)
+        self.retries = 0      # Batches sent again after a transient error
+        self.failed = 0       # Operations lost after max_retries attempts
+        self.dropped = 0      # Operations dropped because the buffer stayed full
+        self.batches = 0      # Batches written
+        self.write_seconds = 0.0  # Time spent in _write_batch (to compare backends)
+
+    def _start_writer(self):
+        """To be called by the backend once its connection is ready."""
+        if self.write_behind:
+            self._writer_thread = threading.Thread(target=self._writer, daemon=True, name="storage-writer")
+            self._writer_thread.start()
+
+    @abstractmethod
+    def _write_batch(self, upserts, inserts):
+        """
+        Writes a batch in one round trip / transaction.
+        :param upserts: list of ((source, track_id), {"$set": {...}, "$setOnInsert": {...}})
+        :param inserts: list of documents
+        :return: number of operations rejected by the store (0 if all were written)
+        """
+        pass
+
+    def _buffered(self):
+        return len(self._upserts) + len(self._inserts)
+
+    def _wait_for_room(self):
+        """Backpressure: called with the lock held. Returns False if the operation must be dropped."""
+        if self._closed:
+            self.dropped += 1
+            return False
+        if self._buffered() < self.max_buffered:
+            return True
+        self._has_work.notify()
+        if self._not_full.wait_for(lambda: self._buffered() < self.max_buffered or self._closed,
+                                   timeout=self.backpressure_timeout) and not self._closed:
+            return True
+        self.dropped += 1
+        return False
+
+    def _queue_upsert(self, key, set_fields, set_on_insert):
+        with self._lock:
+            update = self._upserts.get(key)
+            if update is not None:
+                # Newer values win; the insert-only fields of the first call are kept
+                update["$set"].update(set_fields)
+                self.coalesced += 1
+            elif not self._wait_for_room():
+                return
+            else:
+                self._upserts[key] = {"$set": dict(set_fields), "$setOnInsert": dict(set_on_insert)}
+            self.queued += 1
+            if self._buffered() >= self.flush_size:
+                self._has_work.notify()
+
+    def _queue_insert(self, document):
+        with self._lock:
+            if not self._wait_for_room():
+                return
+            self._inserts.append(document)
+            self.queued += 1
+            if self._buffered() >= self.flush_size:
+                self._has_work.notify()
+
+    def update_object_plate(self, obj_id, plate_text, source=None):
+        """
+        Updates the document for the given object ID (of the given source) with the detected license plate.
+        If the document doesn't exist, it creates one.
+        """
+        # Convert numpy types to native Python types for the store
+        if hasattr(obj_id, 'item'):
+            obj_id = obj_id.item()
+
+        now = datetime.now()
+        update = {"$set": {"plate": plate_text, "last_updated": now}, "$setOnInsert": {"created_at": now}}
+        if self.write_behind:
+            self._queue_upsert((source, obj_id), update["$set"], update["$setOnInsert"])
+            print(f"DB: Queued plate '{plate_text}' for object {obj_id}")
+            return
+
+        self._write([((source, obj_id), update)], [])
+        print(f"DB: Updated object {obj_id} with plate '{plate_text}'")
+
+    def save_detection(self, obj_data):
+        """
+        Saves a raw detection record (optional, if we want a history of all detections).
+        """
+        obj_data["timestamp"] = datetime.now()
+        if self.write_behind:
+            self._queue_insert(obj_data)
+            return
+        self._write([], [obj_data])
+
+    def _take_batch(self):
+        """Called with the lock held: moves the buffered operations into a batch."""
+        upserts = list(self._upserts.items())
+        inserts = self._inserts
+        self._upserts = OrderedDict()
+        self._inserts = []
+        self._in_flight = len(upserts) + len(inserts)
+        self._not_full.notify_all()
+        return upserts, inserts
+
+    def _write(self, upserts, inserts):
+        """
+        Writes a batch, retrying with exponential backoff on transient errors.
+        Operations rejected by the store (e.g. validation) are counted and not retried.
+        """
+        count = len(upserts) + len(inserts)
+        delay = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                rejected = self._write_batch(upserts, inserts)
+                elapsed = time.perf_counter() - start
+                self.write_seconds += elapsed
+                METRICS.record_seconds("db_write", elapsed)
+                self.batches += 1
+                self.write_errors += rejected
+                self.written += count - rejected
+                return
+            except self.transient_errors as e:
+                # While closing a single retry is made, so shutdown is not held up for minutes
+                if attempt == self.max_retries or (self._closed and attempt > 0):
+                    break
+                self.retries += 1
+                print(f"DB: write failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay *= 2
+        self.failed += count
+        print(f"DB ERROR: {count} operations lost after {self.max_retries} retries")
+
+    def _writer(self):
+        """Background thread: flushes on size, on time, on flush() and on close()."""
+        while True:
+            with self._has_work:
+                self._has_work.wait_for(
+                    lambda: self._closed or self._flush_requested or self._buffered() >= self.flush_size,
+                    timeout=self.flush_interval)
+                closing = self._closed
+                self._flush_requested = False
+                upserts, inserts = self._take_batch() if self._buffered() else ([], [])
+
+            if upserts or inserts:
+                try:
+                    self._write(upserts, inserts)
+                except Exception as e:
+                    # Never let the writer die: the batch is lost, the next ones are still written
+                    self.failed += len(upserts) + len(inserts)
+                    print(f"DB ERROR: unexpected error while writing: {e}")
+
+            with self._lock:
+                self._in_flight = 0
+                if not self._buffered():
+                    self._flushed.notify_all()
+                if closing and not self._buffered():
+                    return
+
+    def flush(self, timeout=None):
+        """Asks the writer to write everything buffered and waits. Returns False on timeout."""
+        if self._writer_thread is None:
+            return True
+        with self._lock:
+            self._flush_requested = True
+            self._has_work.notify()
+            return self._flushed.wait_for(lambda: not self._buffered() and self._in_flight == 0, timeout=timeout)
+
+    def _stop_writer(self, timeout):
+        """Flushes the buffer (at most timeout seconds) and stops the writer thread."""
+        if self._writer_thread is not None and not self._closed:
+            with self._lock:
+                self._closed = True
+                self._has_work.notify()
+                self._not_full.notify_all()
+            self._writer_thread.join(timeout)
+        self._closed = True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": type(self).__name__,
+                "buffered": self._buffered(),
+                "in_flight": self._in_flight,
+                "queued": self.queued,
+                "coalesced": self.coalesced,
+                "written": self.written,
+                "write_errors": self.write_errors,
+                "retries": self.retries,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "avg_batch_ms": round(self.write_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            }
+
+
+# --- Istanza condivisa dal processo ---
+BACKENDS = ("auto", "mongo", "sqlite")
+
+_shared_storage = None
+_shared_lock = threading.Lock()
+
+
+def create_storage(backend="auto", mongo_uri="mongodb://localhost:27017/", sqlite_path="tracking.db", **options):
+    """
+    Builds a storage backend:
+      - "mongo": DBManager (needs pymongo and a reachable server)
+      - "sqlite": SQLiteStorage (embedded file, WAL mode)
+      - "auto": Mongo if it answers a ping within 2 seconds, otherwise SQLite
+    options are passed to the backend (flush_size, flush_interval, ...).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+    if backend in ("auto", "mongo"):
+        storage = None
+        try:
+            # Imported here: edge machines may not have pymongo installed at all
+            from src.data.db_manager import DBManager
+            storage = DBManager(uri=mongo_uri, **options)
+            if backend == "auto":
+                storage.ping(timeout=2.0)
+            return storage
+        except Exception as e:
+            if backend == "mongo":
+                raise
+            if storage is not None:
+                storage.close(timeout=0)
+            print(f"MongoDB not available ({e}): using SQLite at {sqlite_path}")
+
+    from src.data.sqlite_storage import SQLiteStorage
+    return SQLiteStorage(path=sqlite_path, **options)
+
+
+def open_shared_storage(backend="auto", **options):
+    """Creates the process-wide storage instance (once; later calls return the same one)."""
+    global _shared_storage
+    with _shared_lock:
+        if _shared_storage is None:
+            _shared_storage = create_storage(backend, **options)
+        return _shared_storage
+
+
+def get_shared_storage():
+    """The process-wide storage instance, opened with the default ("auto") if nobody opened it yet."""
+    return open_shared_storage()
+
+
+def close_shared_storage(timeout=10.0):
+    """Flushes and closes the process-wide instance (the next get_shared_storage() opens a new one)."""
+    global _shared_storage
+    with _shared_lock:
+        storage, _shared_storage = _shared_storage, None
+    if storage is not None:
+        storage.close(timeout)
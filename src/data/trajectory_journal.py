@@ -0,0 +1,277 @@
+import json
+import os
+import queue
+import threading
+import time
+import numpy as np
+from src.behavior.risk_observer import Observer
+
+# Columns of the trajectory table: one row per visible track per frame
+TRACK_COLUMNS = {
+    "frame": np.int64,
+    "time": np.float64,
+    "track_id": np.int64,
+    "bbox": (np.int32, 4),
+    "class_id": np.int16,
+    "state": np.int8,
+    "ttc": np.float32,
+    "velocity": np.float32,
+}
+INDEX_FILE = "index.jsonl"
+
+
+def _empty_columns(rows):
+    columns = {}
+    for name, spec in TRACK_COLUMNS.items():
+        dtype, width = spec if isinstance(spec, tuple) else (spec, None)
+        columns[name] = np.empty((rows, width) if width else rows, dtype=dtype)
+    return columns
+
+
+class TrajectoryJournal(Observer):
+    """
+    Streaming journal of the per-frame track geometry, for analytics without re-running YOLO.
+    Rows (frame, time, track_id, bbox, class_id, state, ttc, velocity) are gathered straight from
+    the TrackTable columns into a preallocated chunk of chunk_rows rows; a full chunk is handed to
+    a background thread that writes it as chunk_NNNNNN.npz in the journal directory and appends its
+    summary (frame/time/track range, track ids) to index.jsonl, which the reader uses to open only
+    the chunks it needs.
+    As an Observer it also journals the events (NEW_TRACK, STATE_CHANGE, PLATE_CONFIRMED, ...) into
+    the same chunks.
+    Memory is bounded: at most max_pending_chunks chunks wait for the writer; if the disk cannot keep
+    up the caller waits up to backpressure_timeout seconds, then the chunk is dropped and counted.
+    """
+    def __init__(self, path, chunk_rows=65536, max_pending_chunks=4, compress=True, backpressure_timeout=5.0):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.compress = compress
+        self.backpressure_timeout = backpressure_timeout
+        os.makedirs(path, exist_ok=True)
+
+        self.frame_index = 0
+        self.timestamp = 0.0
+        self.lock = threading.Lock()  # Events arrive also from the OCR threads
+        self._columns = _empty_columns(chunk_rows)
+        self._rows = 0
+        self._events = []
+        # Numbering continues after the chunks already in the directory (append to an existing journal)
+        self._next_chunk = len(_read_index(path))
+
+        self._pending = queue.Queue(maxsize=max_pending_chunks)
+        self._closed = False
+        self._writer_thread = threading.Thread(target=self._writer, daemon=True, name="journal-writer")
+        self._writer_thread.start()
+
+        # Counters exposed for monitoring
+        self.rows_written = 0
+        self.events_written = 0
+        self.chunks_written = 0
+        self.rows_dropped = 0
+        self.write_seconds = 0.0
+
+    def set_frame(self, frame_index, timestamp):
+        """Frame (index in the source video) and time in seconds of the next rows and events."""
+        self.frame_index = frame_index
+        self.timestamp = timestamp
+
+    def record(self, table, slots):
+        """Appends one row per slot of the TrackTable (the tracks visible in the current frame)."""
+        if not len(slots):
+            return
+        slots = np.asarray(slots, dtype=np.intp)
+        with self.lock:
+            start = 0
+            while start < len(slots):
+                take = slots[start:start + self.chunk_rows - self._rows]
+                rows = slice(self._rows, self._rows + len(take))
+                columns = self._columns
+                columns["frame"][rows] = self.frame_index
+                columns["time"][rows] = self.timestamp
+                columns["track_id"][rows] = table.ids[take]
+                columns["bbox"][rows] = table.bbox[take]
+                columns["class_id"][rows] = table.class_id[take]
+                columns["state"][rows] = table.state[take]
+                columns["ttc"][rows] = table.ttc[take]
+                columns["velocity"][rows] = table.avg_velocity[take]
+                self._rows += len(take)
+                start += len(take)
+                if self._rows == self.chunk_rows:
+                    self._seal()
+
+    def update(self, event_type, track_id, message=""):
+        if hasattr(track_id, 'item'):
+            track_id = track_id.item()
+        with self.lock:
+            self._events.append((self.frame_index, self.timestamp, track_id, event_type, message))
+
+    def _seal(self):
+        """Called with the lock held: hands the current chunk to the writer and starts a new one."""
+        if not self._rows and not self._events:
+            return
+        columns = {name: column[:self._rows] for name, column in self._columns.items()}
+        events = self._events
+        chunk_id = self._next_chunk
+        self._next_chunk += 1
+        self._columns = _empty_columns(self.chunk_rows)
+        self._rows = 0
+        self._events = []
+        try:
+            self._pending.put((chunk_id, columns, events), timeout=self.backpressure_timeout)
+        except queue.Full:
+            self.rows_dropped += len(columns["frame"])
+            print(f"JOURNAL: writer too slow, chunk {chunk_id} dropped")
+
+    def _writer(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            start = time.perf_counter()
+            try:
+                self._write_chunk(*item)
+            except Exception as e:
+                # Never let the writer die: the chunk is lost, the next ones are still written
+                self.rows_dropped += len(item[1]["frame"])
+                print(f"JOURNAL ERROR: could not write chunk {item[0]}: {e}")
+            self.write_seconds += time.perf_counter() - start
+
+    def _write_chunk(self, chunk_id, columns, events):
+        name = f"chunk_{chunk_id:06d}.npz"
+        arrays = dict(columns)
+        arrays["event_frame"] = np.array([e[0] for e in events], dtype=np.int64)
+        arrays["event_time"] = np.array([e[1] for e in events], dtype=np.float64)
+        arrays["event_track_id"] = np.array([e[2] for e in events], dtype=np.int64)
+        arrays["event_type"] = np.array([e[3] for e in events], dtype=str)
+        arrays["event_message"] = np.array([e[4] for e in events], dtype=str)
+        save = np.savez_compressed if self.compress else np.savez
+        save(os.path.join(self.path, name), **arrays)
+
+        # The index line is appended only after the chunk is on disk: a crash leaves no dangling entry
+        frames = np.concatenate([columns["frame"], arrays["event_frame"]])
+        times = np.concatenate([columns["time"], arrays["event_time"]])
+        track_ids = np.union1d(columns["track_id"], arrays["event_track_id"])
+        entry = {
+            "file": name,
+            "rows": len(columns["frame"]),
+            "events": len(events),
+            "frame_min": int(frames.min()),
+            "frame_max": int(frames.max()),
+            "time_min": float(times.min()),
+            "time_max": float(times.max()),
+            "track_ids": track_ids.tolist(),
+        }
+        with open(os.path.join(self.path, INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.rows_written += entry["rows"]
+        self.events_written += entry["events"]
+        self.chunks_written += 1
+
+    def flush(self):
+        """Hands the partial chunk to the writer (it is written as a smaller chunk)."""
+        with self.lock:
+            self._seal()
+
+    def close(self, timeout=30.0):
+        """Writes the partial chunk and waits (at most timeout seconds) for the writer."""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._pending.put(None)
+        self._writer_thread.join(timeout)
+
+    def stats(self):
+        return {
+            "rows_written": self.rows_written,
+            "events_written": self.events_written,
+            "chunks_written": self.chunks_written,
+            "rows_dropped": self.rows_dropped,
+            "pending_chunks": self._pending.qsize(),
+            "avg_chunk_ms": round(self.write_seconds / self.chunks_written * 1000, 2) if self.chunks_written else 0.0,
+        }
+
+
+class _ColumnCache(dict):
+    def __init__(self, npz):
+        super().__init__()
+        self.npz = npz
+
+    def __missing__(self, name):
+        column = self[name] = self.npz[name]
+        return column
+
+
+def _read_index(path):
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class TrajectoryReader:
+    """
+    Reads a TrajectoryJournal directory. The index is loaded once; every query opens only the
+    chunks whose frame/time range or track ids can match, and only the columns it returns.
+    Results are dicts of NumPy columns (same names as TRACK_COLUMNS), sorted by frame.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.chunks = _read_index(path)
+        self._track_sets = [set(chunk["track_ids"]) for chunk in self.chunks]
+
+    def track_ids(self):
+        """Every track id in the journal."""
+        return sorted(set().union(*self._track_sets))
+
+    def frame_range(self):
+        if not self.chunks:
+            return None
+        return min(c["frame_min"] for c in self.chunks), max(c["frame_max"] for c in self.chunks)
+
+    def track(self, track_id):
+        """Trajectory of one track."""
+        chunks = [c for c, ids in zip(self.chunks, self._track_sets) if track_id in ids]
+        return self._load(chunks, TRACK_COLUMNS, lambda d: d["track_id"] == track_id)
+
+    def frames(self, start, end):
+        """Rows with start <= frame < end."""
+        chunks = [c for c in self.chunks if c["frame_max"] >= start and c["frame_min"] < end]
+        return self._load(chunks, TRACK_COLUMNS, lambda d: (d["frame"] >= start) & (d["frame"] < end))
+
+    def time_range(self, start, end):
+        """Rows with start <= time < end (seconds)."""
+        chunks = [c for c in self.chunks if c["time_max"] >= start and c["time_min"] < end]
+        return self._load(chunks, TRACK_COLUMNS, lambda d: (d["time"] >= start) & (d["time"] < end))
+
+    def events(self, track_id=None, event_type=None):
+        """Journaled events (frame, time, track_id, type, message), optionally filtered."""
+        chunks = [c for c, ids in zip(self.chunks, self._track_sets)
+                  if c["events"] and (track_id is None or track_id in ids)]
+
+        def select(data):
+            mask = np.ones(len(data["event_frame"]), dtype=bool)
+            if track_id is not None:
+                mask &= data["event_track_id"] == track_id
+            if event_type is not None:
+                mask &= data["event_type"] == event_type
+            return mask
+        columns = ("event_frame", "event_time", "event_track_id", "event_type", "event_message")
+        result = self._load(chunks, columns, select, sort_by="event_frame")
+        return {name[len("event_"):]: column for name, column in result.items()}
+
+    def _load(self, chunks, columns, select, sort_by="frame"):
+        parts = {name: [] for name in columns}
+        for chunk in chunks:
+            with np.load(os.path.join(self.path, chunk["file"])) as npz:
+                # Each column is decompressed at most once, and only if the query reads it
+                data = _ColumnCache(npz)
+                mask = select(data)
+                for name in columns:
+                    parts[name].append(data[name][mask])
+        if not chunks:
+            empty = _empty_columns(0)
+            return {name: empty.get(name, np.empty(0)) for name in columns}
+        result = {name: np.concatenate(arrays) for name, arrays in parts.items()}
+        order = np.argsort(result[sort_by], kind="stable")
+        return {name: column[order] for name, column in result.items()}
@@ -0,0 +1,104 @@
+import threading
+from collections import deque
+
+# Politiche di riempimento del buffer
+POLICY_BLOCK = "block"              # File video: il decoder aspetta il consumatore (nessun frame perso)
+POLICY_DROP_OLDEST = "drop_oldest"  # Webcam: si scarta il frame più vecchio (latenza minima)
+
+
+class FrameRingBuffer:
+    """
+    Buffer circolare limitato tra il thread di decodifica (produttore) e il main loop (consumatore).
+    Con POLICY_BLOCK il produttore si ferma quando il buffer è pieno,
+    con POLICY_DROP_OLDEST sovrascrive il frame più vecchio.
+    """
+    def __init__(self, capacity=8, policy=POLICY_BLOCK, on_drop=None):
+        if capacity < 1:
+            raise ValueError("La capacità del buffer deve essere almeno 1")
+        if policy not in (POLICY_BLOCK, POLICY_DROP_OLDEST):
+            raise ValueError(f"Politica non valida: {policy}")
+
+        self.capacity = capacity
+        self.policy = policy
+        # Callback chiamata con il frame scartato (es. per restituirlo a un pool)
+        self.on_drop = on_drop
+
+        self._frames = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+
+        # Contatori esposti per il monitoraggio
+        self.frames_queued = 0   # Frame inseriti in totale
+        self.frames_dropped = 0  # Frame scartati per buffer pieno
+
+    def put(self, frame):
+        """
+        Inserisce un frame. Ritorna False se il buffer è stato chiuso.
+        """
+        dropped = None
+        with self._not_full:
+            if self.policy == POLICY_BLOCK:
+                while len(self._frames) >= self.capacity and not self._closed:
+                    self._not_full.wait()
+            if self._closed:
+                return False
+
+            if len(self._frames) >= self.capacity:
+                # POLICY_DROP_OLDEST: il consumatore è lento, buttiamo il frame più vecchio
+                dropped = self._frames.popleft()
+                self.frames_dropped += 1
+
+            self._frames.append(frame)
+            self.frames_queued += 1
+            self._not_empty.notify()
+
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+        return True
+
+    def get(self, timeout=None):
+        """
+        Estrae il frame più vecchio. Ritorna None se il buffer è chiuso e vuoto
+        (fine del video) o se scade il timeout.
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._frames or self._closed, timeout=timeout):
+                return None
+            if not self._frames:
+                return None
+            frame = self._frames.popleft()
+            self._not_full.notify()
+            return frame
+
+    def close(self):
+        """Segnala la fine dello stream e sveglia chi è in attesa."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def drain(self):
+        """Svuota il buffer e restituisce i frame ancora presenti."""
+        with self._lock:
+            frames = list(self._frames)
+            self._frames.clear()
+            self._not_full.notify_all()
+        return frames
+
+    @property
+    def depth(self):
+        """Numero di frame attualmente in coda."""
+        with self._lock:
+            return len(self._frames)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": len(self._frames),
+                "capacity": self.capacity,
+                "queued": self.frames_queued,
+                "dropped": self.frames_dropped,
+                "policy": self.policy,
+            }
@@ -0,0 +1,155 @@
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class FramePool:
+    """
+    Pool di buffer preallocati tutti della stessa forma (es. frame 1080p).
+    Invece di allocare un'immagine nuova per ogni frame, si prende un buffer libero
+    con acquire() e lo si restituisce con release() quando non serve più.
+    """
+    def __init__(self, shape, size=4, dtype=np.uint8, grow=True):
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        # Se grow è False e il pool è esaurito, acquire() ritorna None
+        self.grow = grow
+
+        self._lock = threading.Lock()
+        self._free = [np.empty(self.shape, dtype=self.dtype) for _ in range(size)]
+        # id() dei buffer creati dal pool: release() ignora array estranei
+        self._owned = {id(buf) for buf in self._free}
+
+        self.allocated = size
+        self.misses = 0  # Volte in cui il pool era vuoto
+
+    def acquire(self):
+        """Restituisce un buffer libero (il contenuto è indefinito)."""
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.misses += 1
+            if not self.grow:
+                return None
+            buf = np.empty(self.shape, dtype=self.dtype)
+            self._owned.add(id(buf))
+            self.allocated += 1
+            return buf
+
+    def release(self, buf):
+        """Rimette il buffer nel pool. Gli array non creati dal pool vengono ignorati."""
+        if buf is None:
+            return
+        with self._lock:
+            if id(buf) in self._owned:
+                self._free.append(buf)
+
+    def owns(self, buf):
+        return buf is not None and id(buf) in self._owned
+
+    def stats(self):
+        with self._lock:
+            return {
+                "allocated": self.allocated,
+                "free": len(self._free),
+                "in_use": self.allocated - len(self._free),
+                "misses": self.misses,
+            }
+
+
+class CropPool:
+    """
+    Slot preallocati per i ritagli (crop) di dimensione variabile.
+    Ogni slot ha la forma massima (di solito quella del frame): il crop viene copiato
+    nell'angolo in alto a sinistra e si lavora su una vista slot[:h, :w].
+    """
+    def __init__(self, max_shape, size=8, dtype=np.uint8):
+        self.max_shape = tuple(max_shape)
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self._slots = self._allocate_slots()
+        self._free = list(range(size))
+        self._lock = threading.Lock()
+
+        self.dropped = 0  # Crop rifiutati perché tutti gli slot erano occupati
+
+    def _allocate_slots(self):
+        return [np.empty(self.max_shape, dtype=self.dtype) for _ in range(self.size)]
+
+    def store(self, region):
+        """
+        Copia region in uno slot libero.
+        :return: (slot_id, vista sul crop) oppure (None, None) se il pool è pieno.
+        """
+        h, w = region.shape[:2]
+        if h > self.max_shape[0] or w > self.max_shape[1]:
+            return None, None
+
+        with self._lock:
+            if not self._free:
+                self.dropped += 1
+                return None, None
+            slot_id = self._free.pop()
+
+        view = self._slots[slot_id][:h, :w]
+        np.copyto(view, region)
+        return slot_id, view
+
+    def release(self, slot_id):
+        """Restituisce lo slot al pool dopo l'elaborazione."""
+        if slot_id is None:
+            return
+        with self._lock:
+            self._free.append(slot_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "slots": len(self._slots),
+                "free": len(self._free),
+                "dropped": self.dropped,
+            }
+
+
+class SharedCropPool(CropPool):
+    """
+    CropPool i cui slot stanno in un unico blocco di memoria condivisa: un altro processo
+    legge il crop con attach_shared_slots(nome, forma, size) senza che venga serializzato.
+    Il processo che crea il pool deve chiamare close() per liberare la memoria.
+    """
+    def __init__(self, max_shape, size=8, dtype=np.uint8):
+        slot_bytes = int(np.prod(max_shape)) * np.dtype(dtype).itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, slot_bytes * size))
+        self.shm_name = self._shm.name
+        super().__init__(max_shape, size, dtype)
+
+    def _allocate_slots(self):
+        return shared_slot_views(self._shm, self.max_shape, self.size, self.dtype)
+
+    def close(self):
+        """Rilascia e cancella il blocco condiviso (gli slot non sono più utilizzabili)."""
+        if self._shm is None:
+            return
+        self._slots = []
+        try:
+            self._shm.close()
+        except BufferError:
+            # Qualche vista su un crop è ancora viva: la mappatura sparirà con il processo
+            pass
+        self._shm.unlink()
+        self._shm = None
+
+
+def shared_slot_views(shm, max_shape, size, dtype=np.uint8):
+    """Viste NumPy sugli slot di un blocco creato da SharedCropPool."""
+    block = np.ndarray((size,) + tuple(max_shape), dtype=dtype, buffer=shm.buf)
+    return [block[index] for index in range(size)]
+
+
+def attach_shared_slots(shm_name, max_shape, size, dtype=np.uint8):
+    """
+    Apre da un altro processo il blocco di uno SharedCropPool.
+    :return: (SharedMemory, lista di slot); chiudere la SharedMemory dopo aver eliminato le viste.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    return shm, shared_slot_views(shm, max_shape, size, dtype)
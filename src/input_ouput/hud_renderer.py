@@ -0,0 +1,190 @@
+import threading
+import time
+import cv2
+import numpy as np
+from src.behavior.state_machine import STATES, STATE_SAFE
+from src.data.metrics import METRICS
+
+# Colore della dashboard per il rischio aggregato (il più alto tra i veicoli visibili)
+RISK_COLORS = {0: (0, 255, 0), 1: (0, 255, 255), 2: (0, 0, 255)}  # Verde, giallo, rosso
+METRICS_REFRESH = 0.5  # Secondi tra un aggiornamento e l'altro del riepilogo latenze a schermo
+
+
+def snapshot_tracks(table, slots):
+    """
+    Copia (colonne NumPy) dei dati da disegnare per gli slot visibili della TrackTable.
+    Serve al thread di rendering: la tabella intanto viene aggiornata dal frame successivo.
+    """
+    slots = np.asarray(slots, dtype=np.intp)
+    return {
+        "ids": table.ids[slots],
+        "bbox": table.bbox[slots],
+        "state": table.state[slots],
+        "ttc": table.ttc[slots],
+        "velocity": table.avg_velocity[slots],
+    }
+
+
+class HudRenderer:
+    """
+    Visualizzazione fuori dal percorso critico della detection, su un thread dedicato.
+    submit() riduce subito il frame alla dimensione della finestra (è anche la copia: il frame
+    originale torna al pool) e lo consegna insieme a una copia degli stati delle tracce; il thread
+    di rendering disegna box ed etichette sul frame GIÀ ridotto, con coordinate scalate, e mostra
+    un'unica finestra.
+    C'è un solo frame in attesa: se il rendering è più lento della detection il frame non ancora
+    disegnato viene sostituito dal nuovo (e contato come scartato), senza code.
+    Con enabled=False (nessuna finestra, es. server) submit() non fa nulla.
+    Tasti: 'q' chiede l'uscita (quit_requested), 'm' mostra/nasconde le latenze per stadio (p50/p95/p99).
+    """
+    def __init__(self, window_name="SafeDrive", display_size=(1280, 720), enabled=True, show_metrics=False):
+        self.window_name = window_name
+        self.display_size = display_size
+        self.enabled = enabled
+        self.quit_requested = False  # Impostato quando l'utente preme 'q'
+        self.show_metrics = show_metrics
+        self._metrics_lines = []
+        self._metrics_updated = 0.0
+
+        # Triplo buffer: uno in scrittura (submit), uno in attesa, uno in disegno
+        width, height = display_size
+        self._back = np.empty((height, width, 3), dtype=np.uint8)
+        self._pending = np.empty_like(self._back)
+        self._front = np.empty_like(self._back)
+        self._pending_info = None  # (snapshot, fps) del frame in attesa, None se non c'è
+        self._lock = threading.Lock()
+        self._has_frame = threading.Condition(self._lock)
+        self._closed = False
+
+        # Contatori per il monitoraggio
+        self.submitted = 0
+        self.rendered = 0
+        self.dropped_stale = 0  # Frame sostituiti prima di essere disegnati
+        self.draw_seconds = 0.0
+
+        self._thread = None
+        if enabled:
+            self._thread = threading.Thread(target=self._render_loop, daemon=True, name="hud-renderer")
+            self._thread.start()
+
+    def submit(self, frame, table, slots, fps):
+        """
+        Consegna l'ultimo frame elaborato. Non blocca: il costo è la riduzione e la copia delle colonne.
+        :param table, slots: TrackTable e slot visibili (TrackManager.tracks e visible_slots)
+        :param fps: FPS della detection, mostrato nella dashboard
+        """
+        if not self.enabled or self._closed:
+            return
+        frame_h, frame_w = frame.shape[:2]
+        cv2.resize(frame, self.display_size, dst=self._back, interpolation=cv2.INTER_AREA)
+        snapshot = snapshot_tracks(table, slots)
+        # Fattori di scala per le coordinate dei box
+        scale = (self.display_size[0] / frame_w, self.display_size[1] / frame_h)
+
+        with self._lock:
+            self._back, self._pending = self._pending, self._back
+            if self._pending_info is not None:
+                self.dropped_stale += 1
+            self._pending_info = (snapshot, scale, fps)
+            self.submitted += 1
+            self._has_frame.notify()
+
+    def _render_loop(self):
+        cv2.namedWindow(self.window_name, cv2.WINDOW_AUTOSIZE)
+        while True:
+            with self._lock:
+                # Il timeout fa girare waitKey anche senza frame nuovi: la finestra resta reattiva
+                self._has_frame.wait_for(lambda: self._pending_info is not None or self._closed, timeout=0.05)
+                if self._closed:
+                    break
+                info = self._pending_info
+                if info is not None:
+                    self._front, self._pending = self._pending, self._front
+                    self._pending_info = None
+
+            if info is not None:
+                start = time.perf_counter()
+                draw_hud(self._front, *info, overlay_lines=self._overlay_lines())
+                cv2.imshow(self.window_name, self._front)
+                elapsed = time.perf_counter() - start
+                self.draw_seconds += elapsed
+                METRICS.record_seconds("render", elapsed)
+                self.rendered += 1
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                self.quit_requested = True
+            elif key == ord('m'):
+                self.show_metrics = not self.show_metrics
+        cv2.destroyWindow(self.window_name)
+
+    def _overlay_lines(self):
+        """Riepilogo delle latenze per stadio, ricalcolato al massimo ogni METRICS_REFRESH secondi."""
+        if not self.show_metrics:
+            return None
+        now = time.monotonic()
+        if now - self._metrics_updated >= METRICS_REFRESH:
+            self._metrics_updated = now
+            self._metrics_lines = [
+                f"{stage:<14} p50 {s['p50_ms']:7.2f}  p95 {s['p95_ms']:7.2f}  p99 {s['p99_ms']:7.2f} ms"
+                for stage, s in METRICS.summary().items()
+            ]
+        return self._metrics_lines
+
+    def close(self, timeout=2.0):
+        with self._lock:
+            self._closed = True
+            self._has_frame.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "rendered": self.rendered,
+            "dropped_stale": self.dropped_stale,
+            "avg_draw_ms": round(self.draw_seconds / self.rendered * 1000, 2) if self.rendered else 0.0,
+        }
+
+
+def draw_hud(image, snapshot, scale, fps, overlay_lines=None):
+    """
+    Disegna box, etichette e dashboard sull'immagine già ridotta (coordinate scalate con scale).
+    overlay_lines: righe di testo aggiuntive sotto la dashboard (es. le latenze per stadio).
+    """
+    sx, sy = scale
+    boxes = np.empty_like(snapshot["bbox"])
+    boxes[:, 0::2] = np.rint(snapshot["bbox"][:, 0::2] * sx)
+    boxes[:, 1::2] = np.rint(snapshot["bbox"][:, 1::2] * sy)
+
+    max_code = STATE_SAFE
+    for obj_id, (x1, y1, x2, y2), code, ttc, velocity in zip(
+            snapshot["ids"].tolist(), boxes.tolist(), snapshot["state"].tolist(),
+            snapshot["ttc"].tolist(), snapshot["velocity"].tolist()):
+        state = STATES[code]
+        color = state.color
+        max_code = max(max_code, code)
+
+        # Box e etichetta con sfondo colorato per leggibilità
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+        label = f"ID:{obj_id} [{state.name}]"
+        (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        cv2.rectangle(image, (x1, y1 - 20), (x1 + w, y1), color, -1)
+        cv2.putText(image, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+
+        # Metriche sotto l'etichetta, dentro il box: TTC e velocità proxy
+        ttc_str = f"TTC: {ttc:.2f} s" if ttc < float('inf') else "TTC: Inf"
+        cv2.putText(image, ttc_str, (x1 + 3, y1 + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1)
+        cv2.putText(image, f"V. PROXY: {velocity:.0f}", (x1 + 3, y1 + 32),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1)
+
+    # --- DASHBOARD DI SISTEMA (IN ALTO A SINISTRA) ---
+    cv2.putText(image, f"RISCHIO AGGREGATO: {STATES[max_code].name}", (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, RISK_COLORS[max_code], 2)
+    cv2.putText(image, f"FPS: {fps:.1f} | Tracciati: {len(boxes)}", (10, 60),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+    if overlay_lines:
+        # Sfondo scuro per leggere il testo sopra il video
+        height = 18 * len(overlay_lines) + 8
+        image[70:70 + height, 5:505] //= 3
+        for row, line in enumerate(overlay_lines):
+            cv2.putText(image, line, (10, 86 + 18 * row), cv2.FONT_HERSHEY_PLAIN, 1.0, (255, 255, 255), 1)
@@ -1,12 +1,31 @@
 import cv2                   #In parole semplici: è il "cervello" che permette ai computer di "vedere" e capire cosa c'è in un'immagine o in un video
+import threading
+from time import perf_counter_ns
+from src.input_ouput.frame_buffer import FrameRingBuffer, POLICY_BLOCK, POLICY_DROP_OLDEST
+from src.input_ouput.frame_pool import FramePool
+from src.data.metrics import METRICS
 
 class VideoInputFacade:      #Inizializza la sorgente video
-    def __init__(self, source_path): #parametro  video_source: Percorso del file video (es. "assets/video.mp4") oppure 0 per la webcam
-                                
+    def __init__(self, source_path, prefetch=False, buffer_size=8, drop_policy=None, use_pool=True,
+                 frame_stride=1, start_time=None, end_time=None, target_size=None): #parametro  video_source: Percorso del file video (es. "assets/video.mp4") oppure 0 per la webcam
+        """
+        :param prefetch: se True un thread decodifica i frame in anticipo in un buffer circolare.
+        :param buffer_size: numero massimo di frame decodificati in attesa.
+        :param drop_policy: POLICY_BLOCK o POLICY_DROP_OLDEST. Se None: block per i file, drop_oldest per la webcam.
+        :param use_pool: decodifica in buffer preallocati e riutilizzati (FramePool).
+            Attenzione: il frame restituito resta valido solo fino alla chiamata successiva di get_frame().
+        :param frame_stride: elabora un frame ogni N (gli altri vengono saltati con grab(), senza decodifica completa).
+        :param start_time: secondo da cui iniziare (solo file video).
+        :param end_time: secondo in cui fermarsi, escluso (solo file video).
+        :param target_size: (larghezza, altezza) a cui ridurre i frame subito dopo la decodifica.
+        """
+        if frame_stride < 1:
+            raise ValueError("frame_stride deve essere almeno 1")
         self.video_source = source_path
+        self.is_live = str(source_path).isdigit()
 
     # Se source_path è un numero (es. 0), lo converte in int per la webcam
-        if str(source_path).isdigit():                                          #questo controllo serve a capire se l'input è una stringa o un numero , se è una stringa e quindi un mercorso di un video lo apre altrimenti lo converte in un numero e in base al numero esegue derminati comportamenti per esempio se metto 0 si riferisce alla webcam di defaultdel pc , se metto 1 alla webcam esterna collegata tramite usb eccusb ecc 
+        if self.is_live:                                          #questo controllo serve a capire se l'input è una stringa o un numero , se è una stringa e quindi un mercorso di un video lo apre altrimenti lo converte in un numero e in base al numero esegue derminati comportamenti per esempio se metto 0 si riferisce alla webcam di defaultdel pc , se metto 1 alla webcam esterna collegata tramite usb eccusb ecc 
             source_path = int(source_path)
             
         self.capture = cv2.VideoCapture(source_path)
@@ -14,34 +33,181 @@ class VideoInputFacade:      #Inizializza la sorgente video
         if not self.capture.isOpened():
             raise ValueError(f"Errore: Impossibile aprire il video o la webcam: {source_path}")
 
-    def get_frame(self):
+        # DECIMAZIONE E RIDUZIONE: per l'analisi offline non serve decodificare tutto a piena risoluzione
+        self.frame_stride = frame_stride
+        self.target_size = tuple(target_size) if target_size is not None else None
+        self._raw_frame = None  # Buffer della decodifica a piena risoluzione (usato solo con target_size)
+
+        # Indice (nel video sorgente) del prossimo frame da leggere e dell'ultimo restituito
+        self._next_index = 0
+        self._end_index = None
+        self._last_read_index = -1
+        self.frame_index = -1  # Indice dell'ultimo frame consegnato da get_frame()
+
+        source_fps = self.capture.get(cv2.CAP_PROP_FPS)
+        if not self.is_live:
+            if start_time:
+                self.capture.set(cv2.CAP_PROP_POS_MSEC, start_time * 1000.0)
+                self._next_index = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+            if end_time is not None and source_fps > 0:
+                self._end_index = int(round(end_time * source_fps))
+
+        # POOL DI FRAME: buffer preallocati con la dimensione del video.
+        # Servono: quello in uso dal main loop, quello in decodifica e quelli nel buffer di prefetch.
+        self.frame_pool = None
+        self._current_frame = None
+        width, height, _ = self.get_video_info()
+        if use_pool and width > 0 and height > 0:
+            pool_size = (buffer_size + 2) if prefetch else 1
+            self.frame_pool = FramePool((height, width, 3), size=pool_size)
+
+        # PREFETCH: il decoder lavora in parallelo al detector
+        self.buffer = None
+        self._decoder_thread = None
+        self._stop_event = threading.Event()
+        if prefetch:
+            if drop_policy is None:
+                # Con la webcam non vogliamo accumulare ritardo, con i file non vogliamo perdere frame
+                drop_policy = POLICY_DROP_OLDEST if self.is_live else POLICY_BLOCK
+            # Nel buffer viaggiano coppie (frame, indice); i frame scartati tornano subito nel pool
+            self.buffer = FrameRingBuffer(capacity=buffer_size, policy=drop_policy,
+                                          on_drop=lambda item: self._release_buffer(item[0]))
+            self._decoder_thread = threading.Thread(target=self._decode_loop, daemon=True)
+            self._decoder_thread.start()
+
+    def _skip_frames(self):
+        """Salta i frame tra uno elaborato e l'altro: grab() avanza senza convertire l'immagine."""
+        if self._last_read_index < 0:
+            return True
+        for _ in range(self.frame_stride - 1):
+            if self._end_index is not None and self._next_index >= self._end_index:
+                return False
+            if not self.capture.grab():
+                return False
+            self._next_index += 1
+        return True
+
+    def _read_frame(self):
         """
-        Restituisce il prossimo frame del video.
-        :return: Il frame (immagine) se disponibile, altrimenti None (fine video).
+        Legge un frame direttamente dalla sorgente.
+        :return: (frame, indice nel video sorgente) oppure (None, -1) a fine video.
         """
-        ret, frame = self.capture.read()
+        if not self._skip_frames():
+            return None, -1
+        if self._end_index is not None and self._next_index >= self._end_index:
+            return None, -1
+
+        target = self.frame_pool.acquire() if self.frame_pool is not None else None
+
+        if self.target_size is None:
+            # Con image=target OpenCV decodifica direttamente nel buffer preallocato
+            ret, frame = self.capture.read(image=target) if target is not None else self.capture.read()
+        else:
+            # Decodifica nel buffer a piena risoluzione e riduzione diretta nel buffer del pool
+            ret, self._raw_frame = self.capture.read(image=self._raw_frame)
+            frame = None
+            if ret:
+                frame = cv2.resize(self._raw_frame, self.target_size, dst=target, interpolation=cv2.INTER_AREA)
 
         #cv2.imshow('Frame', frame)
         
         if not ret:
-            return None
+            self._release_buffer(target)
+            return None, -1
+        if frame is not target:
+            # Il backend ha riallocato (es. cambio risoluzione): il buffer del pool non è stato usato
+            self._release_buffer(target)
+
+        index = self._next_index
+        self._next_index += 1
+        self._last_read_index = index
+        return frame, index
+
+    def _release_buffer(self, frame):
+        if self.frame_pool is not None:
+            self.frame_pool.release(frame)
+
+    def _decode_loop(self):
+        """Thread di decodifica: riempie il buffer finché il video non finisce o viene chiuso."""
+        try:
+            while not self._stop_event.is_set():
+                frame, index = self._read_frame()
+                if frame is None:
+                    break
+                if not self.buffer.put((frame, index)):
+                    break
+        finally:
+            self.buffer.close()
+
+    def get_frame(self):
+        """
+        Restituisce il prossimo frame del video.
+        :return: Il frame (immagine) se disponibile, altrimenti None (fine video).
+        """
+        start = perf_counter_ns()
+        # Il frame precedente non serve più al main loop: torna nel pool
+        self._release_buffer(self._current_frame)
+        self._current_frame = None
+
+        if self.buffer is not None:
+            item = self.buffer.get()
+            frame, index = item if item is not None else (None, -1)
+        else:
+            frame, index = self._read_frame()
+        self._current_frame = frame
+        # Con il prefetch il decoder è avanti: esponiamo l'indice del frame consegnato
+        self.frame_index = index
+        METRICS.observe("decode", start)
         return frame
 
+    def get_buffer_stats(self):
+        """
+        Contatori del prefetch: frame in coda, inseriti e scartati.
+        Senza prefetch ritorna None.
+        """
+        if self.buffer is None:
+            return None
+        return self.buffer.stats()
+
     def get_video_info(self):
         """
         Restituisce larghezza, altezza e FPS. Utile per salvare il video output dopo.
+        Sono i valori EFFETTIVI dei frame restituiti: dimensione dopo target_size
+        e FPS diviso per frame_stride (serve al calcolo corretto del TTC).
         """
+        width, height, fps = self.get_source_info()
+        if self.target_size is not None:
+            width, height = self.target_size
+        return width, height, fps / self.frame_stride
+
+    def get_source_info(self):
+        """Larghezza, altezza e FPS originali della sorgente."""
         width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = self.capture.get(cv2.CAP_PROP_FPS)
         return width, height, fps
 
+    def get_frame_count(self):
+        """Numero totale di frame del file sorgente (0 o negativo per la webcam)."""
+        return int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
     def release(self):
         """
         Chiude correttamente la risorsa video.
         """
+        if self._decoder_thread is not None:
+            # Fermiamo il decoder prima di rilasciare la capture (che sta usando)
+            self._stop_event.set()
+            self.buffer.close()
+            self._decoder_thread.join(timeout=2.0)
+            for frame, _ in self.buffer.drain():
+                self._release_buffer(frame)
         self.capture.release()
-        cv2.destroyAllWindows()
+        try:
+            cv2.destroyAllWindows()
+        except cv2.error:
+            # Build di OpenCV senza GUI (server headless): non ci sono finestre da chiudere
+            pass
     
 
     
\ No newline at end of file
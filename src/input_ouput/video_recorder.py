@@ -0,0 +1,186 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+import cv2
+from src.behavior.risk_observer import Observer
+from src.input_ouput.frame_pool import FramePool
+from src.input_ouput.hud_renderer import draw_hud, snapshot_tracks
+from src.data.metrics import METRICS
+
+# Modalità di registrazione
+MODE_CONTINUOUS = "continuous"  # Tutto il video
+MODE_CLIPS = "clips"            # Solo clip di pochi secondi attorno alle transizioni in DANGER
+
+
+class _RecordedFrame:
+    __slots__ = ('image', 'snapshot', 'scale', 'fps', 'danger')
+
+    def __init__(self, image, snapshot, scale, fps, danger):
+        self.image = image
+        self.snapshot = snapshot
+        self.scale = scale
+        self.fps = fps
+        self.danger = danger
+
+
+class VideoRecorder(Observer):
+    """
+    Registra il video annotato (box, etichette e dashboard come nella finestra) con cv2.VideoWriter,
+    su un thread dedicato alimentato da una coda limitata: il main loop paga solo la riduzione del
+    frame (in un buffer del pool) e la copia degli stati; HUD e codifica avvengono nel thread.
+    Se l'encoder non tiene il passo i frame vengono scartati e contati, il main loop non aspetta mai.
+    - every: registra un frame ogni N (decimazione); frame_size: dimensione del video in uscita.
+    - mode=MODE_CLIPS: tiene in memoria gli ultimi pre_seconds di video e, a ogni evento DANGER,
+      scrive una clip <nome>_clip_NNN<ext> da pre_seconds prima a post_seconds dopo l'ultimo DANGER.
+      Attenzione alla memoria: pre_seconds * FPS frame di frame_size restano nel buffer.
+    Da collegare al TrackManager con attach() (sincrono: il DANGER va associato al frame giusto).
+    """
+    def __init__(self, path, fps, frame_size=(1280, 720), every=1, mode=MODE_CONTINUOUS,
+                 pre_seconds=3.0, post_seconds=5.0, queue_size=32, fourcc="mp4v"):
+        if every < 1:
+            raise ValueError("every deve essere almeno 1")
+        if mode not in (MODE_CONTINUOUS, MODE_CLIPS):
+            raise ValueError(f"Modalità di registrazione non valida: {mode}")
+        self.path = path
+        self.frame_size = tuple(frame_size)
+        self.every = every
+        self.mode = mode
+        self.output_fps = fps / every if fps > 0 else 30.0
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.pre_frames = int(round(pre_seconds * self.output_fps)) if mode == MODE_CLIPS else 0
+        self.post_frames = max(1, int(round(post_seconds * self.output_fps)))
+
+        width, height = self.frame_size
+        # Buffer: quelli in coda, quelli del pre-evento, quello in codifica e quello in riempimento
+        self.pool = FramePool((height, width, 3), size=queue_size + self.pre_frames + 2, grow=False)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._frame_count = 0
+        self._danger_pending = False  # DANGER arrivato dopo l'ultimo frame registrato
+
+        self._writer = None
+        if mode == MODE_CONTINUOUS:
+            # Aperto subito: un percorso o un codec non validi si scoprono all'avvio
+            self._writer = self._open_writer(path)
+
+        # Contatori per il monitoraggio
+        self.submitted = 0
+        self.skipped = 0   # Frame saltati per la decimazione
+        self.dropped = 0   # Frame persi perché la coda (o il pool) era piena
+        self.written = 0
+        self.clips = 0
+        self.encode_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._encode_loop, daemon=True, name="video-recorder")
+        self._thread.start()
+
+    def _open_writer(self, path):
+        writer = cv2.VideoWriter(path, self.fourcc, self.output_fps, self.frame_size)
+        if not writer.isOpened():
+            raise ValueError(f"Impossibile scrivere il video: {path}")
+        return writer
+
+    def update(self, event_type, track_id, message=""):
+        if event_type == "DANGER":
+            self._danger_pending = True
+
+    def submit(self, frame, table, slots, fps):
+        """Accoda il frame elaborato (con gli stati delle tracce visibili). Non blocca mai."""
+        self._frame_count += 1
+        if (self._frame_count - 1) % self.every:
+            self.skipped += 1
+            return
+        self.submitted += 1
+
+        image = self.pool.acquire()
+        if image is None:
+            self.dropped += 1
+            return
+        frame_h, frame_w = frame.shape[:2]
+        cv2.resize(frame, self.frame_size, dst=image, interpolation=cv2.INTER_AREA)
+        scale = (self.frame_size[0] / frame_w, self.frame_size[1] / frame_h)
+        danger, self._danger_pending = self._danger_pending, False
+        try:
+            self._queue.put_nowait(_RecordedFrame(image, snapshot_tracks(table, slots), scale, fps, danger))
+        except queue.Full:
+            self.pool.release(image)
+            self.dropped += 1
+            # Il DANGER non va perso con il frame: apre la clip al prossimo frame registrato
+            self._danger_pending = self._danger_pending or danger
+
+    def _write(self, item):
+        start = time.perf_counter()
+        try:
+            draw_hud(item.image, item.snapshot, item.scale, item.fps)
+            self._writer.write(item.image)
+        finally:
+            # Il buffer torna al pool una sola volta (image = None: già restituito)
+            self.pool.release(item.image)
+            item.image = None
+        elapsed = time.perf_counter() - start
+        self.encode_seconds += elapsed
+        METRICS.record_seconds("record", elapsed)
+        self.written += 1
+
+    def _clip_path(self):
+        stem, ext = os.path.splitext(self.path)
+        return f"{stem}_clip_{self.clips:03d}{ext or '.mp4'}"
+
+    def _encode_loop(self):
+        pre_buffer = deque()
+        clip_remaining = 0  # Frame ancora da scrivere nella clip aperta
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                if self.mode == MODE_CONTINUOUS:
+                    self._write(item)
+                    continue
+
+                if item.danger:
+                    if self._writer is None:
+                        self._writer = self._open_writer(self._clip_path())
+                        self.clips += 1
+                        while pre_buffer:
+                            self._write(pre_buffer.popleft())
+                    # Ogni nuovo DANGER prolunga la clip
+                    clip_remaining = self.post_frames
+                if self._writer is not None:
+                    self._write(item)
+                    clip_remaining -= 1
+                    if clip_remaining <= 0:
+                        self._writer.release()
+                        self._writer = None
+                    continue
+
+                pre_buffer.append(item)
+                if len(pre_buffer) > self.pre_frames:
+                    self.pool.release(pre_buffer.popleft().image)
+            except Exception as e:
+                # Il thread non deve morire: il frame è perso, i successivi vengono registrati
+                self.pool.release(item.image)
+                print(f"Errore nella registrazione del video: {e}")
+
+        for item in pre_buffer:
+            self.pool.release(item.image)
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+    def close(self, timeout=10.0):
+        """Codifica i frame ancora in coda (al massimo timeout secondi) e chiude il file."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "written": self.written,
+            "clips": self.clips,
+            "queued": self._queue.qsize(),
+            "avg_encode_ms": round(self.encode_seconds / self.written * 1000, 2) if self.written else 0.0,
+        }
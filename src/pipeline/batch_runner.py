@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import glob
+import cv2
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.input_ouput.video_facade import VideoInputFacade
+from src.input_ouput.video_recorder import VideoRecorder
+from src.data.event_log import EventLogWriter
+from src.data.storage import open_shared_storage
+from src.data.trajectory_journal import TrajectoryJournal
+from src.data.metrics import METRICS
+from src.pipeline.video_pipeline import VideoPipeline
+
+
+def available_cores():
+    """Core utilizzabili da questo processo (rispetta l'affinità impostata da container/taskset)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def expand_video_paths(patterns):
+    """Espande i pattern glob (es. "assets/*.mp4") mantenendo l'ordine e senza duplicati."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def _limit_threads(num_threads):
+    """
+    Ogni processo usa pochi thread: con N processi in parallelo, lasciare a torch/OpenCV
+    tutti i core porterebbe a N x core thread in competizione.
+    """
+    cv2.setNumThreads(num_threads)
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def process_video(video_path, output_dir, model_name="yolov8s.pt", enable_ocr=True,
+                  frame_stride=1, target_size=None, prefetch=True, threads_per_worker=None, max_frames_lost=15, ocr_workers=0,
+                  plate_localizer="none", plate_model=None, storage_backend="auto", sqlite_path="tracking.db",
+                  journal=False, record=None, record_every=1, record_size=(1280, 720)):
+    """
+    Elabora un video senza GUI. Scrive:
+      - <nome>.events.jsonl: eventi delle tracce, cambi di stato, targhe confermate
+      - <nome>.summary.json: riepilogo del throughput
+      - <nome>.journal/: con journal=True, traiettorie per frame ed eventi (vedi TrajectoryReader)
+      - <nome>.annotated.mp4: con record="continuous" il video annotato (uno ogni record_every frame,
+        ridotto a record_size), con record="clips" solo le clip attorno ai DANGER (<nome>.annotated_clip_NNN.mp4)
+    Le targhe confermate vanno nello storage condiviso dal processo (storage_backend: "auto", "mongo"
+    o "sqlite"), aperto una volta sola anche se il worker elabora più video, con il percorso del video
+    come source: gli ID delle tracce ripartono da capo a ogni video.
+    :return: il riepilogo (dict)
+    """
+    if threads_per_worker is not None:
+        _limit_threads(threads_per_worker)
+    # Il worker può elaborare più video: le latenze del riepilogo sono solo di questo
+    METRICS.reset()
+    if enable_ocr:
+        open_shared_storage(storage_backend, sqlite_path=sqlite_path)
+
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(str(video_path)))[0]
+    events_path = os.path.join(output_dir, f"{stem}.events.jsonl")
+    summary_path = os.path.join(output_dir, f"{stem}.summary.json")
+
+    video_loader = VideoInputFacade(video_path, prefetch=prefetch,
+                                    frame_stride=frame_stride, target_size=target_size)
+    width, height, fps = video_loader.get_video_info()
+    _, _, source_fps = video_loader.get_source_info()
+
+    event_log = EventLogWriter(events_path)
+    trajectory_journal = TrajectoryJournal(os.path.join(output_dir, f"{stem}.journal")) if journal else None
+    pipeline = VideoPipeline(model_name=model_name, enable_ocr=enable_ocr, observers=[event_log],
+                             max_frames_lost=max_frames_lost, ocr_workers=ocr_workers,
+                             plate_localizer=plate_localizer, plate_model=plate_model,
+                             journal=trajectory_journal, source=str(video_path))
+    recorder = None
+    if record:
+        recorder = VideoRecorder(os.path.join(output_dir, f"{stem}.annotated.mp4"), fps, frame_size=record_size,
+                                 every=record_every, mode=record)
+        pipeline.manager.attach(recorder)
+
+    frames = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            frame = video_loader.get_frame()
+            if frame is None:
+                break
+            frames += 1
+
+            timestamp = video_loader.frame_index / source_fps if source_fps > 0 else 0.0
+            event_log.set_frame(video_loader.frame_index, timestamp)
+            if trajectory_journal is not None:
+                trajectory_journal.set_frame(video_loader.frame_index, timestamp)
+            pipeline.process_frame(frame, width, height, fps)
+            if recorder is not None:
+                recorder.submit(frame, pipeline.manager.tracks, pipeline.manager.visible_slots, fps)
+
+        processing_time = time.perf_counter() - start
+        ocr_drained = pipeline.close()
+    finally:
+        buffer_stats = video_loader.get_buffer_stats()
+        video_loader.release()
+        event_log.close()
+        if trajectory_journal is not None:
+            trajectory_journal.close()
+        if recorder is not None:
+            recorder.close()
+
+    total_time = time.perf_counter() - start
+    summary = {
+        "video": str(video_path),
+        "frames": frames,
+        "width": width,
+        "height": height,
+        "effective_fps": fps,
+        "frame_stride": frame_stride,
+        "processing_seconds": round(processing_time, 3),
+        "total_seconds": round(total_time, 3),
+        "throughput_fps": round(frames / processing_time, 2) if processing_time > 0 else 0.0,
+        "ocr_drained": ocr_drained,
+        "ocr": pipeline.ocr_stats(),
+        "events": dict(event_log.event_counts),
+        "prefetch": buffer_stats,
+        "journal": trajectory_journal.stats() if trajectory_journal is not None else None,
+        "recording": recorder.stats() if recorder is not None else None,
+        "latency": METRICS.summary(),
+        "events_file": events_path,
+    }
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def process_videos(video_paths, output_dir, workers=None, **options):
+    """
+    Elabora più video in parallelo con un pool di processi (uno per file alla volta).
+    :return: lista dei riepiloghi, nello stesso ordine di video_paths
+    """
+    cores = available_cores()
+    if workers is None:
+        workers = cores
+    workers = max(1, min(workers, len(video_paths)))
+    # I core vengono divisi tra i processi
+    options.setdefault("threads_per_worker", max(1, cores // workers))
+
+    if workers == 1:
+        return [process_video(path, output_dir, **options) for path in video_paths]
+
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_video, path, output_dir, **options): path for path in video_paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                summaries[path] = future.result()
+            except Exception as e:
+                print(f"Errore durante l'elaborazione di {path}: {e}")
+                summaries[path] = {"video": str(path), "error": str(e)}
+    return [summaries[path] for path in video_paths]
@@ -0,0 +1,305 @@
+import os
+import json
+import math
+import time
+import cv2
+from concurrent.futures import ProcessPoolExecutor
+from src.input_ouput.video_facade import VideoInputFacade
+from src.data.event_log import EventRecorder, write_event_log
+from src.data.storage import open_shared_storage
+from src.pipeline.video_pipeline import VideoPipeline
+from src.pipeline.batch_runner import available_cores, _limit_threads
+from src.processing.geometry import bbox_iou
+
+
+def align_to_stride(frames, frame_stride):
+    """Arrotonda per eccesso a un multiplo di frame_stride (i frame davvero letti dai segmenti)."""
+    return math.ceil(frames / frame_stride) * frame_stride
+
+
+def plan_segments(total_frames, num_segments, overlap_frames, frame_stride=1):
+    """
+    Divide il video in segmenti contigui. Ogni segmento (tranne il primo) inizia a leggere
+    overlap_frames prima del suo inizio "proprio": in quella finestra anche il segmento precedente
+    è attivo, ed è lì che si ricuciono gli ID.
+    Gli indici sono allineati a frame_stride, così i due segmenti vedono gli stessi frame.
+    :return: lista di (indice, inizio_lettura, inizio_proprio, fine_esclusa)
+    """
+    seg_len = math.ceil(total_frames / num_segments)
+    seg_len = align_to_stride(seg_len, frame_stride)
+    overlap_frames = align_to_stride(overlap_frames, frame_stride)
+
+    segments = []
+    for index in range(num_segments):
+        own_start = index * seg_len
+        end = min(total_frames, own_start + seg_len)
+        if own_start >= end:
+            break
+        read_start = max(0, own_start - overlap_frames)
+        segments.append((index, read_start, own_start, end))
+    return segments
+
+
+def process_segment(video_path, read_start, own_start, end, overlap_frames, source_fps,
+                    model_name="yolov8s.pt", enable_ocr=True, frame_stride=1, target_size=None,
+                    prefetch=True, threads_per_worker=None, max_frames_lost=15, ocr_workers=0,
+                    plate_localizer="none", plate_model=None, storage_backend="auto", sqlite_path="tracking.db"):
+    """
+    Worker: elabora [read_start, end) con un ObjectDetector/TrackManager indipendente.
+    Oltre agli eventi registra, per le finestre di sovrapposizione, i box per frame
+    e l'istogramma colore (VisualMemory) di ogni traccia, necessari alla ricucitura.
+    Le targhe NON vanno nello storage: gli ID del segmento sono locali, le scrive
+    process_video_segmented dopo la ricucitura (storage_backend e sqlite_path sono usati lì).
+    """
+    if threads_per_worker is not None:
+        _limit_threads(threads_per_worker)
+
+    video_loader = VideoInputFacade(video_path, prefetch=prefetch, frame_stride=frame_stride,
+                                    target_size=target_size,
+                                    start_time=read_start / source_fps if read_start > 0 else None,
+                                    end_time=end / source_fps)
+    width, height, fps = video_loader.get_video_info()
+
+    recorder = EventRecorder()
+    pipeline = VideoPipeline(model_name=model_name, enable_ocr=enable_ocr, observers=[recorder],
+                             max_frames_lost=max_frames_lost, ocr_workers=ocr_workers,
+                             plate_localizer=plate_localizer, plate_model=plate_model, save_plates=False)
+    memory = pipeline.detector.memory
+
+    # Finestra iniziale (condivisa col segmento precedente) e finale (condivisa col successivo)
+    head, head_hists = {}, {}
+    tail, tail_hists = {}, {}
+    tail_start = end - overlap_frames
+
+    frames = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            frame = video_loader.get_frame()
+            if frame is None:
+                break
+            index = video_loader.frame_index
+            if index >= own_start:
+                frames += 1
+
+            recorder.set_frame(index, index / source_fps)
+            detections = pipeline.process_frame(frame, width, height, fps)
+
+            if index < own_start or index >= tail_start:
+                boxes = {}
+                hists = head_hists if index < own_start else tail_hists
+                for det in detections:
+                    obj_id = int(det['id'])
+                    boxes[obj_id] = tuple(int(v) for v in det['bbox'])
+                    hist = memory.get_hist(obj_id)
+                    if hist is not None:
+                        # Copia: la memoria può riutilizzare il buffer dell'istogramma
+                        hists[obj_id] = hist.copy()
+                if index < own_start:
+                    head[index] = boxes
+                else:
+                    tail[index] = boxes
+
+        processing_time = time.perf_counter() - start
+        pipeline.close()
+    finally:
+        video_loader.release()
+
+    return {
+        "own_start": own_start,
+        "end": end,
+        "events": recorder.records,
+        "head": head,
+        "head_hists": head_hists,
+        "tail": tail,
+        "tail_hists": tail_hists,
+        "alive_at_end": [int(obj.id) for obj in pipeline.manager.get_tracks()],
+        "frames": frames,
+        "processing_seconds": processing_time,
+        "width": width,
+        "height": height,
+        "effective_fps": fps,
+    }
+
+
+def match_boundary(prev, cur, min_iou=0.3, hist_weight=0.5):
+    """
+    Abbina le tracce del segmento corrente a quelle del precedente nella finestra di sovrapposizione.
+    Punteggio = IoU medio dei box nei frame in comune + correlazione degli istogrammi colore.
+    :return: {id_locale_corrente: id_locale_precedente}
+    """
+    iou_sum, common = {}, {}
+    for index, cur_boxes in cur["head"].items():
+        prev_boxes = prev["tail"].get(index)
+        if not prev_boxes:
+            continue
+        for cur_id, cur_box in cur_boxes.items():
+            for prev_id, prev_box in prev_boxes.items():
+                key = (prev_id, cur_id)
+                common[key] = common.get(key, 0) + 1
+                iou_sum[key] = iou_sum.get(key, 0.0) + bbox_iou(prev_box, cur_box)
+
+    candidates = []
+    for key, total in iou_sum.items():
+        mean_iou = total / common[key]
+        if mean_iou < min_iou:
+            continue
+        prev_id, cur_id = key
+        color_sim = 0.0
+        prev_hist = prev["tail_hists"].get(prev_id)
+        cur_hist = cur["head_hists"].get(cur_id)
+        if prev_hist is not None and cur_hist is not None:
+            color_sim = max(0.0, cv2.compareHist(prev_hist, cur_hist, cv2.HISTCMP_CORREL))
+        score = (1 - hist_weight) * mean_iou + hist_weight * color_sim
+        candidates.append((score, prev_id, cur_id))
+
+    # Assegnazione greedy uno-a-uno, dal punteggio più alto
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    matches, used_prev = {}, set()
+    for score, prev_id, cur_id in candidates:
+        if cur_id in matches or prev_id in used_prev:
+            continue
+        matches[cur_id] = prev_id
+        used_prev.add(prev_id)
+    return matches
+
+
+def stitch_segments(results, source_fps, min_iou=0.3, hist_weight=0.5):
+    """
+    Unisce gli eventi dei segmenti in un unico flusso con ID globali, nello stesso formato
+    di un'elaborazione seriale. Gli eventi della finestra iniziale di ogni segmento sono scartati
+    (li ha già prodotti il segmento precedente).
+    """
+    merged = []
+    next_global_id = 1
+    prev, prev_map = None, {}
+
+    for result in results:
+        own_start = result["own_start"]
+        matches = match_boundary(prev, result, min_iou, hist_weight) if prev is not None else {}
+
+        id_map = {cur_id: prev_map[prev_id] for cur_id, prev_id in matches.items()}
+
+        def global_id(local_id):
+            nonlocal next_global_id
+            if local_id not in id_map:
+                id_map[local_id] = next_global_id
+                next_global_id += 1
+            return id_map[local_id]
+
+        if prev is not None:
+            boundary_time = round(own_start / source_fps, 3)
+            # Tracce del segmento precedente ancora vive ma non proseguite: perse al confine
+            continued = set(matches.values())
+            for prev_id in prev["alive_at_end"]:
+                if prev_id not in continued:
+                    merged.append({"frame": own_start, "time": boundary_time,
+                                   "event": "LOST_TRACK", "track_id": prev_map[prev_id]})
+            # Tracce nate nella finestra e non abbinate: il loro NEW_TRACK è stato scartato
+            if result["head"]:
+                last_head = result["head"][max(result["head"])]
+                for cur_id in sorted(last_head):
+                    if cur_id not in matches:
+                        merged.append({"frame": own_start, "time": boundary_time,
+                                       "event": "NEW_TRACK", "track_id": global_id(cur_id)})
+
+        for record in result["events"]:
+            if record["frame"] < own_start:
+                continue
+            record = dict(record)
+            record["track_id"] = global_id(record["track_id"])
+            merged.append(record)
+
+        # Anche le tracce vive a fine segmento senza eventi propri devono avere un ID globale
+        for local_id in result["alive_at_end"]:
+            global_id(local_id)
+        prev, prev_map = result, id_map
+
+    merged.sort(key=lambda r: r["frame"])
+    return merged
+
+
+def save_confirmed_plates(events, source, storage_backend="auto", sqlite_path="tracking.db"):
+    """
+    Scrive nello storage le targhe confermate (eventi PLATE_CONFIRMED) con gli ID GLOBALI della
+    ricucitura. Gli eventi sono in ordine di frame: se una targa viene superata vince l'ultima.
+    """
+    plates = [(record["track_id"], record["message"]) for record in events
+              if record["event"] == "PLATE_CONFIRMED" and record.get("message")]
+    if not plates:
+        return
+    storage = open_shared_storage(storage_backend, sqlite_path=sqlite_path)
+    for track_id, plate in plates:
+        storage.update_object_plate(track_id, plate, source=source)
+    storage.flush(timeout=10.0)
+
+
+def process_video_segmented(video_path, output_dir, segments=None, overlap_seconds=2.0, workers=None,
+                            min_iou=0.3, hist_weight=0.5, threads_per_worker=None, **options):
+    """
+    Elabora UN video lungo dividendolo in segmenti sovrapposti elaborati in parallelo.
+    Scrive gli stessi file di process_video (<nome>.events.jsonl e <nome>.summary.json).
+    """
+    cores = available_cores()
+    if workers is None:
+        workers = cores
+    if segments is None:
+        segments = workers
+    if threads_per_worker is None:
+        threads_per_worker = max(1, cores // max(1, min(workers, segments)))
+
+    probe = VideoInputFacade(video_path, use_pool=False)
+    total_frames = probe.get_frame_count()
+    _, _, source_fps = probe.get_source_info()
+    probe.release()
+    if total_frames <= 0 or source_fps <= 0:
+        raise ValueError(f"Impossibile segmentare {video_path}: durata sconosciuta (webcam o stream?)")
+
+    # Stesso allineamento di plan_segments: la coda di ogni segmento deve coincidere con la
+    # testa del successivo, altrimenti la ricucitura confronta finestre diverse
+    frame_stride = options.get("frame_stride", 1)
+    overlap_frames = align_to_stride(int(round(overlap_seconds * source_fps)), frame_stride)
+    plan = plan_segments(total_frames, segments, overlap_frames, frame_stride)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(plan)))) as executor:
+        futures = [executor.submit(process_segment, video_path, read_start, own_start, end,
+                                   overlap_frames, source_fps, threads_per_worker=threads_per_worker,
+                                   **options)
+                   for _, read_start, own_start, end in plan]
+        results = [future.result() for future in futures]
+    events = stitch_segments(results, source_fps, min_iou=min_iou, hist_weight=hist_weight)
+    if options.get("enable_ocr", True):
+        save_confirmed_plates(events, str(video_path), options.get("storage_backend", "auto"),
+                              options.get("sqlite_path", "tracking.db"))
+    total_time = time.perf_counter() - start
+
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(str(video_path)))[0]
+    events_path = os.path.join(output_dir, f"{stem}.events.jsonl")
+    summary_path = os.path.join(output_dir, f"{stem}.summary.json")
+    write_event_log(events_path, events)
+
+    event_counts = {}
+    for record in events:
+        event_counts[record["event"]] = event_counts.get(record["event"], 0) + 1
+
+    frames = sum(r["frames"] for r in results)
+    summary = {
+        "video": str(video_path),
+        "frames": frames,
+        "width": results[0]["width"],
+        "height": results[0]["height"],
+        "effective_fps": results[0]["effective_fps"],
+        "frame_stride": options.get("frame_stride", 1),
+        "processing_seconds": round(total_time, 3),
+        "total_seconds": round(total_time, 3),
+        "throughput_fps": round(frames / total_time, 2) if total_time > 0 else 0.0,
+        "events": event_counts,
+        "segments": len(plan),
+        "overlap_seconds": overlap_seconds,
+        "events_file": events_path,
+    }
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
@@ -0,0 +1,101 @@
+from time import perf_counter_ns
+from src.processing.detector import ObjectDetector
+from src.behavior.risk_observer import TrackManager
+from src.processing.plate_recognizer import PlateRecognizer
+from src.data.metrics import METRICS
+
+
+class VideoPipeline:
+    """
+    Catena detect -> track -> rischio -> OCR per un singolo video, SENZA interfaccia grafica.
+    Il chiamante legge i frame e li passa a process_frame(); il disegno (se serve) è a parte.
+    """
+    def __init__(self, model_name="yolov8s.pt", enable_ocr=True, ocr_every=5, ocr_min_width=80, observers=(),
+                 max_frames_lost=15, ocr_workers=0, ocr_batch_size=4, plate_localizer="none", plate_model=None,
+                 ocr_cache_distance=6, storage=None, journal=None, async_observers=(), detector=None,
+                 source=None, save_plates=True):
+        # detector: un oggetto con detect_and_track(frame) al posto di YOLO (es. le detection registrate
+        # che benchmark.py riproduce per misurare solo la parte dopo il detector)
+        self.detector = detector if detector is not None else ObjectDetector(model_name=model_name)
+        # Unico registro delle tracce; una traccia non vista resta per max_frames_lost frame
+        self.manager = TrackManager(max_frames_lost=max_frames_lost)
+        for observer in observers:
+            self.manager.attach(observer)
+        # Observer lenti (console, webhook, ...): consegna asincrona, non rallentano il loop dei frame
+        for observer in async_observers:
+            self.manager.subscribe(observer)
+
+        # L'OCR è opzionale (es. server senza EasyOCR); le targhe confermate vanno in storage
+        # (di default l'istanza condivisa dal processo, vedi src.data.storage) con la chiave (source, ID):
+        # gli ID ripartono da capo a ogni video. Con save_plates=False le targhe sono solo notificate
+        self.plate_recognizer = None
+        if enable_ocr:
+            # ocr_workers > 0: OCR in processi separati (un lettore EasyOCR ciascuno)
+            # plate_localizer: "none" (OCR sull'intero veicolo, default), "contour" o "dnn" (modello ONNX in plate_model)
+            localizer_options = {"model_path": plate_model} if plate_localizer == "dnn" else None
+            self.plate_recognizer = PlateRecognizer(num_workers=ocr_workers, batch_size=ocr_batch_size,
+                                                    localizer=plate_localizer, localizer_options=localizer_options,
+                                                    cache_distance=ocr_cache_distance, storage=storage,
+                                                    source=source, save_plates=save_plates)
+            for observer in observers:
+                self.plate_recognizer.attach(observer)
+            # Le tracce perse escono dalla coda OCR
+            self.manager.attach(self.plate_recognizer)
+
+        # Journal delle traiettorie (TrajectoryJournal, opzionale): riceve anche gli eventi.
+        # Il chiamante imposta frame e tempo con journal.set_frame() prima di process_frame()
+        self.journal = journal
+        if journal is not None:
+            self.manager.attach(journal)
+            if self.plate_recognizer is not None:
+                self.plate_recognizer.attach(journal)
+
+        # Ogni quanti frame proviamo l'OCR e da che larghezza minima del box
+        self.ocr_every = ocr_every
+        self.ocr_min_width = ocr_min_width
+        self.frame_count = 0
+
+    def process_frame(self, frame, frame_w, frame_h, fps):
+        """
+        Elabora un frame e restituisce le detection.
+        fps è quello effettivo (vedi VideoInputFacade.get_video_info).
+        """
+        self.frame_count += 1
+
+        # B. PROCESSING (YOLO)
+        detections = self.detector.detect_and_track(frame)
+
+        # C. LOGIC (Observer + State Pattern)
+        self.manager.update_tracks(detections, frame_w, frame_h, fps)
+        if self.journal is not None:
+            self.journal.record(self.manager.tracks, self.manager.visible_slots)
+
+        # D. OCR (Riconoscimento Targhe), sulle tracce visibili del registro
+        if self.plate_recognizer is not None and self.frame_count % self.ocr_every == 0:
+            start = perf_counter_ns()
+            for track in self.manager.get_visible_tracks():
+                bbox = track.info['bbox']
+                if bbox[2] - bbox[0] > self.ocr_min_width:
+                    self.plate_recognizer.add_to_queue(frame, track.id, bbox, track.state.code)
+            METRICS.observe("ocr_enqueue", start)
+
+        return detections
+
+    def ocr_stats(self):
+        """Statistiche della coda OCR (None se l'OCR è disattivato)."""
+        if self.plate_recognizer is None:
+            return None
+        return self.plate_recognizer.stats()
+
+    def close(self, ocr_timeout=30.0):
+        """
+        Aspetta che l'OCR finisca i crop in coda (al massimo ocr_timeout secondi), poi lo ferma.
+        :return: True se la coda OCR è stata svuotata
+        """
+        drained = True
+        if self.plate_recognizer is not None:
+            drained = self.plate_recognizer.wait_until_idle(timeout=ocr_timeout)
+            self.plate_recognizer.close()
+        # Eventi ancora in coda per gli observer asincroni
+        self.manager.close()
+        return drained
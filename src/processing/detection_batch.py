@@ -0,0 +1,115 @@
+from collections.abc import MutableMapping
+import numpy as np
+
+# Una riga per detection: niente dizionari per oggetto nel ciclo principale
+DETECTION_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('bbox', np.int32, (4,)),
+    ('class_id', np.int32),
+    ('center', np.int32, (2,)),
+    ('conf', np.float32),
+])
+
+
+class DetectionBatch:
+    """
+    Tutte le detection di un frame in un array NumPy strutturato (id, bbox, classe, centro, confidenza).
+    Iterando si ottengono DetectionView, compatibili con i vecchi dizionari (det['id'], det['bbox'], ...).
+    """
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=DETECTION_DTYPE))
+
+    @classmethod
+    def from_arrays(cls, boxes, track_ids, class_ids, confs, target_classes=None):
+        """
+        Costruisce il batch dagli output di YOLO, filtrando le classi in modo vettoriale.
+        :param boxes: array Nx4 (x1, y1, x2, y2) in float
+        """
+        if target_classes is not None:
+            keep = np.isin(class_ids, target_classes)
+            boxes, track_ids, class_ids, confs = boxes[keep], track_ids[keep], class_ids[keep], confs[keep]
+
+        data = np.empty(len(track_ids), dtype=DETECTION_DTYPE)
+        data['id'] = track_ids
+        # Troncamento verso lo zero, come int()
+        data['bbox'] = np.trunc(boxes)
+        data['class_id'] = class_ids
+        xyxy = data['bbox']
+        data['center'][:, 0] = (xyxy[:, 0] + xyxy[:, 2]) // 2
+        data['center'][:, 1] = (xyxy[:, 1] + xyxy[:, 3]) // 2
+        data['conf'] = confs
+        return cls(data)
+
+    @property
+    def ids(self):
+        return self.data['id']
+
+    @property
+    def bboxes(self):
+        return self.data['bbox']
+
+    @property
+    def centers(self):
+        return self.data['center']
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return DetectionView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.data)):
+            yield DetectionView(self, index)
+
+
+class DetectionView(MutableMapping):
+    """
+    Vista "a dizionario" su una riga di DetectionBatch, per gli observer e il codice esistente.
+    I campi del batch si leggono come tipi Python (bbox e center come tuple);
+    le chiavi aggiuntive (es. 'TTC') finiscono in un piccolo dizionario creato solo se serve.
+    """
+    __slots__ = ('batch', 'index', 'extra')
+
+    FIELDS = ('id', 'bbox', 'class_id', 'center', 'conf')
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+        self.extra = None
+
+    def __getitem__(self, key):
+        if key in DETECTION_DTYPE.fields:
+            value = self.batch.data[key][self.index]
+            return tuple(value.tolist()) if value.ndim else value.item()
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in DETECTION_DTYPE.fields:
+            self.batch.data[key][self.index] = value
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in DETECTION_DTYPE.fields or self.extra is None:
+            raise KeyError(key)
+        del self.extra[key]
+
+    def __iter__(self):
+        yield from self.FIELDS
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return len(self.FIELDS) + (len(self.extra) if self.extra is not None else 0)
+
+    def __repr__(self):
+        return f"DetectionView({dict(self)})"
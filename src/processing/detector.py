@@ -1,79 +1,140 @@
 from ultralytics import YOLO
 import cv2
-from src.processing.tracker_memory import VisualMemory
+from time import perf_counter_ns
+from src.processing.tracker_memory import VisualMemory, FrameHistogramMap
+from src.processing.geometry import bbox_iou
+from src.processing.detection_batch import DetectionBatch
+from src.data.metrics import METRICS
 
 
 class ObjectDetector:
-    def __init__(self, model_name="yolov8s.pt"):
+    def __init__(self, model_name="yolov8s.pt", reid_refresh_interval=10, reid_refresh_iou=0.7, reid_feature_scale=1.0):
         print(f"Caricamento modello {model_name}...")
         self.model = YOLO(model_name)
         self.target_classes = [0, 2, 3, 5, 7]
         
         # Inizializza la memoria dinamica
         self.memory = VisualMemory() 
+        # Mappa HSV del frame condivisa da tutte le detection (calcolata solo se serve un istogramma).
+        # Con reid_feature_scale < 1 la conversione avviene su un frame ridotto.
+        self.feature_map = FrameHistogramMap(scale=reid_feature_scale)
         
         # Set per evitare conflitti ID nello stesso frame
         self.active_ids_in_frame = set()
 
+        # RE-ID PIGRO: il recupero dalla memoria si tenta solo per ID YOLO mai visti.
+        # id_map ricorda a quale ID finale corrisponde ogni ID di YOLO.
+        self.id_map = {}
+        # L'aspetto in memoria si aggiorna ogni reid_refresh_interval frame
+        # o quando il box cambia molto (IoU con l'ultimo aggiornamento < reid_refresh_iou)
+        self.reid_refresh_interval = reid_refresh_interval
+        self.reid_refresh_iou = reid_refresh_iou
+        self.last_refresh = {}  # {final_id: (frame, bbox)}
+        self.frame_number = 0
+
+    def _forget_stale_ids(self):
+        """Rimuove le associazioni degli oggetti che la memoria ha ormai dimenticato."""
+        for yolo_id, final_id in list(self.id_map.items()):
+            if final_id not in self.memory:
+                del self.id_map[yolo_id]
+                self.last_refresh.pop(final_id, None)
+
+    def _needs_refresh(self, final_id, bbox):
+        last = self.last_refresh.get(final_id)
+        if last is None:
+            return True
+        last_frame, last_bbox = last
+        if self.frame_number - last_frame >= self.reid_refresh_interval:
+            return True
+        return bbox_iou(last_bbox, bbox) < self.reid_refresh_iou
+
     def detect_and_track(self, frame):
        
         self.memory.increment_lost_counters()
+        self.frame_number += 1
+        if self.frame_number % self.memory.max_frames_to_remember == 0:
+            self._forget_stale_ids()
 
         # Tracking YOLO base
+        start = perf_counter_ns()
         results = self.model.track(source=frame, conf=0.25, iou=0.5, persist=True, tracker="botsort.yaml", imgsz=640, verbose=False)
+        METRICS.observe("detect", start)
         
-        detected_objects = [] 
         if not results or results[0].boxes is None or results[0].boxes.id is None:
-            return []
+            return DetectionBatch.empty()
 
         result = results[0]
-        boxes = result.boxes.xyxy.cpu().numpy()
         track_ids = result.boxes.id.int().cpu().numpy()
-        class_ids = result.boxes.cls.int().cpu().numpy()
+        # Reset ID attivi per questo frame: gli ID FINALI (dopo il re-ID) già occupati nel frame.
+        # Un ID YOLO mai visto occupa il proprio ID finché non viene eventualmente recuperato.
+        self.active_ids_in_frame = {self.id_map.get(t, t) for t in track_ids.tolist()}
+
+        # Filtro classi e calcolo centri in un colpo solo, senza un dizionario per detection
+        detections = DetectionBatch.from_arrays(
+            result.boxes.xyxy.cpu().numpy(),
+            track_ids,
+            result.boxes.cls.int().cpu().numpy(),
+            result.boxes.conf.cpu().numpy(),
+            target_classes=self.target_classes,
+        )
         
         h, w, _ = frame.shape
-        # Reset ID attivi per questo frame
-        self.active_ids_in_frame = set(track_ids)
+        feature_map_ready = False
+        start = perf_counter_ns()
 
-        for box, track_id, class_id in zip(boxes, track_ids, class_ids):
-            if class_id in self.target_classes:
-                x1, y1, x2, y2 = map(int, box)
-                
-                # Calcolo Centro
-                center_x = int((x1 + x2) / 2)
-                center_y = int((y1 + y2) / 2)
-                current_center = (center_x, center_y)
+        # Il re-ID resta per detection, ma lavora su liste di int Python estratte una volta sola
+        final_ids = detections.ids
+        for index, (track_id, bbox, current_center) in enumerate(zip(
+                final_ids.tolist(), detections.bboxes.tolist(), detections.centers.tolist())):
+            x1, y1, x2, y2 = bbox
+            bbox = (x1, y1, x2, y2)
 
-                final_id = track_id
-                
-                # Ritaglio Texture Corrente
-                crop = frame[max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+            final_id = self.id_map.get(track_id)
+            hist = None
+            
+            # Ritaglio Texture Corrente
+            crop = frame[max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+            
+            if crop.size > 0:
+                # --- LOGICA TOOCM (Adattamento e Recupero) ---
                 
-                if crop.size > 0:
-                    # --- LOGICA TOOCM (Adattamento e Recupero) ---
-                    
+                if final_id is None:
                     # 1. Se YOLO assegna un ID NUOVO, verifichiamo se è un "Vanish Feature" recuperabile
-                    # Controlliamo se matcha con un oggetto perso recentemente
-                    matched_id = self.memory.find_match(crop, current_center)
+                    # Controlliamo se matcha con un oggetto perso recentemente.
+                    # L'istogramma calcolato qui viene riusato subito sotto da update_memory.
+                    final_id = track_id
+                    if not feature_map_ready:
+                        self.feature_map.build(frame)
+                        feature_map_ready = True
+                    hist = self.feature_map.hist(bbox)
+                    matched_id = self.memory.find_match(crop, current_center, hist=hist)
                     
                     if matched_id is not None:
                         # Se troviamo un match nella storia E non c'è conflitto nel frame attuale
+                        # (l'associazione resta in id_map: un ID già occupato verrebbe duplicato per sempre)
                         if matched_id not in self.active_ids_in_frame:
                             final_id = matched_id
                             # Trucco: Aggiungiamo il vecchio ID ai "presenti" per evitare che altri lo usino
                             self.active_ids_in_frame.add(final_id)
-                    
-                    # 2. DYNAMIC UPDATE[cite: 14]:
-                    # Indipendentemente se l'ID è vecchio o recuperato, AGGIORNIAMO la memoria.
-                    # Questo permette al sistema di "imparare" il nuovo aspetto dell'auto (es. se ha girato).
-                    self.memory.update_memory(final_id, crop, current_center)
-
-                obj_data = {
-                    "id": final_id,
-                    "bbox": (x1, y1, x2, y2),
-                    "class_id": class_id,
-                    "center": current_center
-                }
-                detected_objects.append(obj_data)
+                    self.id_map[track_id] = final_id
                 
-        return detected_objects
\ No newline at end of file
+                # 2. DYNAMIC UPDATE[cite: 14]:
+                # L'aspetto si aggiorna a cadenza o se il box è cambiato molto (es. l'auto ha girato);
+                # negli altri frame basta segnare l'oggetto come visibile nella nuova posizione.
+                if hist is not None or self._needs_refresh(final_id, bbox) \
+                        or not self.memory.touch(final_id, current_center):
+                    if hist is None:
+                        if not feature_map_ready:
+                            self.feature_map.build(frame)
+                            feature_map_ready = True
+                        hist = self.feature_map.hist(bbox)
+                    self.memory.update_memory(final_id, crop, current_center, hist=hist)
+                    self.last_refresh[final_id] = (self.frame_number, bbox)
+            elif final_id is None:
+                final_id = track_id
+
+            if final_id != track_id:
+                final_ids[index] = final_id
+
+        METRICS.observe("reid", start)
+        return detections
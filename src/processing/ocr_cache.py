@@ -0,0 +1,107 @@
+import math
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+HASH_SIZE = 8        # 8x8 low DCT frequencies -> 64-bit hash
+HASH_SAMPLE = 32     # The crop is reduced to 32x32 before the DCT
+
+
+def perceptual_hash(image):
+    """
+    64-bit DCT perceptual hash (pHash) of a BGR or grayscale image.
+    Nearly identical crops (same vehicle, a few pixels of motion, small lighting changes)
+    give hashes a few bits apart.
+    """
+    # Resize first: the colour conversion then touches 32x32 pixels instead of the whole crop
+    small = cv2.resize(image, (HASH_SAMPLE, HASH_SAMPLE), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    low = cv2.dct(small.astype(np.float32))[:HASH_SIZE, :HASH_SIZE].ravel()
+    # The DC term only measures brightness: it is left out of the median
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def size_bucket(width, height):
+    """Half-octave size class: a crop that grew or shrank noticeably is never a duplicate."""
+    return (round(math.log2(max(width, 1)) * 2), round(math.log2(max(height, 1)) * 2))
+
+
+class OCRResultCache:
+    """
+    Per-track cache of the crops already read by the OCR, keyed by perceptual hash and size bucket.
+    A new crop within max_distance bits of a cached one (same bucket) is a near-duplicate:
+    reading it again would only repeat the previous result.
+    Both the entries of a track and the tracks themselves are evicted least-recently-used first.
+    """
+    def __init__(self, max_distance=6, entries_per_track=4, max_tracks=64):
+        self.max_distance = max_distance
+        self.entries_per_track = entries_per_track
+        self.max_tracks = max_tracks
+
+        self._tracks = OrderedDict()  # {obj_id: OrderedDict{(hash, bucket): text or None}}
+        self._lock = threading.Lock()
+
+        # Counters exposed to tune max_distance
+        self.hits = 0
+        self.misses = 0
+        self.hit_distances = [0] * (max_distance + 1)  # Histogram of the Hamming distance of the hits
+
+    def lookup(self, obj_id, phash, bucket):
+        """
+        Looks for a near-duplicate of the crop among the ones already read for obj_id.
+        :return: (True, previous text or None) on a hit, (False, None) on a miss
+        """
+        with self._lock:
+            entries = self._tracks.get(obj_id)
+            if entries is not None:
+                self._tracks.move_to_end(obj_id)
+                for key, text in entries.items():
+                    cached_hash, cached_bucket = key
+                    if cached_bucket != bucket:
+                        continue
+                    distance = (cached_hash ^ phash).bit_count()
+                    if distance <= self.max_distance:
+                        entries.move_to_end(key)
+                        self.hits += 1
+                        self.hit_distances[distance] += 1
+                        return True, text
+            self.misses += 1
+            return False, None
+
+    def store(self, obj_id, phash, bucket, text):
+        """Records the OCR result (text or None) of a crop that has just been read."""
+        with self._lock:
+            entries = self._tracks.get(obj_id)
+            if entries is None:
+                entries = self._tracks[obj_id] = OrderedDict()
+                if len(self._tracks) > self.max_tracks:
+                    self._tracks.popitem(last=False)
+            else:
+                self._tracks.move_to_end(obj_id)
+            entries[(phash, bucket)] = text
+            entries.move_to_end((phash, bucket))
+            if len(entries) > self.entries_per_track:
+                entries.popitem(last=False)
+
+    def forget(self, obj_id):
+        with self._lock:
+            self._tracks.pop(obj_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(entries) for entries in self._tracks.values())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "hit_distances": list(self.hit_distances),
+                "max_distance": self.max_distance,
+                "tracks": len(self._tracks),
+            }
@@ -0,0 +1,200 @@
+import multiprocessing as mp
+import queue
+import time
+import cv2
+import numpy as np
+from src.input_ouput.frame_pool import attach_shared_slots
+from src.processing.plate_localizer import create_plate_localizer
+
+PLATE_ALLOWLIST = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+MIN_PLATE_PROB = 0.25
+
+
+def is_valid_plate(text):
+    if len(text) < 5 or len(text) > 8:
+        return False
+    return True
+
+
+def best_plate_text(results):
+    """
+    Picks the most confident plausible plate among EasyOCR results [(bbox, text, prob), ...].
+    Returns None if nothing looks like a plate.
+    """
+    if not results:
+        return None
+
+    for (bbox_ocr, text, prob) in sorted(results, key=lambda x: x[2], reverse=True):
+        text_clean = ''.join(c for c in text if c.isalnum()).upper()
+
+        if is_valid_plate(text_clean) and prob > MIN_PLATE_PROB:
+            print(f"DEBUG: OCR saw '{text_clean}' (prob={prob:.2f})")
+            return text_clean
+    return None
+
+
+CANDIDATE_GAP = 8  # Empty rows between stacked plate candidates
+
+
+def read_crops(reader, crops, localizer=None):
+    """
+    Runs OCR on a list of BGR vehicle crops and returns the EasyOCR results of each crop.
+    With a localizer only the candidate plate regions are read (see _recognize_candidates);
+    without one, the text detector runs on the whole crop as before.
+    """
+    if localizer is not None:
+        return _recognize_candidates(reader, [localizer.locate(crop) for crop in crops])
+    return _read_whole_crops(reader, crops)
+
+
+def _recognize_candidates(reader, candidates_per_crop):
+    """
+    Recognition only, no text detection: the rectified plate candidates of every crop are stacked
+    in one tall image and passed as boxes to reader.recognize, which reads them in a single batch.
+    Each result is given back to its crop through the vertical position of its box.
+    """
+    owners = []  # (y_start, y_end, crop_index)
+    images = []
+    y = 0
+    for crop_index, candidates in enumerate(candidates_per_crop):
+        for image in candidates:
+            owners.append((y, y + image.shape[0], crop_index))
+            images.append(image)
+            y += image.shape[0] + CANDIDATE_GAP
+
+    per_crop = [[] for _ in candidates_per_crop]
+    if not images:
+        return per_crop
+
+    canvas = np.zeros((y, max(image.shape[1] for image in images)), dtype=np.uint8)
+    boxes = []
+    for (y_start, y_end, _), image in zip(owners, images):
+        canvas[y_start:y_end, :image.shape[1]] = image
+        boxes.append([0, image.shape[1], y_start, y_end])  # EasyOCR format: x_min, x_max, y_min, y_max
+
+    results = reader.recognize(canvas, horizontal_list=boxes, free_list=[], detail=1,
+                               allowlist=PLATE_ALLOWLIST, batch_size=len(boxes))
+    for bbox, text, prob in results:
+        top = bbox[0][1]
+        for y_start, y_end, crop_index in owners:
+            if y_start <= top < y_end:
+                per_crop[crop_index].append((bbox, text, prob))
+                break
+    return per_crop
+
+
+def _read_whole_crops(reader, crops):
+    """
+    Full text detection + recognition. Several crops go through readtext_batched in one call:
+    the grayscale images are padded (not stretched) to the same size, as EasyOCR requires.
+    """
+    grays = [cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) for crop in crops]
+    if len(grays) == 1:
+        return [reader.readtext(grays[0], detail=1, allowlist=PLATE_ALLOWLIST)]
+
+    height = max(gray.shape[0] for gray in grays)
+    width = max(gray.shape[1] for gray in grays)
+    padded = []
+    for gray in grays:
+        canvas = np.zeros((height, width), dtype=gray.dtype)
+        canvas[:gray.shape[0], :gray.shape[1]] = gray
+        padded.append(canvas)
+    return reader.readtext_batched(padded, detail=1, allowlist=PLATE_ALLOWLIST)
+
+
+def _ocr_worker_main(task_queue, result_queue, languages, localizer_spec):
+    """
+    Entry point of an OCR process: loads its own EasyOCR reader (and plate localizer) once,
+    then reads batches of crops straight from the shared-memory slots until it receives None.
+    """
+    try:
+        import easyocr
+        reader = easyocr.Reader(list(languages), gpu=False)
+        kind, options = localizer_spec
+        localizer = create_plate_localizer(kind, **options)
+    except Exception as e:
+        result_queue.put(("error", None, f"Error initializing EasyOCR in worker: {e}", 0.0))
+        return
+    result_queue.put(("ready", None, None, 0.0))
+
+    attached = {}  # {shm_name: (SharedMemory, slots)}
+    try:
+        while True:
+            message = task_queue.get()
+            if message is None:
+                break
+            batch_id, shm_name, max_shape, pool_size, items = message
+
+            if shm_name not in attached:
+                attached[shm_name] = attach_shared_slots(shm_name, max_shape, pool_size)
+            slots = attached[shm_name][1]
+
+            start = time.perf_counter()
+            try:
+                crops = [slots[slot_id][:h, :w] for slot_id, h, w in items]
+                texts = [best_plate_text(results) for results in read_crops(reader, crops, localizer)]
+                result_queue.put(("result", batch_id, texts, time.perf_counter() - start))
+            except Exception as e:
+                result_queue.put(("failed", batch_id, f"OCR Error: {e}", time.perf_counter() - start))
+            finally:
+                crops = None
+    finally:
+        for shm, slots in attached.values():
+            slots.clear()
+            try:
+                shm.close()
+            except BufferError:
+                pass
+
+
+class OCRProcessPool:
+    """
+    Pool of OCR processes, each with its own EasyOCR reader (readtext is CPU-bound and holds the GIL,
+    so threads would not scale). Batches are described by slot ids of a SharedCropPool: only a few
+    integers are pickled, the pixels stay in shared memory.
+    Each worker builds its own plate localizer from (localizer, localizer_options), so the
+    localization runs in parallel too.
+    Results come back through poll(); the caller keeps the batch -> tasks bookkeeping.
+    """
+    def __init__(self, num_workers=2, languages=('en',), localizer="none", localizer_options=None):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        # spawn: torch (used by EasyOCR) is not fork-safe once initialized
+        context = mp.get_context("spawn")
+        self.num_workers = num_workers
+        self.task_queue = context.Queue()
+        self.result_queue = context.Queue()
+        self.processes = [
+            context.Process(target=_ocr_worker_main, args=(self.task_queue, self.result_queue, tuple(languages),
+                                                               (localizer, dict(localizer_options or {}))),
+                            daemon=True, name=f"ocr-worker-{index}")
+            for index in range(num_workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def submit(self, batch_id, pool, tasks):
+        """Sends a batch of OCRTask (all stored in the same SharedCropPool) to the first free worker."""
+        items = [(task.slot_id, task.crop.shape[0], task.crop.shape[1]) for task in tasks]
+        self.task_queue.put((batch_id, pool.shm_name, pool.max_shape, pool.size, items))
+
+    def poll(self, timeout=None):
+        """
+        Next message from the workers: (kind, batch_id, payload, ocr_seconds), or None on timeout.
+        kind is "ready", "error" (worker could not start), "result" (payload = texts) or "failed".
+        """
+        try:
+            return self.result_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def alive_workers(self):
+        return sum(process.is_alive() for process in self.processes)
+
+    def close(self, timeout=5.0):
+        for _ in self.processes:
+            self.task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,201 @@
+import threading
+import time
+from src.data.metrics import METRICS
+
+# Priority weights: bigger (closer) vehicles, riskier states and tracks that have
+# waited longest since their last OCR attempt are read first.
+AREA_WEIGHT = 4.0        # Multiplied by the bbox area as a fraction of the frame
+STATE_WEIGHT = 1.0       # Multiplied by the state code (SAFE=0, WARNING=1, DANGER=2)
+AGE_WEIGHT = 1.0         # Full weight once AGE_SATURATION seconds have passed
+AGE_SATURATION = 2.0     # Seconds since the last attempt after which the age bonus stops growing
+RECHECK_PENALTY = 10.0   # Re-checks of an already confirmed plate rank below every first reading
+
+
+class OCRTask:
+    __slots__ = ('obj_id', 'crop', 'pool', 'slot_id', 'area_ratio', 'state_code', 'cache_key', 'recheck',
+                 'submitted_at')
+
+    def __init__(self, obj_id, crop, pool, slot_id, area_ratio, state_code, cache_key=None, recheck=False):
+        self.obj_id = obj_id
+        self.crop = crop
+        self.pool = pool
+        self.slot_id = slot_id
+        self.area_ratio = area_ratio
+        self.state_code = state_code
+        self.cache_key = cache_key  # (perceptual hash, size bucket) for the OCR result cache
+        self.recheck = recheck      # Re-reading a track whose plate is already confirmed
+        self.submitted_at = time.monotonic()
+
+    def release(self):
+        """Gives the crop slot back to its pool."""
+        if self.pool is not None:
+            self.pool.release(self.slot_id)
+
+
+class OCRScheduler:
+    """
+    Bounded OCR work queue between the main loop (producer) and the OCR worker (consumer).
+    - At most one pending crop per track: a newer crop replaces the stale one.
+    - At most max_pending tracks waiting: when full, the lowest-priority task is dropped.
+    - get() hands out the highest-priority task (bbox size, risk state, time since last attempt);
+      re-checks of already confirmed plates come after every first reading.
+    Dropped or replaced tasks give their crop slot back to the pool immediately.
+    """
+    def __init__(self, max_pending=6):
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+        self.max_pending = max_pending
+
+        self._pending = {}        # {obj_id: OCRTask}
+        self._last_attempt = {}   # {obj_id: monotonic time the worker last picked it up}
+        self._in_progress = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+
+        # Counters exposed for monitoring
+        self.submitted = 0
+        self.replaced = 0           # Stale crops replaced by a newer one of the same track
+        self.dropped_full = 0       # Dropped because the queue was full of higher-priority work
+        self.dropped_discarded = 0  # Dropped because the track was lost or its plate confirmed
+        self.completed = 0
+        self.wait_total = 0.0       # Seconds between submit and the worker picking the task up
+        self.wait_max = 0.0
+        self.ocr_total = 0.0        # Seconds spent in OCR
+        self.ocr_max = 0.0
+
+    def _priority(self, task, now):
+        last = self._last_attempt.get(task.obj_id)
+        age = AGE_SATURATION if last is None else min(now - last, AGE_SATURATION)
+        return (task.area_ratio * AREA_WEIGHT
+                + task.state_code * STATE_WEIGHT
+                + age / AGE_SATURATION * AGE_WEIGHT
+                - (RECHECK_PENALTY if task.recheck else 0.0))
+
+    def submit(self, task):
+        """
+        Queues a task. Returns False (and releases its crop) if it was dropped right away.
+        """
+        dropped = []
+        accepted = True
+        with self._lock:
+            if self._closed:
+                dropped.append(task)
+                accepted = False
+            else:
+                self.submitted += 1
+                stale = self._pending.pop(task.obj_id, None)
+                if stale is not None:
+                    dropped.append(stale)
+                    self.replaced += 1
+                elif len(self._pending) >= self.max_pending:
+                    now = time.monotonic()
+                    lowest = min(self._pending.values(), key=lambda t: self._priority(t, now))
+                    if self._priority(lowest, now) < self._priority(task, now):
+                        del self._pending[lowest.obj_id]
+                        dropped.append(lowest)
+                    else:
+                        dropped.append(task)
+                        accepted = False
+                    self.dropped_full += 1
+
+                if accepted:
+                    self._pending[task.obj_id] = task
+                    self._not_empty.notify()
+
+        for stale in dropped:
+            stale.release()
+        return accepted
+
+    def is_pending(self, obj_id):
+        with self._lock:
+            return obj_id in self._pending
+
+    def discard(self, obj_id, forget=False):
+        """
+        Drops the pending task of obj_id (track lost or plate already confirmed).
+        With forget=True the track's attempt history is cleared as well.
+        """
+        with self._lock:
+            task = self._pending.pop(obj_id, None)
+            if task is not None:
+                self.dropped_discarded += 1
+                self._idle.notify_all()
+            if forget:
+                self._last_attempt.pop(obj_id, None)
+        if task is not None:
+            task.release()
+
+    def get(self, timeout=None):
+        """
+        Removes and returns the highest-priority task, or None on timeout / close.
+        Every task returned must be followed by a call to task_done().
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._pending or self._closed, timeout=timeout):
+                return None
+            if not self._pending:
+                return None
+            now = time.monotonic()
+            task = max(self._pending.values(), key=lambda t: self._priority(t, now))
+            del self._pending[task.obj_id]
+            self._last_attempt[task.obj_id] = now
+            self._in_progress += 1
+
+            wait = now - task.submitted_at
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            METRICS.record_seconds("ocr_queue_wait", wait)
+            return task
+
+    def task_done(self, task, ocr_seconds=0.0):
+        with self._lock:
+            self._in_progress -= 1
+            self.completed += 1
+            self.ocr_total += ocr_seconds
+            self.ocr_max = max(self.ocr_max, ocr_seconds)
+            if not self._pending and self._in_progress == 0:
+                self._idle.notify_all()
+        METRICS.record_seconds("ocr", ocr_seconds)
+
+    def wait_until_idle(self, timeout=None):
+        """Blocks until nothing is pending or in progress. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and self._in_progress == 0, timeout=timeout)
+
+    def close(self):
+        """Drops everything still pending and wakes the worker."""
+        with self._lock:
+            self._closed = True
+            tasks = list(self._pending.values())
+            self._pending.clear()
+            self.dropped_discarded += len(tasks)
+            self._not_empty.notify_all()
+            self._idle.notify_all()
+        for task in tasks:
+            task.release()
+
+    @property
+    def depth(self):
+        """Number of tasks waiting for the worker."""
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            started = self.completed + self._in_progress
+            return {
+                "depth": len(self._pending),
+                "max_pending": self.max_pending,
+                "in_progress": self._in_progress,
+                "submitted": self.submitted,
+                "replaced": self.replaced,
+                "dropped_full": self.dropped_full,
+                "dropped_discarded": self.dropped_discarded,
+                "completed": self.completed,
+                "avg_wait_ms": round(self.wait_total / started * 1000, 1) if started else 0.0,
+                "max_wait_ms": round(self.wait_max * 1000, 1),
+                "avg_ocr_ms": round(self.ocr_total / self.completed * 1000, 1) if self.completed else 0.0,
+                "max_ocr_ms": round(self.ocr_max * 1000, 1),
+            }
@@ -0,0 +1,108 @@
+from collections import Counter, OrderedDict, deque
+
+# Plate states of a track
+PLATE_COLLECTING = "collecting"  # Gathering readings, no plate yet
+PLATE_CONFIRMED = "confirmed"    # A plate reached the vote threshold (written once to the DB)
+PLATE_RETIRED = "retired"        # Track lost: readings dropped, only the confirmed plate is remembered
+
+HISTORY_SIZE = 10      # Readings kept per track for the voting
+CONFIRM_VOTES = 3      # Votes needed to confirm a plate
+
+
+class PlateTrack:
+    """
+    Plate voting of one track. Readings go into a bounded history; the most voted plate is
+    confirmed once it has CONFIRM_VOTES votes, and replaced only if a different plate overtakes it
+    (strictly more votes in the history: a tie keeps the confirmed plate).
+    """
+    __slots__ = ('history', 'state', 'plate', 'skipped')
+
+    def __init__(self, plate=None):
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.state = PLATE_CONFIRMED if plate is not None else PLATE_COLLECTING
+        self.plate = plate
+        self.skipped = 0  # Crops skipped since the last re-check of the confirmed plate
+
+    def wants_reading(self, recheck_every):
+        """
+        Whether a new crop of this track should be read: always while collecting; once confirmed,
+        one crop every recheck_every (so a different plate can still overtake it), never if 0.
+        """
+        if self.plate is None:
+            return True
+        if not recheck_every:
+            return False
+        self.skipped += 1
+        if self.skipped < recheck_every:
+            return False
+        self.skipped = 0
+        return True
+
+    def add_reading(self, plate_text):
+        """
+        Adds a reading.
+        :return: (plate, votes) if the confirmed plate changed with this reading, otherwise None
+        """
+        self.history.append(plate_text)
+        votes = Counter(self.history)
+        most_common, count = votes.most_common(1)[0]
+        # most_common breaks ties by insertion order: on a tie the confirmed plate must stay
+        if count < CONFIRM_VOTES or most_common == self.plate or count <= votes[self.plate]:
+            return None
+        self.plate = most_common
+        self.state = PLATE_CONFIRMED
+        return most_common, count
+
+
+class PlateRegistry:
+    """
+    Plate state of every track. Live tracks are in `tracks`; when a track is lost it is retired:
+    its history is dropped and only its confirmed plate stays, in a bounded LRU (max_retired),
+    so a track recovered by re-identification does not confirm (and write) the same plate again.
+    Memory is bounded by the live tracks plus max_retired plates.
+    """
+    def __init__(self, max_retired=1024):
+        self.tracks = {}                # {obj_id: PlateTrack}
+        self.retired = OrderedDict()    # {obj_id: confirmed plate}
+        self.max_retired = max_retired
+
+    def get(self, obj_id):
+        """PlateTrack of obj_id, created (or revived from the retired plates) on first use."""
+        track = self.tracks.get(obj_id)
+        if track is None:
+            track = self.tracks[obj_id] = PlateTrack(self.retired.pop(obj_id, None))
+        return track
+
+    def find(self, obj_id):
+        """PlateTrack of a live track, or None (never seen, or already retired): nothing is created."""
+        return self.tracks.get(obj_id)
+
+    def confirmed_plate(self, obj_id):
+        track = self.tracks.get(obj_id)
+        if track is not None:
+            return track.plate
+        return self.retired.get(obj_id)
+
+    def state(self, obj_id):
+        track = self.tracks.get(obj_id)
+        if track is not None:
+            return track.state
+        return PLATE_RETIRED if obj_id in self.retired else None
+
+    def retire(self, obj_id):
+        """Drops the readings of a lost track, keeping only its confirmed plate (if any)."""
+        track = self.tracks.pop(obj_id, None)
+        if track is None or track.plate is None:
+            return
+        self.retired[obj_id] = track.plate
+        self.retired.move_to_end(obj_id)
+        if len(self.retired) > self.max_retired:
+            self.retired.popitem(last=False)
+
+    def stats(self):
+        states = Counter(track.state for track in self.tracks.values())
+        return {
+            PLATE_COLLECTING: states[PLATE_COLLECTING],
+            PLATE_CONFIRMED: states[PLATE_CONFIRMED],
+            PLATE_RETIRED: len(self.retired),
+        }
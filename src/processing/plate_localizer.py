@@ -0,0 +1,172 @@
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+
+PLATE_HEIGHT = 64  # Height of the rectified plate images (EasyOCR's recognizer works at 64 px)
+
+
+class PlateLocalizer(ABC):
+    """
+    Finds candidate licence-plate regions inside a vehicle crop, so that only those small
+    regions go through recognition instead of running the text detector on the whole vehicle.
+    """
+    @abstractmethod
+    def locate(self, vehicle_crop):
+        """
+        :param vehicle_crop: BGR image of the vehicle
+        :return: list of grayscale plate images, rectified and PLATE_HEIGHT pixels high,
+                 most likely first (empty if no plate was found)
+        """
+        pass
+
+
+def _order_corners(points):
+    """Sorts 4 corners as top-left, top-right, bottom-right, bottom-left."""
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([points[np.argmin(sums)], points[np.argmin(diffs)],
+                     points[np.argmax(sums)], points[np.argmax(diffs)]], dtype=np.float32)
+
+
+def _rectify(gray, corners, aspect):
+    """Warps the quadrilateral corners to an upright plate image PLATE_HEIGHT pixels high."""
+    out_w = max(1, int(round(PLATE_HEIGHT * aspect)))
+    target = np.array([[0, 0], [out_w - 1, 0], [out_w - 1, PLATE_HEIGHT - 1], [0, PLATE_HEIGHT - 1]],
+                      dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(_order_corners(corners), target)
+    return cv2.warpPerspective(gray, matrix, (out_w, PLATE_HEIGHT), flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_REPLICATE)
+
+
+class ContourPlateLocalizer(PlateLocalizer):
+    """
+    Classical cascade: black-hat (dark characters on a light plate) -> horizontal gradient ->
+    closing with a wide kernel (joins the characters into one blob) -> Otsu -> contours,
+    filtered by aspect ratio, relative size and vertical position, then rectified with minAreaRect.
+    The analysis runs on a copy scaled to work_width; the plate is cut from the full-resolution crop.
+    """
+    def __init__(self, work_width=320, min_aspect=2.0, max_aspect=8.0, min_area=0.004, max_area=0.15,
+                 min_center_y=0.3, margin=0.12, max_candidates=3):
+        self.work_width = work_width
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.min_area = min_area          # Plate area as a fraction of the vehicle crop
+        self.max_area = max_area
+        self.min_center_y = min_center_y  # Plates are not on the roof: centre below this fraction of the height
+        self.margin = margin              # Extra border around the plate, as a fraction of its size
+        self.max_candidates = max_candidates
+
+        self._blackhat_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5))
+        self._close_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (17, 3))
+
+    def locate(self, vehicle_crop):
+        gray = cv2.cvtColor(vehicle_crop, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape
+        if width < 20 or height < 10:
+            return []
+
+        scale = min(1.0, self.work_width / width)
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+        small_h, small_w = small.shape
+
+        blackhat = cv2.morphologyEx(small, cv2.MORPH_BLACKHAT, self._blackhat_kernel)
+        gradient = np.abs(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=3))
+        gradient = cv2.normalize(gradient, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+        gradient = cv2.GaussianBlur(gradient, (5, 5), 0)
+        gradient = cv2.morphologyEx(gradient, cv2.MORPH_CLOSE, self._close_kernel)
+        _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        mask = cv2.erode(mask, None, iterations=2)
+        mask = cv2.dilate(mask, None, iterations=2)
+
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        crop_area = small_w * small_h
+        candidates = []
+        for contour in sorted(contours, key=cv2.contourArea, reverse=True):
+            (cx, cy), (rw, rh), angle = cv2.minAreaRect(contour)
+            if rw < rh:
+                rw, rh, angle = rh, rw, angle - 90
+            if rh < 1:
+                continue
+            aspect = rw / rh
+            area = rw * rh / crop_area
+            if not (self.min_aspect <= aspect <= self.max_aspect and self.min_area <= area <= self.max_area):
+                continue
+            if cy < small_h * self.min_center_y:
+                continue
+
+            # Back to full-resolution coordinates, with a small margin around the characters
+            rect = ((cx / scale, cy / scale), (rw * (1 + self.margin) / scale, rh * (1 + 2 * self.margin) / scale),
+                    angle)
+            corners = cv2.boxPoints(rect)
+            candidates.append(_rectify(gray, corners, rect[1][0] / rect[1][1]))
+            if len(candidates) >= self.max_candidates:
+                break
+        return candidates
+
+
+class DnnPlateLocalizer(PlateLocalizer):
+    """
+    Lightweight plate detector run with cv2.dnn on the CPU (e.g. a single-class YOLOv8n exported to ONNX:
+    output 1 x (4 + classes) x N with cx, cy, w, h in input-image pixels followed by the class scores).
+    """
+    def __init__(self, model_path, input_size=320, conf_threshold=0.4, nms_threshold=0.45, margin=0.08,
+                 max_candidates=3):
+        self.net = cv2.dnn.readNet(model_path)
+        self.input_size = input_size
+        self.conf_threshold = conf_threshold
+        self.nms_threshold = nms_threshold
+        self.margin = margin
+        self.max_candidates = max_candidates
+
+    def locate(self, vehicle_crop):
+        height, width = vehicle_crop.shape[:2]
+        if width < 20 or height < 10:
+            return []
+
+        blob = cv2.dnn.blobFromImage(vehicle_crop, 1 / 255.0, (self.input_size, self.input_size), swapRB=True)
+        self.net.setInput(blob)
+        predictions = np.squeeze(self.net.forward(), axis=0)
+        if predictions.shape[0] < predictions.shape[1]:
+            predictions = predictions.T  # -> N x (4 + classes)
+
+        scores = predictions[:, 4:].max(axis=1)
+        keep = scores >= self.conf_threshold
+        if not keep.any():
+            return []
+        predictions, scores = predictions[keep], scores[keep]
+
+        # The blob is a plain resize of the crop: scale x and y back separately
+        sx, sy = width / self.input_size, height / self.input_size
+        boxes = [[float((cx - bw / 2) * sx), float((cy - bh / 2) * sy), float(bw * sx), float(bh * sy)]
+                 for cx, cy, bw, bh in predictions[:, :4]]
+        indices = cv2.dnn.NMSBoxes(boxes, scores.astype(float).tolist(), self.conf_threshold, self.nms_threshold)
+
+        gray = cv2.cvtColor(vehicle_crop, cv2.COLOR_BGR2GRAY)
+        candidates = []
+        for index in np.array(indices).ravel()[:self.max_candidates]:
+            x, y, bw, bh = boxes[index]
+            x -= bw * self.margin
+            y -= bh * self.margin
+            bw *= 1 + 2 * self.margin
+            bh *= 1 + 2 * self.margin
+            corners = np.array([[x, y], [x + bw, y], [x + bw, y + bh], [x, y + bh]], dtype=np.float32)
+            candidates.append(_rectify(gray, corners, bw / max(bh, 1.0)))
+        return candidates
+
+
+LOCALIZERS = {
+    "contour": ContourPlateLocalizer,
+    "dnn": DnnPlateLocalizer,
+}
+
+
+def create_plate_localizer(kind="none", **options):
+    """
+    Builds the localizer selected by configuration: "none" (OCR on the whole vehicle, as before),
+    "contour" or "dnn" (needs model_path=...).
+    """
+    if kind is None or kind == "none":
+        return None
+    if kind not in LOCALIZERS:
+        raise ValueError(f"Unknown plate localizer: {kind} (expected none, {', '.join(LOCALIZERS)})")
+    return LOCALIZERS[kind](**options)
@@ -1,39 +1,154 @@
-import cv2
-import numpy as np
 import easyocr
 import threading
-import queue
-from collections import Counter
-from src.data.db_manager import DBManager
+import time
+from src.data.storage import get_shared_storage
+from src.input_ouput.frame_pool import CropPool, SharedCropPool
+from src.behavior.risk_observer import Observer
+from src.behavior.state_machine import STATE_SAFE
+from src.processing.ocr_scheduler import OCRScheduler, OCRTask
+from src.processing.ocr_cache import OCRResultCache, perceptual_hash, size_bucket
+from src.processing.plate_lifecycle import PlateRegistry
+from src.processing.ocr_pool import OCRProcessPool, read_crops, best_plate_text, is_valid_plate
+from src.processing.plate_localizer import create_plate_localizer
 
-class PlateRecognizer:
-    def __init__(self):
+class PlateRecognizer(Observer):
+    """
+    Asynchronous plate OCR. Crops go through a bounded OCRScheduler (one pending crop per track,
+    highest priority first) to the OCR backend:
+    - num_workers=0: a single EasyOCR worker thread in this process;
+    - num_workers>0: a pool of OCR processes fed through shared memory, up to batch_size crops per call.
+    localizer selects the plate-localization stage run before recognition: "none" (default) reads the
+    whole vehicle, "contour" or "dnn" crop the plate first (check them with evaluate_plates.py on a
+    labelled set before switching); localizer_options go to its constructor (e.g. model_path for "dnn").
+    Crops that are near-duplicates (perceptual hash within cache_distance bits, same size class) of a crop
+    already read for the same track are not read again: the cached text counts as their reading;
+    cache_distance=None disables the cache.
+    Once a track's plate is confirmed only one crop every recheck_every is still read, at the lowest
+    priority, so a different plate can overtake it (0: confirmation is final).
+    Confirmed plates go to storage (a Storage backend; by default the process-wide shared instance),
+    keyed by source (the video the track IDs belong to); save_plates=False only notifies them.
+    Attach it to the TrackManager so the work of lost tracks is dropped.
+    """
+    def __init__(self, max_pending=6, num_workers=0, batch_size=4, localizer="none", localizer_options=None,
+                 cache_distance=6, storage=None, recheck_every=10, source=None, save_plates=True):
         self.ocr_available = False
-        self.plate_history = {} # {obj_id: [list of detected plates]}
-        self.processing_queue = queue.Queue()
+        # Plate state per track (collecting -> confirmed -> retired), shared by the OCR threads
+        self.plates = PlateRegistry()
+        self._plates_lock = threading.Lock()
+        self.observers = [] # Notified with ("PLATE_CONFIRMED", obj_id, plate)
+        self.scheduler = OCRScheduler(max_pending=max_pending)
+        self.skipped_confirmed = 0 # Crops not queued because the track already has a confirmed plate
+        self.dropped_lost = 0 # OCR results dropped because their track was lost meanwhile
+        self.recheck_every = recheck_every
+        self.source = source
+        self.cache = OCRResultCache(max_distance=cache_distance) if cache_distance is not None else None
+
+        self.num_workers = num_workers
+        self.batch_size = max(1, batch_size)
+        self.reader = None
+        self.storage = None
+        self.localizer = None
+        self.ocr_pool = None
+        self._batches = {} # {batch_id: [OCRTask]} sent to the process pool
+        self._next_batch_id = 0
+        self._free_workers = threading.Semaphore(num_workers) # One batch in flight per worker process
+        self._shared_pools = [] # SharedCropPool blocks to unlink on close()
+
+        # Preallocated crop slots, created on the first frame (we need its size).
+        # One per pending task, one per crop being read and one for a crop about to replace another.
+        in_flight = 1 if num_workers == 0 else num_workers * self.batch_size
+        self.crop_pool_size = max_pending + in_flight + 1
+        self.crop_pool = None
         
         try:
-            print("Initializing EasyOCR...")
-            # gpu=False per evitare errori se non c'è una GPU NVIDIA
-            self.reader = easyocr.Reader(['en'], gpu=False) 
-            self.db_manager = DBManager()
-            self.ocr_available = True
-            print("EasyOCR and DBManager initialized successfully.")
-            
-            # Start background worker thread
-            self.worker_thread = threading.Thread(target=self._worker, daemon=True)
-            self.worker_thread.start()
-            print("OCR Worker thread started.")
+            # A storage failure must not disable OCR: the plates are still confirmed, just not saved
+            if save_plates:
+                self.storage = storage if storage is not None else get_shared_storage()
+        except Exception as e:
+            print(f"Storage not available, plates will not be saved: {e}")
+
+        try:
+            if num_workers > 0:
+                print(f"Starting {num_workers} OCR worker processes...")
+                self.ocr_pool = OCRProcessPool(num_workers=num_workers, localizer=localizer,
+                                               localizer_options=localizer_options)
+                self.ocr_available = True
+
+                # Dispatcher (scheduler -> processes) and collector (results -> voting) threads
+                self.dispatcher_thread = threading.Thread(target=self._dispatcher, daemon=True)
+                self.dispatcher_thread.start()
+                self.collector_thread = threading.Thread(target=self._collector, daemon=True)
+                self.collector_thread.start()
+                print("OCR worker pool started.")
+            else:
+                print("Initializing EasyOCR...")
+                # gpu=False per evitare errori se non c'è una GPU NVIDIA
+                self.reader = easyocr.Reader(['en'], gpu=False) 
+                self.localizer = create_plate_localizer(localizer, **(localizer_options or {}))
+                self.ocr_available = True
+                print("EasyOCR initialized successfully.")
+                
+                # Start background worker thread
+                self.worker_thread = threading.Thread(target=self._worker, daemon=True)
+                self.worker_thread.start()
+                print("OCR Worker thread started.")
             
         except Exception as e:
-            print(f"Error initializing OCR or DB: {e}")
+            print(f"Error initializing OCR: {e}")
+
+    def attach(self, observer):
+        """Registers an Observer (same interface as the TrackManager ones)."""
+        self.observers.append(observer)
+
+    def notify(self, event_type, track_id, message=""):
+        for observer in self.observers:
+            observer.update(event_type, track_id, message)
+
+    def update(self, event_type, track_id, message=""):
+        """Observer side: a lost track will not be drawn again, its pending crop is useless."""
+        if event_type == "LOST_TRACK":
+            self.scheduler.discard(track_id, forget=True)
+            # Under the same lock as _handle_result: a result still in flight cannot revive the track
+            with self._plates_lock:
+                self.plates.retire(track_id)
+                if self.cache is not None:
+                    self.cache.forget(track_id)
+
+    def wait_until_idle(self, timeout=None):
+        """
+        Blocks until every queued crop has been processed (or the timeout expires).
+        Returns True if the queue was drained.
+        """
+        if not self.ocr_available:
+            return True
+        return self.scheduler.wait_until_idle(timeout=timeout)
 
-    def add_to_queue(self, frame, obj_id, bbox):
+    def stats(self):
+        """Scheduler statistics (depth, drops, wait and OCR latency)."""
+        stats = self.scheduler.stats()
+        stats["skipped_confirmed"] = self.skipped_confirmed
+        stats["dropped_lost"] = self.dropped_lost
+        stats["cache"] = self.cache.stats() if self.cache is not None else None
+        with self._plates_lock:
+            stats["plates"] = self.plates.stats()
+        stats["db"] = self.storage.stats() if self.storage is not None else None
+        return stats
+
+    def add_to_queue(self, frame, obj_id, bbox, state_code=STATE_SAFE):
         """
         Adds a task to the OCR queue. Non-blocking.
+        A crop already waiting for the same track is replaced; state_code raises the priority.
         """
         if not self.ocr_available:
             return
+        with self._plates_lock:
+            track = self.plates.get(obj_id)
+            recheck = track.plate is not None
+            wanted = track.wants_reading(self.recheck_every)
+        if not wanted:
+            # The plate is already known: only an occasional re-check is read
+            self.skipped_confirmed += 1
+            return
 
         x1, y1, x2, y2 = bbox
         h, w, _ = frame.shape
@@ -46,78 +161,202 @@ class PlateRecognizer:
         if (x2 - x1) < 40 or (y2 - y1) < 10:
             return
 
-        # Crop and COPY the image so main thread can continue safely
-        vehicle_crop = frame[y1:y2, x1:x2].copy()
-        
-        # Put in queue
-        self.processing_queue.put((vehicle_crop, obj_id))
+        # Near-duplicate of a crop already read for this track? Reading it again would only repeat
+        # the previous result: that result is reused as this crop's reading, so a parked or slow
+        # vehicle still collects its votes without running the OCR again
+        cache_key = None
+        if self.cache is not None:
+            cache_key = (perceptual_hash(frame[y1:y2, x1:x2]), size_bucket(x2 - x1, y2 - y1))
+            hit, cached_text = self.cache.lookup(obj_id, *cache_key)
+            if hit:
+                if cached_text:
+                    self._update_history_and_db(obj_id, cached_text)
+                return
+
+        if self.crop_pool is None or self.crop_pool.max_shape != frame.shape:
+            if self.ocr_pool is not None:
+                # The worker processes read the crops straight from shared memory
+                self.crop_pool = SharedCropPool(frame.shape, size=self.crop_pool_size)
+                self._shared_pools.append(self.crop_pool)
+            else:
+                self.crop_pool = CropPool(frame.shape, size=self.crop_pool_size)
+
+        # Copy the crop into a pooled slot so the main thread can reuse the frame safely
+        slot_id, vehicle_crop = self.crop_pool.store(frame[y1:y2, x1:x2])
+        if slot_id is None:
+            # Every slot is still waiting for OCR: skip this crop instead of allocating
+            return
+
+        # Put in queue (the scheduler releases the slot if the task is dropped or replaced)
+        area_ratio = (x2 - x1) * (y2 - y1) / (w * h)
+        self.scheduler.submit(OCRTask(obj_id, vehicle_crop, self.crop_pool, slot_id, area_ratio, state_code,
+                                      cache_key=cache_key, recheck=recheck))
+
+    def _handle_result(self, task, plate_text):
+        """
+        Result of a crop read by the OCR (worker thread or collector). A track lost while its crop
+        was being read has been retired: the result is dropped, so neither the cache nor the plate
+        registry grows again for it, and nothing is written or notified for a dead track.
+        """
+        with self._plates_lock:
+            if self.plates.find(task.obj_id) is None:
+                self.dropped_lost += 1
+                return
+            # Stores the result so the near-duplicates of this crop can be skipped
+            if self.cache is not None and task.cache_key is not None:
+                self.cache.store(task.obj_id, *task.cache_key, plate_text)
+        if plate_text:
+            self._update_history_and_db(task.obj_id, plate_text)
 
     def _worker(self):
         """
         Background thread that processes images from the queue.
         """
         while True:
+            # Get the highest-priority task
+            task = self.scheduler.get()
+            if task is None:
+                # Scheduler closed
+                return
+
+            start = time.perf_counter()
             try:
-                # Get task from queue
-                vehicle_crop, obj_id = self.processing_queue.get()
-                
-                # Perform OCR (Heavy operation)
-                plate_text = self._recognize_from_crop(vehicle_crop)
-                
-                if plate_text:
-                    self._update_history_and_db(obj_id, plate_text)
-                
-                self.processing_queue.task_done()
+                try:
+                    # Perform OCR (Heavy operation)
+                    plate_text = self._recognize_from_crop(task.crop)
+                finally:
+                    # The slot can be reused as soon as OCR is done with it
+                    task.release()
+
+                self._handle_result(task, plate_text)
             except Exception as e:
                 print(f"Error in OCR worker: {e}")
+            finally:
+                self.scheduler.task_done(task, time.perf_counter() - start)
+
+    def _dispatcher(self):
+        """
+        Process-pool mode: takes the highest-priority tasks from the scheduler and sends them
+        in batches, at most one batch per worker process in flight.
+        """
+        carried = None # Task from a different crop pool, starts the next batch
+        while True:
+            self._free_workers.acquire()
+            task = carried if carried is not None else self.scheduler.get()
+            carried = None
+            if task is None:
+                # Scheduler closed
+                return
+
+            # Fill the batch with whatever else is already waiting, without blocking
+            batch = [task]
+            while len(batch) < self.batch_size:
+                extra = self.scheduler.get(timeout=0)
+                if extra is None:
+                    break
+                if extra.pool is not task.pool:
+                    carried = extra
+                    break
+                batch.append(extra)
+
+            batch_id = self._next_batch_id
+            self._next_batch_id += 1
+            self._batches[batch_id] = batch
+            self.ocr_pool.submit(batch_id, task.pool, batch)
+
+    def _collector(self):
+        """
+        Process-pool mode: receives the texts read by the workers and feeds them to the
+        same voting used by the thread worker.
+        """
+        failed_workers = 0
+        while True:
+            kind, batch_id, payload, ocr_seconds = self.ocr_pool.poll()
+            if kind == "stop":
+                return
+            if kind == "ready":
+                continue
+            if kind == "error":
+                print(payload)
+                failed_workers += 1
+                if failed_workers == self.num_workers:
+                    # No worker could load EasyOCR: drop the queued work instead of waiting forever
+                    self.ocr_available = False
+                    self.scheduler.close()
+                continue
+
+            tasks = self._batches.pop(batch_id)
+            self._free_workers.release()
+            if kind == "failed":
+                print(payload)
+                payload = [None] * len(tasks)
+
+            for task, plate_text in zip(tasks, payload):
+                try:
+                    task.release()
+                    self._handle_result(task, plate_text)
+                except Exception as e:
+                    print(f"Error in OCR collector: {e}")
+                finally:
+                    self.scheduler.task_done(task, ocr_seconds / len(tasks))
+
+    def close(self):
+        """Stops the OCR backend; crops still pending are dropped (call wait_until_idle first)."""
+        self.scheduler.close()
+        if self.ocr_pool is not None:
+            self._free_workers.release() # Wakes the dispatcher if it waits for a worker
+            self.ocr_pool.close()
+            self.ocr_pool.result_queue.put(("stop", None, None, 0.0))
+            self.collector_thread.join(timeout=5.0)
+            for pool in self._shared_pools:
+                pool.close()
+            self._shared_pools = []
+        if self.storage is not None:
+            # Write-behind buffer: the confirmed plates still buffered are sent now.
+            # The storage is shared by the process: whoever opened it closes it
+            self.storage.flush(timeout=10.0)
+
+    def confirmed_plate(self, obj_id):
+        """Confirmed plate of obj_id (also of a retired track), or None."""
+        with self._plates_lock:
+            return self.plates.confirmed_plate(obj_id)
 
     def _update_history_and_db(self, obj_id, plate_text):
         """
-        Updates history and saves to DB if we are confident.
+        Adds a reading to the track's voting. The DB is written only when a plate is confirmed,
+        or when a different plate overtakes the confirmed one: never again for the same plate.
         """
-        if obj_id not in self.plate_history:
-            self.plate_history[obj_id] = []
-        
-        self.plate_history[obj_id].append(plate_text)
-        
-        # Keep only last 10 readings
-        if len(self.plate_history[obj_id]) > 10:
-            self.plate_history[obj_id].pop(0)
-            
-        # Voting system
-        counts = Counter(self.plate_history[obj_id])
-        most_common, count = counts.most_common(1)[0]
-        
-        # If we have seen this plate at least 2 times (CONFIDENCE >= 2)
-        # Reduced from 3 to 2 to make it easier to confirm plates
-        if count >= 3:
-            print(f"CONFIRMED PLATE for ID {obj_id}: {most_common} (Confidence: {count}/{len(self.plate_history[obj_id])})")
-            try:
-                self.db_manager.update_object_plate(obj_id, most_common)
-            except Exception as e:
-                print(f"DB ERROR: Could not save plate for ID {obj_id}: {e}")
+        with self._plates_lock:
+            # Voting system (last 10 readings, 3 votes to confirm). Only live tracks vote:
+            # get() (which creates the track) is used only by add_to_queue
+            track = self.plates.find(obj_id)
+            if track is None:
+                return
+            confirmed = track.add_reading(plate_text)
+            readings = len(track.history)
+        if confirmed is None:
+            return
+
+        plate, count = confirmed
+        print(f"CONFIRMED PLATE for ID {obj_id}: {plate} (Confidence: {count}/{readings})")
+        self.notify("PLATE_CONFIRMED", obj_id, plate)
+        # Crops queued before the confirmation are no longer needed
+        self.scheduler.discard(obj_id)
+        if self.storage is None:
+            return
+        try:
+            self.storage.update_object_plate(obj_id, plate, source=self.source)
+        except Exception as e:
+            print(f"DB ERROR: Could not save plate for ID {obj_id}: {e}")
 
     def _recognize_from_crop(self, vehicle_crop):
         """
         Internal method to run OCR on a pre-cropped image.
         """
-        # Preprocessing
-        gray = cv2.cvtColor(vehicle_crop, cv2.COLOR_BGR2GRAY)
-
         try:
-            results = self.reader.readtext(gray, detail=1, allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
-            
-            if not results:
-                return None
-
-            results.sort(key=lambda x: x[2], reverse=True)
-
-            for (bbox_ocr, text, prob) in results:
-                text_clean = ''.join(c for c in text if c.isalnum()).upper()
-                
-                if self.is_valid_plate(text_clean) and prob > 0.25:
-                    print(f"DEBUG: OCR saw '{text_clean}' (prob={prob:.2f})")
-                    return text_clean
+            # Plate localization (if configured), grayscale and recognition
+            results = read_crops(self.reader, [vehicle_crop], self.localizer)[0]
+            return best_plate_text(results)
         except Exception as e:
             print(f"OCR Error: {e}")
             
@@ -133,6 +372,4 @@ class PlateRecognizer:
         return None
 
     def is_valid_plate(self, text):
-        if len(text) < 5 or len(text) > 8:
-            return False
-        return True
+        return is_valid_plate(text)
@@ -1,60 +1,257 @@
 import cv2
 import numpy as np
 
+# Istogramma H-S: 30 bin di Hue x 32 bin di Saturation
+HIST_BINS = (30, 32)
+HIST_SIZE = HIST_BINS[0] * HIST_BINS[1]
+
+
+def normalize_minmax(hist):
+    """Come cv2.normalize(hist, hist, 0, 1, NORM_MINMAX): istogramma piatto -> tutti zeri."""
+    lo, hi = float(hist.min()), float(hist.max())
+    scale = 1.0 / (hi - lo) if hi - lo > np.finfo(np.float64).eps else 0.0
+    return (hist * scale - lo * scale).astype(np.float32)
+
+
+class FrameHistogramMap:
+    """
+    Stadio di feature condiviso per frame: il frame viene convertito in HSV UNA volta sola
+    (eventualmente ridotto di scala) e quantizzato nei 30x32 bin H-S. L'istogramma di ogni box
+    si ottiene poi contando i bin della sua regione, senza riconvertire i pixel dei box sovrapposti.
+    """
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.bins = None      # Indice di bin (0..959) per ogni pixel
+        self._small = None    # Buffer del frame ridotto
+        self._hsv = None
+        self._hue_bins = None
+
+    def build(self, frame):
+        """Calcola la mappa dei bin per il frame corrente."""
+        src = frame
+        if self.scale != 1.0:
+            h, w = frame.shape[:2]
+            size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+            if self._small is None or self._small.shape[:2] != (size[1], size[0]):
+                self._small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            src = cv2.resize(frame, size, dst=self._small, interpolation=cv2.INTER_AREA)
+
+        if self._hsv is None or self._hsv.shape != src.shape:
+            self._hsv = np.empty(src.shape, dtype=np.uint8)
+            self.bins = np.empty(src.shape[:2], dtype=np.uint16)
+            self._hue_bins = np.empty(src.shape[:2], dtype=np.uint16)
+        cv2.cvtColor(src, cv2.COLOR_BGR2HSV, dst=self._hsv)
+
+        # Stessa quantizzazione di calcHist: Hue [0,180) in 30 bin, Saturation [0,256) in 32 bin
+        np.floor_divide(self._hsv[..., 0], 180 // HIST_BINS[0], out=self._hue_bins, casting='unsafe')
+        np.right_shift(self._hsv[..., 1], 3, out=self.bins, casting='unsafe')
+        self._hue_bins *= HIST_BINS[1]
+        self.bins += self._hue_bins
+
+    def hist(self, bbox):
+        """Istogramma H-S normalizzato (30x32, float32) del box (x1, y1, x2, y2) in coordinate del frame."""
+        x1, y1, x2, y2 = bbox
+        if self.scale != 1.0:
+            x1, y1 = int(x1 * self.scale), int(y1 * self.scale)
+            x2, y2 = int(np.ceil(x2 * self.scale)), int(np.ceil(y2 * self.scale))
+        map_h, map_w = self.bins.shape
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(map_w, max(x2, x1 + 1)), min(map_h, max(y2, y1 + 1))
+
+        counts = np.bincount(self.bins[y1:y2, x1:x2].ravel(), minlength=HIST_SIZE)
+        return normalize_minmax(counts.astype(np.float32)).reshape(HIST_BINS)
+
+
 class VisualMemory:
     """
     Implementa la logica TOOCM:
     1. Aggiornamento Dinamico: Memorizza sempre l'ultima texture vista.
     2. Recupero Storico: Cerca corrispondenze basate su posizione e colore precedente.
+
+    La memoria è salvata in array NumPy contigui (uno slot per oggetto, riutilizzato quando
+    l'oggetto viene dimenticato) e una griglia spaziale limita il confronto ai soli
+    oggetti entro max_distance, confrontati tutti insieme in un'unica operazione.
     """
-    def __init__(self):
-        # Struttura: { id: {'hist': istogramma, 'center': (x,y), 'frames_lost': 0} }
-        self.history = {}
-        
+    def __init__(self, initial_capacity=64):
         # PARAMETRI DI RECUPERO (Vanishing Feature Recovery)
         # Se l'oggetto si sposta di max 150px mentre è "perso", lo consideriamo lo stesso.
-        self.max_distance = 150 
+        self.max_distance = 150
         # Soglia somiglianza colore (0.0 diverso, 1.0 identico).
-        self.color_threshold = 0.50 
+        self.color_threshold = 0.50
         # Quanti frame ricordiamo un oggetto "svanito" (Memory persistence)
-        self.max_frames_to_remember = 60 
+        self.max_frames_to_remember = 60
+
+        # Struttura: slot i -> istogramma (riga di hists), centro (x,y), frame persi
+        self.capacity = 0
+        self.hists = np.zeros((0, HIST_SIZE), dtype=np.float32)
+        self.centers = np.zeros((0, 2), dtype=np.float64)
+        self.frames_lost = np.zeros(0, dtype=np.int32)
+        self.in_use = np.zeros(0, dtype=bool)
+        # Ordine di inserimento: a parità di punteggio vince il ricordo più vecchio
+        self.insert_order = np.zeros(0, dtype=np.int64)
+        self.slot_ids = []
+
+        self.id_to_slot = {}
+        self.free_slots = []
+        self._next_order = 0
+
+        # Indice spaziale: cella (cx, cy) -> insieme di slot. Celle grandi max_distance:
+        # un oggetto entro max_distance è per forza in una delle 3x3 celle vicine.
+        self.grid = {}
+        self.slot_cell = []
+
+        self._grow(initial_capacity)
+
+    def _grow(self, new_capacity):
+        """Allarga gli array (raddoppio) mantenendo gli slot esistenti."""
+        extra = new_capacity - self.capacity
+        self.hists = np.vstack([self.hists, np.zeros((extra, HIST_SIZE), dtype=np.float32)])
+        self.centers = np.vstack([self.centers, np.zeros((extra, 2), dtype=np.float64)])
+        self.frames_lost = np.concatenate([self.frames_lost, np.zeros(extra, dtype=np.int32)])
+        self.in_use = np.concatenate([self.in_use, np.zeros(extra, dtype=bool)])
+        self.insert_order = np.concatenate([self.insert_order, np.zeros(extra, dtype=np.int64)])
+        self.slot_ids.extend([None] * extra)
+        self.slot_cell.extend([None] * extra)
+        # Gli slot liberi si prendono dalla fine della lista: i più bassi per primi
+        self.free_slots.extend(range(new_capacity - 1, self.capacity - 1, -1))
+        self.capacity = new_capacity
+
+    def _cell(self, center):
+        return (int(center[0] // self.max_distance), int(center[1] // self.max_distance))
+
+    def _move_to_cell(self, slot, center):
+        cell = self._cell(center)
+        old_cell = self.slot_cell[slot]
+        if old_cell == cell:
+            return
+        if old_cell is not None:
+            self.grid[old_cell].discard(slot)
+            if not self.grid[old_cell]:
+                del self.grid[old_cell]
+        self.grid.setdefault(cell, set()).add(slot)
+        self.slot_cell[slot] = cell
+
+    def _remove_slot(self, slot):
+        cell = self.slot_cell[slot]
+        if cell is not None:
+            self.grid[cell].discard(slot)
+            if not self.grid[cell]:
+                del self.grid[cell]
+        del self.id_to_slot[self.slot_ids[slot]]
+        self.slot_ids[slot] = None
+        self.slot_cell[slot] = None
+        self.in_use[slot] = False
+        self.free_slots.append(slot)
+
+    def compute_hist(self, crop):
+        """
+        Istogramma del crop, da passare a find_match/update_memory (parametro hist)
+        per non calcolarlo due volte sullo stesso crop.
+        """
+        return self._get_color_hist(crop)
 
     def _get_color_hist(self, crop):
         """Estrae la 'texture' sotto forma di istogramma colore."""
         hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
         # Usiamo Hue e Saturation per essere robusti alla luce
-        hist = cv2.calcHist([hsv], [0, 1], None, [30, 32], [0, 180, 0, 256])
+        hist = cv2.calcHist([hsv], [0, 1], None, list(HIST_BINS), [0, 180, 0, 256])
         cv2.normalize(hist, hist, alpha=0, beta=1, norm_type=cv2.NORM_MINMAX)
         return hist
 
-    def update_memory(self, obj_id, crop, center):
+    def update_memory(self, obj_id, crop, center, hist=None):
         """
         PRINCIPIO 'DYNAMIC UPDATE'[cite: 14]:
         Aggiorniamo costantemente la rappresentazione dell'oggetto.
         Se l'auto gira o cambia luce, la memoria si adatta al nuovo aspetto.
         """
         if crop.size == 0: return
-        
-        hist = self._get_color_hist(crop)
-        self.history[obj_id] = {
-            'hist': hist,            # La "texture" corrente
-            'center': center,        # La posizione corrente
-            'frames_lost': 0         # È visibile, quindi 0 persi
-        }
+
+        if hist is None:
+            hist = self._get_color_hist(crop)
+
+        slot = self.id_to_slot.get(obj_id)
+        if slot is None:
+            if not self.free_slots:
+                self._grow(self.capacity * 2)
+            slot = self.free_slots.pop()
+            self.id_to_slot[obj_id] = slot
+            self.slot_ids[slot] = obj_id
+            self.in_use[slot] = True
+            self.insert_order[slot] = self._next_order
+            self._next_order += 1
+
+        self.hists[slot] = hist.ravel()      # La "texture" corrente
+        self.centers[slot] = center          # La posizione corrente
+        self.frames_lost[slot] = 0           # È visibile, quindi 0 persi
+        self._move_to_cell(slot, center)
+
+    def touch(self, obj_id, center):
+        """
+        Segna l'oggetto come visibile (frames_lost = 0) e ne aggiorna la posizione
+        senza ricalcolare l'istogramma. Ritorna False se l'oggetto non è in memoria.
+        """
+        slot = self.id_to_slot.get(obj_id)
+        if slot is None:
+            return False
+        self.centers[slot] = center
+        self.frames_lost[slot] = 0
+        self._move_to_cell(slot, center)
+        return True
+
+    def get_hist(self, obj_id):
+        """Ultimo istogramma colore memorizzato per obj_id (None se non è in memoria)."""
+        slot = self.id_to_slot.get(obj_id)
+        if slot is None:
+            return None
+        return self.hists[slot].reshape(HIST_BINS)
+
+    def __len__(self):
+        return len(self.id_to_slot)
+
+    def __contains__(self, obj_id):
+        return obj_id in self.id_to_slot
 
     def increment_lost_counters(self):
         """Invecchia i ricordi (simula il passare del tempo t)."""
-        to_delete = []
-        for obj_id in self.history:
-            self.history[obj_id]['frames_lost'] += 1
-            # Se passa troppo tempo, dimentichiamo l'oggetto
-            if self.history[obj_id]['frames_lost'] > self.max_frames_to_remember:
-                to_delete.append(obj_id)
-        
-        for obj_id in to_delete:
-            del self.history[obj_id]
-
-    def find_match(self, new_crop, new_center):
+        self.frames_lost[self.in_use] += 1
+        # Se passa troppo tempo, dimentichiamo l'oggetto
+        expired = np.flatnonzero(self.in_use & (self.frames_lost > self.max_frames_to_remember))
+        for slot in expired:
+            self._remove_slot(int(slot))
+
+    def _candidate_slots(self, center):
+        """Slot nelle 3x3 celle attorno a center (prefiltro spaziale)."""
+        cx, cy = self._cell(center)
+        slots = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cell_slots = self.grid.get((cx + dx, cy + dy))
+                if cell_slots:
+                    slots.extend(cell_slots)
+        return np.array(slots, dtype=np.intp)
+
+    @staticmethod
+    def _batch_correlation(hists, hist):
+        """
+        Equivalente vettoriale di cv2.compareHist(h, hist, HISTCMP_CORREL) per ogni riga di hists.
+        Stesse formule di OpenCV (in double), compreso il valore 1 quando la varianza è nulla.
+        """
+        a = hists.astype(np.float64)
+        b = hist.astype(np.float64).ravel()
+        scale = 1.0 / b.size
+        s1 = a.sum(axis=1)
+        s2 = b.sum()
+        s11 = np.einsum('ij,ij->i', a, a)
+        s22 = b.dot(b)
+        s12 = a.dot(b)
+        num = s12 - s1 * s2 * scale
+        denom2 = (s11 - s1 * s1 * scale) * (s22 - s2 * s2 * scale)
+        valid = np.abs(denom2) > np.finfo(np.float64).eps
+        corr = np.ones_like(num)
+        corr[valid] = num[valid] / np.sqrt(denom2[valid])
+        return corr
+
+    def find_match(self, new_crop, new_center, hist=None):
         """
         PRINCIPIO 'VANISHING FEATURE RECOVERY'[cite: 447]:
         Cerca tra gli oggetti persi (frames_lost > 0) quello più simile
@@ -62,38 +259,39 @@ class VisualMemory:
         """
         if new_crop.size == 0: return None
 
-        new_hist = self._get_color_hist(new_crop)
-        best_id = None
-        best_score = 0 
-
-        for old_id, data in self.history.items():
-            # Consideriamo solo oggetti che YOLO ha perso (frames_lost >= 1)
-            # Se frames_lost è 0, YOLO lo sta già tracciando, non serve intervenire.
-            if data['frames_lost'] < 1:
-                continue
-
-            # 1. Confronto Posizione (Spostamento nel tempo)
-            old_center = data['center']
-            dist = np.linalg.norm(np.array(old_center) - np.array(new_center))
-            
-            if dist > self.max_distance:
-                continue 
-
-            # 2. Confronto Texture (Istogramma)
-            color_sim = cv2.compareHist(data['hist'], new_hist, cv2.HISTCMP_CORREL)
-            
-            if color_sim < self.color_threshold:
-                continue 
-
-            # Punteggio combinato
-            score = color_sim + (1 - (dist / self.max_distance))
-
-            if score > best_score:
-                best_score = score
-                best_id = old_id
-
-        if best_id is not None:
-            print(f"✅ RECOVERY: ID {best_id} recuperato dalla memoria (Score: {best_score:.2f})")
-            return best_id
-
-        return None
\ No newline at end of file
+        slots = self._candidate_slots(new_center)
+        if slots.size == 0:
+            return None
+
+        # Consideriamo solo oggetti che YOLO ha perso (frames_lost >= 1)
+        # Se frames_lost è 0, YOLO lo sta già tracciando, non serve intervenire.
+        slots = slots[self.frames_lost[slots] >= 1]
+        if slots.size == 0:
+            return None
+
+        # 1. Confronto Posizione (Spostamento nel tempo)
+        offsets = self.centers[slots] - np.asarray(new_center, dtype=np.float64)
+        dist = np.sqrt((offsets * offsets).sum(axis=1))
+        near = dist <= self.max_distance
+        slots, dist = slots[near], dist[near]
+        if slots.size == 0:
+            return None
+
+        # 2. Confronto Texture (Istogramma), tutti i candidati insieme
+        new_hist = hist if hist is not None else self._get_color_hist(new_crop)
+        color_sim = self._batch_correlation(self.hists[slots], new_hist)
+
+        # Punteggio combinato
+        score = color_sim + (1 - (dist / self.max_distance))
+        valid = (color_sim >= self.color_threshold) & (score > 0)
+        if not valid.any():
+            return None
+
+        slots, score = slots[valid], score[valid]
+        # Miglior punteggio; a parità vince l'oggetto inserito per primo (come l'iterazione sul dizionario)
+        best = np.lexsort((self.insert_order[slots], -score))[0]
+        best_id = self.slot_ids[slots[best]]
+        best_score = score[best]
+
+        print(f"✅ RECOVERY: ID {best_id} recuperato dalla memoria (Score: {best_score:.2f})")
+        return best_id
@@ -0,0 +1,75 @@
+from src.processing.plate_lifecycle import PlateTrack, PlateRegistry, CONFIRM_VOTES, PLATE_CONFIRMED, PLATE_RETIRED
+
+
+def read_all(track, readings):
+    """Aggiunge le letture in ordine e restituisce le conferme (plate, votes) prodotte."""
+    confirmations = []
+    for plate in readings:
+        confirmed = track.add_reading(plate)
+        if confirmed is not None:
+            confirmations.append(confirmed)
+    return confirmations
+
+
+def test_single_confirmation():
+    """Letture ripetute della stessa targa: una sola conferma (una sola scrittura nel DB)."""
+    track = PlateTrack()
+    assert read_all(track, ["AB123CD"] * 8) == [("AB123CD", CONFIRM_VOTES)]
+    assert track.state == PLATE_CONFIRMED
+
+
+def test_tie_keeps_confirmed_plate():
+    """A parità di voti la targa confermata resta: B,A,A,A,B,B conferma A e basta."""
+    track = PlateTrack()
+    assert read_all(track, ["B", "A", "A", "A", "B", "B"]) == [("A", 3)]
+    assert track.plate == "A"
+
+    # Letture alternate: nessun cambio avanti e indietro
+    track = PlateTrack()
+    assert read_all(track, ["A", "B"] * 5) == [("A", 3)]
+
+
+def test_overtake_needs_strictly_more_votes():
+    track = PlateTrack()
+    assert read_all(track, ["A", "A", "A", "B", "B", "B"]) == [("A", 3)]
+    assert read_all(track, ["B"]) == [("B", 4)]
+    assert track.plate == "B"
+
+
+def test_recheck_cadence():
+    """Confermata la targa, si rilegge un crop ogni recheck_every (mai con 0)."""
+    track = PlateTrack()
+    assert track.wants_reading(10)
+    read_all(track, ["A"] * CONFIRM_VOTES)
+    wanted = [track.wants_reading(4) for _ in range(12)]
+    assert wanted == [False, False, False, True] * 3
+    assert not any(track.wants_reading(0) for _ in range(20))
+
+
+def test_retired_plate_is_not_confirmed_again():
+    """Una traccia ritrovata dopo la perdita riparte dalla targa confermata, senza riconfermarla."""
+    registry = PlateRegistry(max_retired=2)
+    read_all(registry.get(1), ["A"] * CONFIRM_VOTES)
+    registry.retire(1)
+    assert registry.state(1) == PLATE_RETIRED
+    assert read_all(registry.get(1), ["A"] * CONFIRM_VOTES) == []
+    assert registry.confirmed_plate(1) == "A"
+
+
+def test_find_does_not_create():
+    """find() (usato dai risultati OCR) non ricrea una traccia ritirata o mai vista."""
+    registry = PlateRegistry()
+    registry.get(99)
+    registry.retire(99)
+    assert registry.find(99) is None and registry.find(5) is None
+    assert list(registry.tracks) == []
+
+
+if __name__ == "__main__":
+    test_single_confirmation()
+    test_tie_keeps_confirmed_plate()
+    test_overtake_needs_strictly_more_votes()
+    test_recheck_cadence()
+    test_retired_plate_is_not_confirmed_again()
+    test_find_does_not_create()
+    print("SUCCESS: il ciclo di vita delle targhe conferma una sola volta e cambia targa solo se superata.")
@@ -0,0 +1,76 @@
+import io
+import contextlib
+import threading
+import numpy as np
+from src.processing import plate_recognizer
+from src.processing.plate_recognizer import PlateRecognizer
+
+PLATE = "AB123CD"
+
+
+class StubRecognizer(PlateRecognizer):
+    """PlateRecognizer con un OCR finto: conta le letture e restituisce sempre PLATE."""
+    def __init__(self, gate=None, **options):
+        # Nessun modello EasyOCR da caricare: il lettore non viene mai usato
+        original_reader, plate_recognizer.easyocr.Reader = plate_recognizer.easyocr.Reader, lambda *a, **k: None
+        try:
+            super().__init__(save_plates=False, **options)
+        finally:
+            plate_recognizer.easyocr.Reader = original_reader
+        self.reads = 0
+        self.gate = gate          # Se presente, ogni lettura aspetta che venga aperto
+        self.reading = threading.Event()
+
+    def _recognize_from_crop(self, vehicle_crop):
+        self.reads += 1
+        self.reading.set()
+        if self.gate is not None:
+            self.gate.wait(timeout=5.0)
+        return PLATE
+
+
+def parked_car_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8)
+
+
+def test_stationary_vehicle_is_confirmed():
+    """Un'auto ferma dà crop quasi identici: la cache evita l'OCR ma la targa viene comunque confermata."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        recognizer = StubRecognizer()
+        frame = parked_car_frame()
+        try:
+            for _ in range(40):
+                recognizer.add_to_queue(frame, 7, (100, 100, 400, 300))
+                assert recognizer.wait_until_idle(timeout=5.0)
+        finally:
+            recognizer.close()
+    assert recognizer.confirmed_plate(7) == PLATE
+    # Le letture ripetute sono servite dalla cache
+    assert recognizer.reads < 40
+    assert recognizer.cache.hits > 0
+
+
+def test_late_result_does_not_revive_lost_track():
+    """Un risultato OCR arrivato dopo LOST_TRACK viene scartato: la traccia resta ritirata."""
+    gate = threading.Event()
+    with contextlib.redirect_stdout(io.StringIO()):
+        recognizer = StubRecognizer(gate=gate)
+        try:
+            recognizer.add_to_queue(parked_car_frame(), 99, (100, 100, 400, 300))
+            assert recognizer.reading.wait(timeout=5.0)
+            # La traccia si perde mentre il suo crop è ancora in lettura
+            recognizer.update("LOST_TRACK", 99)
+            gate.set()
+            assert recognizer.wait_until_idle(timeout=5.0)
+        finally:
+            recognizer.close()
+    assert list(recognizer.plates.tracks) == []
+    assert recognizer.cache.stats()["tracks"] == 0
+    assert recognizer.dropped_lost == 1
+
+
+if __name__ == "__main__":
+    test_stationary_vehicle_is_confirmed()
+    test_late_result_does_not_revive_lost_track()
+    print("SUCCESS: cache OCR e tracce perse non alterano la conferma delle targhe.")